@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
 
 
 class SocialConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'social'
+
+    def ready(self):
+        from .metrics import install_query_timer
+        from .search import install_sqlite_triggers
+
+        post_migrate.connect(install_sqlite_triggers, sender=self)
+        connection_created.connect(install_query_timer)
@@ -0,0 +1,185 @@
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Max
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, StreamingHttpResponse
+from django.views import View
+from rest_framework.exceptions import APIException, NotAuthenticated, NotFound, ParseError
+
+from . import caching, counters, events, routing, timeline
+from .authentication import aauthenticate, aauthenticate_stream_token
+from .conditional import make_etag, not_modified, set_validators
+from .models import Comment, Post
+from .serializers import (
+    PROFILE_COLUMNS, aserialize_posts, comment_rows, modification_stamps, post_rows, post_rows_by_id, profile_rows,
+    serialize_comment, serialize_comments, serialize_profile,
+)
+from .streaming import aiter_chunks, astreaming_response, chunked, json_response, wants_stream
+from .views import post_paginator
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+# Versões assíncronas (ORM assíncrono) das leituras mais quentes, roteadas no lugar das
+# views DRF quando ASYNC_READ_VIEWS está ligado (padrão ao servir por zuppi/asgi.py).
+# Respostas, validadores e modo ?stream=1 iguais aos das views síncronas.
+
+
+class AsyncAPIView(View):
+    """Autenticação por token (cache de social.authentication) e erros no formato do DRF.
+    read_replica: GETs leem da réplica, como ReplicaReadMixin nas views DRF."""
+
+    login_required = True
+    read_replica = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        # Os helpers de paginação/streaming leem request.query_params, como num Request do DRF
+        request.query_params = request.GET
+        try:
+            request.user = await self.authenticate(request)
+            if self.login_required and not request.user.is_authenticated:
+                raise NotAuthenticated()
+            if self.read_replica and routing.enabled():
+                # Marca de escrita recente no cache e verificação das réplicas: síncronas
+                await sync_to_async(routing.route_reads)(request)
+            return await super().dispatch(request, *args, **kwargs)
+        except Http404:
+            return self.error(NotFound())
+        except APIException as exc:
+            return self.error(exc)
+
+    async def authenticate(self, request):
+        return await aauthenticate(request)
+
+    def error(self, exc):
+        response = json_response({'detail': exc.detail}, status=exc.status_code)
+        if exc.status_code == 401:
+            response['WWW-Authenticate'] = 'Token'
+        return response
+
+
+async def posts_in_order(post_ids):
+    if caching.enabled():
+        # O cache (L1/L2 e carga das faltas) é síncrono: uma ida à thread do ORM
+        return await sync_to_async(post_rows_by_id)(post_ids)
+    posts_by_id = {row['id']: row async for row in post_rows(Post.objects.filter(id__in=post_ids))}
+    return [posts_by_id[post_id] for post_id in post_ids if post_id in posts_by_id]
+
+
+class PostList(AsyncAPIView):
+    login_required = False
+
+    async def get(self, request):
+        queryset = post_rows(Post.objects.all())
+        if wants_stream(request):
+            chunks, cursors = post_paginator.astream(queryset, request, settings.STREAMING_CHUNK_SIZE)
+            return astreaming_response('posts', (await aserialize_posts(rows, viewer=request.user) async for rows in chunks), cursors)
+        if caching.enabled():
+            window, next_cursor, prev_cursor = await post_paginator.apaginate(
+                Post.objects.values(*post_paginator.fields), request
+            )
+            posts = await posts_in_order([row['id'] for row in window])
+        else:
+            posts, next_cursor, prev_cursor = await post_paginator.apaginate(queryset, request)
+        data = await aserialize_posts(posts, viewer=request.user)
+        return json_response({'posts': data, 'next': next_cursor, 'prev': prev_cursor})
+
+
+class FeedList(AsyncAPIView):
+    async def get(self, request):
+        post_ids, next_cursor, prev_cursor = await timeline.aread_post_ids(request.user, request)
+        posts = await posts_in_order(post_ids) if caching.enabled() else None
+        if posts is not None:
+            stamps = modification_stamps(posts)
+        else:
+            stamps = tuple((await Post.objects.filter(id__in=post_ids).aaggregate(
+                last=Max('updated_at'), authors=Max('author__updated_at'),
+            )).values())
+        modified = max(filter(None, stamps), default=None)
+        pending = await sync_to_async(counters.pending_deltas)(post_ids) if settings.COUNTER_WRITE_BEHIND else {}
+        etag = make_etag(request.user.id, post_ids, next_cursor, prev_cursor, stamps, sorted(pending.items()))
+        cached = not_modified(request, etag, modified)
+        if cached is not None:
+            return cached
+        if posts is None:
+            posts = await posts_in_order(post_ids)
+        if wants_stream(request):
+            async def chunks():
+                for rows in chunked(posts):
+                    yield await aserialize_posts(rows, viewer=request.user)
+            response = astreaming_response('posts', chunks(), lambda: {'next': next_cursor, 'prev': prev_cursor})
+            return set_validators(response, etag, modified)
+        data = await aserialize_posts(posts, viewer=request.user)
+        response = json_response({'posts': data, 'next': next_cursor, 'prev': prev_cursor})
+        return set_validators(response, etag, modified)
+
+
+class PostCommentsList(AsyncAPIView):
+    async def get(self, request, post_id):
+        if not await Post.objects.filter(id=post_id).aexists():
+            raise Http404
+        stamps = await Comment.objects.filter(post_id=post_id).aaggregate(
+            total=Count('id'), last_id=Max('id'), last=Max('created_at'), authors=Max('author__updated_at'),
+        )
+        etag = make_etag(post_id, stamps['total'], stamps['last_id'], stamps['last'], stamps['authors'])
+        modified = max(filter(None, (stamps['last'], stamps['authors'])), default=None)
+        cached = not_modified(request, etag, modified)
+        if cached is not None:
+            return cached
+        comments = comment_rows(Comment.objects.filter(post_id=post_id).order_by('-created_at'))
+        if wants_stream(request):
+            chunks = (serialize_comments(rows) async for rows in aiter_chunks(comments))
+            return set_validators(astreaming_response('comments', chunks), etag, modified)
+        data = [serialize_comment(row) async for row in comments]
+        return set_validators(json_response({'comments': data}), etag, modified)
+
+
+class Profile(AsyncAPIView):
+    async def get(self, request):
+        if caching.enabled():
+            user = (await sync_to_async(profile_rows)([request.user.id]))[request.user.id]
+        else:
+            user = await User.objects.filter(id=request.user.id).values(*PROFILE_COLUMNS).aget()
+        etag = make_etag(request.user.id, user['updated_at'])
+        cached = not_modified(request, etag, user['updated_at'])
+        if cached is not None:
+            return cached
+        profile_data = serialize_profile(user)
+        return set_validators(json_response(profile_data), etag, user['updated_at'])
+
+
+class EventStream(AsyncAPIView):
+    """Server-Sent Events: posts novos dos autores seguidos e contadores dos posts
+    indicados em ?posts=1,2,3 (até EVENTS_MAX_POSTS).
+
+    No navegador, o EventSource não envia headers: autentica por ?token= emitido em
+    /api/events/token/. O token é verificado só na conexão; numa reconexão com ele já
+    vencido a resposta é 401, o EventSource fecha e o cliente pede outro."""
+
+    # Os follows são lidos uma vez por conexão: do primário, para incluir os recém-feitos
+    read_replica = False
+
+    async def authenticate(self, request):
+        token = request.GET.get('token')
+        if token:
+            return await aauthenticate_stream_token(token)
+        return await aauthenticate(request)
+
+    async def get(self, request):
+        try:
+            post_ids = [int(pk) for pk in request.GET.get('posts', '').split(',') if pk.strip()]
+        except ValueError:
+            raise ParseError('Parâmetro posts inválido')
+        following = [pk async for pk in request.user.following.values_list('id', flat=True)]
+        channels = [events.author_channel(pk) for pk in following]
+        channels += [events.post_channel(pk) for pk in post_ids[:settings.EVENTS_MAX_POSTS]]
+        # Sob WSGI a resposta assíncrona seria lida inteira antes do envio: vira long-polling
+        once = not isinstance(request, ASGIRequest)
+        response = StreamingHttpResponse(events.stream(channels, once=once), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
@@ -0,0 +1,102 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core import signing
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+INVALID = 'invalid'
+STREAM_TOKEN_SALT = 'social.events'
+
+
+def token_cache_key(key):
+    # Hash para não expor o token em nomes de chave do cache
+    return f'auth:token:{hashlib.sha256(key.encode()).hexdigest()}'
+
+
+def get_cache():
+    return caches[settings.AUTH_TOKEN_CACHE]
+
+
+def invalidate_token(key):
+    get_cache().delete(token_cache_key(key))
+
+
+def invalidate_user_tokens(user):
+    keys = Token.objects.filter(user=user).values_list('key', flat=True)
+    get_cache().delete_many([token_cache_key(key) for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication com cache de token -> (user, token) por AUTH_TOKEN_CACHE_TTL
+    segundos e cache negativo de tokens inválidos. Evita o JOIN Token/usuário por request."""
+
+    def authenticate_credentials(self, key):
+        cache = get_cache()
+        cache_key = token_cache_key(key)
+        cached = cache.get(cache_key)
+        if cached == INVALID:
+            raise AuthenticationFailed('Invalid token.')
+        if cached is not None:
+            return cached
+        try:
+            user, token = super().authenticate_credentials(key)
+        except AuthenticationFailed:
+            cache.set(cache_key, INVALID, settings.AUTH_TOKEN_NEGATIVE_TTL)
+            raise
+        cache.set(cache_key, (user, token), settings.AUTH_TOKEN_CACHE_TTL)
+        return user, token
+
+
+async def aauthenticate(request):
+    """CachedTokenAuthentication para as views assíncronas: mesmo cache e mesmas
+    mensagens, com a API assíncrona do cache e do ORM. Sem header: AnonymousUser."""
+    auth = get_authorization_header(request).split()
+    if not auth or auth[0].lower() != b'token':
+        return AnonymousUser()
+    if len(auth) != 2:
+        raise AuthenticationFailed(_('Invalid token header. No credentials provided.'))
+    try:
+        key = auth[1].decode()
+    except UnicodeError:
+        raise AuthenticationFailed(_('Invalid token header. Token string should not contain invalid characters.'))
+    cache = get_cache()
+    cache_key = token_cache_key(key)
+    cached = await cache.aget(cache_key)
+    if cached == INVALID:
+        raise AuthenticationFailed(_('Invalid token.'))
+    if cached is not None:
+        return cached[0]
+    try:
+        token = await Token.objects.select_related('user').aget(key=key)
+    except Token.DoesNotExist:
+        await cache.aset(cache_key, INVALID, settings.AUTH_TOKEN_NEGATIVE_TTL)
+        raise AuthenticationFailed(_('Invalid token.'))
+    if not token.user.is_active:
+        await cache.aset(cache_key, INVALID, settings.AUTH_TOKEN_NEGATIVE_TTL)
+        raise AuthenticationFailed(_('User inactive or deleted.'))
+    await cache.aset(cache_key, (token.user, token), settings.AUTH_TOKEN_CACHE_TTL)
+    return token.user
+
+
+def stream_token(user):
+    """Token assinado de curta duração para /api/events/?token=: o EventSource do navegador
+    não envia o header Authorization. Só o id do usuário, com data; nada do token da API."""
+    return signing.dumps(user.pk, salt=STREAM_TOKEN_SALT)
+
+
+async def aauthenticate_stream_token(key):
+    """Usuário do stream_token, válido por EVENTS_TOKEN_MAX_AGE segundos a partir da emissão."""
+    try:
+        user_id = signing.loads(key, salt=STREAM_TOKEN_SALT, max_age=settings.EVENTS_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        raise AuthenticationFailed(_('Invalid token.'))
+    user = await get_user_model().objects.filter(pk=user_id, is_active=True).afirst()
+    if user is None:
+        raise AuthenticationFailed(_('User inactive or deleted.'))
+    return user
@@ -0,0 +1,175 @@
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, router, transaction
+from django.db.models import Q
+from rest_framework.exceptions import ParseError
+
+from . import counters, timeline
+from .models import Post, PostAction
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+Follow = User.following.through
+
+# op -> (ação, estado final). Operações idempotentes: reenviar um lote não inverte o estado
+POST_OPERATIONS = {
+    'like': ('like', True),
+    'unlike': ('like', False),
+    'repost': ('repost', True),
+    'unrepost': ('repost', False),
+    'share': ('share', True),
+    'unshare': ('share', False),
+}
+FOLLOW_OPERATIONS = {
+    'follow': True,
+    'unfollow': False,
+}
+
+
+def parse(operations):
+    if not isinstance(operations, list) or not operations:
+        raise ParseError('operations deve ser uma lista não vazia')
+    if len(operations) > settings.BATCH_MAX_OPERATIONS:
+        raise ParseError(f'Máximo de {settings.BATCH_MAX_OPERATIONS} operações por lote')
+    parsed = []
+    for index, item in enumerate(operations):
+        op = item.get('op') if isinstance(item, dict) else None
+        if op not in POST_OPERATIONS and op not in FOLLOW_OPERATIONS:
+            raise ParseError(f'Operação {index} inválida')
+        try:
+            target_id = int(item.get('target_id'))
+        except (TypeError, ValueError):
+            raise ParseError(f'target_id inválido na operação {index}')
+        parsed.append((op, target_id))
+    return parsed
+
+
+def _deleted(queryset, expected):
+    # As linhas lidas com select_for_update ficam travadas até o commit: outro request só
+    # as apaga depois. Se ainda assim o DELETE não pegar todas (banco sem FOR UPDATE), os
+    # deltas não valem: IntegrityError repete o lote, relendo o estado
+    deleted, _ = queryset.delete()
+    if deleted != expected:
+        raise IntegrityError(f'{expected - deleted} linhas já removidas por outro request')
+
+
+def throttle_costs(operations):
+    """Tokens por escopo de throttling: cada operação custa o mesmo que o request avulso
+    equivalente (post_toggle ou follow), para o lote não contornar esses limites."""
+    costs = defaultdict(int)
+    for op, _ in operations:
+        costs['post_toggle' if op in POST_OPERATIONS else 'follow'] += 1
+    return dict(costs)
+
+
+def _apply_actions(user, wanted):
+    """wanted: {(post_id, ação): ativo}. Um DELETE e um INSERT em lote; devolve os posts
+    existentes e os deltas de contador por (post, campo). Os deltas valem só para linhas
+    de fato removidas (travadas na leitura) ou criadas (sem conflito na unique_together)."""
+    existing = set(Post.objects.filter(id__in={post_id for post_id, _ in wanted}).values_list('id', flat=True))
+    wanted = {key: active for key, active in wanted.items() if key[0] in existing}
+    current = set(
+        PostAction.objects.select_for_update()
+        .filter(user=user, post_id__in=existing, action_type__in=counters.ACTION_COUNTERS)
+        .values_list('post_id', 'action_type')
+    )
+    to_create = [key for key, active in wanted.items() if active and key not in current]
+    to_delete = [key for key, active in wanted.items() if not active and key in current]
+    if to_delete:
+        condition = Q()
+        for post_id, action_type in to_delete:
+            condition |= Q(post_id=post_id, action_type=action_type)
+        _deleted(PostAction.objects.filter(condition, user=user), len(to_delete))
+    # Sem ignore_conflicts: uma ação criada em paralelo é IntegrityError e o lote é repetido
+    PostAction.objects.bulk_create([
+        PostAction(user=user, post_id=post_id, action_type=action_type) for post_id, action_type in to_create
+    ])
+    deltas = defaultdict(int)
+    for keys, delta in ((to_create, 1), (to_delete, -1)):
+        for post_id, action_type in keys:
+            deltas[(post_id, counters.ACTION_COUNTERS[action_type])] += delta
+    return existing, deltas
+
+
+def _apply_follows(user, wanted):
+    """wanted: {user_id: seguindo}. Ajusta followers_count dos alvos e following_count
+    do usuário num único UPDATE e atualiza a timeline como FollowUser."""
+    existing = set(User.objects.filter(id__in=wanted).exclude(id=user.id).values_list('id', flat=True))
+    current = set(
+        Follow.objects.select_for_update()
+        .filter(from_customuser_id=user.id, to_customuser_id__in=existing)
+        .values_list('to_customuser_id', flat=True)
+    )
+    to_create = [target for target, following in wanted.items() if following and target in existing and target not in current]
+    to_delete = [target for target, following in wanted.items() if not following and target in current]
+    if to_delete:
+        _deleted(Follow.objects.filter(from_customuser_id=user.id, to_customuser_id__in=to_delete), len(to_delete))
+    Follow.objects.bulk_create([Follow(from_customuser_id=user.id, to_customuser_id=target) for target in to_create])
+    deltas = {(target, 'followers_count'): 1 for target in to_create}
+    deltas.update({(target, 'followers_count'): -1 for target in to_delete})
+    deltas[(user.id, 'following_count')] = len(to_create) - len(to_delete)
+    counters.bulk_change_counters(User, deltas)
+    for author in User.objects.filter(id__in=to_create):
+        timeline.backfill(user, author)
+    for author_id in to_delete:
+        timeline.prune(user, author_id)
+    return existing
+
+
+def _apply(user, operations):
+    actions = {}
+    follows = {}
+    # Operações repetidas sobre o mesmo alvo: vale a última
+    for op, target_id in operations:
+        if op in POST_OPERATIONS:
+            action_type, active = POST_OPERATIONS[op]
+            actions[(target_id, action_type)] = active
+        else:
+            follows[target_id] = FOLLOW_OPERATIONS[op]
+    posts, deltas = _apply_actions(user, actions) if actions else (set(), {})
+    counts = counters.adjust_counters(deltas, posts)
+    users = _apply_follows(user, follows) if follows else set()
+    followers = dict(User.objects.filter(id__in=users).values_list('id', 'followers_count'))
+    following_count = User.objects.filter(id=user.id).values_list('following_count', flat=True).get()
+
+    results = []
+    for op, target_id in operations:
+        result = {'op': op, 'target_id': target_id}
+        if op in POST_OPERATIONS:
+            action_type, _ = POST_OPERATIONS[op]
+            if target_id not in posts:
+                result['status'] = 'not_found'
+            else:
+                result.update(
+                    status='ok',
+                    active=actions[(target_id, action_type)],
+                    count=counts[target_id][counters.ACTION_COUNTERS[action_type]],
+                )
+        elif target_id == user.id:
+            result['status'] = 'invalid'
+        elif target_id not in users:
+            result['status'] = 'not_found'
+        else:
+            result.update(status='ok', active=follows[target_id], count=followers[target_id])
+        results.append(result)
+    return results, following_count
+
+
+def apply(user, operations):
+    """Aplica um lote de operações (op, target_id), já validadas por parse, numa única
+    transação.
+
+    Devolve (resultados na ordem recebida, following_count do usuário)."""
+    for attempt in range(2):
+        try:
+            with transaction.atomic(using=router.db_for_write(PostAction)):
+                return _apply(user, operations)
+        except IntegrityError:
+            # Outro request do mesmo usuário inseriu as mesmas linhas: o estado é relido e o lote repetido
+            if attempt:
+                raise
+            logger.debug(f"Conflito no lote de {user.id}, repetindo")
@@ -0,0 +1,198 @@
+import hashlib
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from . import metrics, routing
+
+# Cache em dois níveis para linhas de post, perfis e janelas de timeline.
+#
+# L1: LRU em memória do processo, limitado em bytes. L2: cache compartilhado entre
+# workers (CACHE_L2). As chaves levam a geração da entidade ({ns}:{id}:{geração}), então
+# nada é apagado: as escritas trocam a geração no L2 após o commit e os valores antigos
+# deixam de ser encontrados, em todos os workers. A geração é um token novo em vez de incr:
+# no FileBasedCache/DatabaseCache o incr não é atômico, e uma geração perdida (evicção)
+# nunca volta a um valor já usado.
+
+MISSING = object()
+
+
+class LRU:
+    """Blobs (pickle) por chave, com evicção do menos usado acima de max_bytes.
+    Entradas com expires vencem sozinhas (gerações memorizadas)."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return MISSING
+            blob, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                self.size -= len(blob)
+                return MISSING
+            self._data.move_to_end(key)
+            return blob
+
+    def set(self, key, blob, ttl=None):
+        if len(blob) > self.max_bytes:
+            return
+        expires = time.monotonic() + ttl if ttl is not None else None
+        evicted = 0
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous[0])
+            self._data[key] = (blob, expires)
+            self.size += len(blob)
+            while self.size > self.max_bytes:
+                _, (old, _) = self._data.popitem(last=False)
+                self.size -= len(old)
+                evicted += 1
+        if evicted:
+            metrics.CACHE_EVICTIONS.inc(amount=evicted)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+
+class TwoTierCache:
+    def __init__(self, alias, max_bytes):
+        self.alias = alias
+        self.l1 = LRU(max_bytes)
+
+    @property
+    def l2(self):
+        return caches[self.alias]
+
+    def generations(self, namespace, ids):
+        keys = {pk: f'gen:{namespace}:{pk}' for pk in ids}
+        found = {}
+        if settings.CACHE_GENERATION_TTL:
+            for pk, key in keys.items():
+                blob = self.l1.get(key)
+                if blob is not MISSING:
+                    found[pk] = blob.decode()
+        missing = {key: pk for pk, key in keys.items() if pk not in found}
+        if missing:
+            stored = self.l2.get_many(list(missing))
+            for key, pk in missing.items():
+                generation = stored.get(key)
+                if generation is None:
+                    # Sem geração (nunca escrita ou evictada): começa uma nova. add, para que
+                    # workers concorrentes acabem todos com a mesma
+                    generation = uuid.uuid4().hex
+                    if not self.l2.add(key, generation, timeout=None):
+                        generation = self.l2.get(key, generation)
+                found[pk] = generation
+                if settings.CACHE_GENERATION_TTL:
+                    self.l1.set(key, generation.encode(), ttl=settings.CACHE_GENERATION_TTL)
+        return found
+
+    def bump(self, namespace, ids):
+        values = {f'gen:{namespace}:{pk}': uuid.uuid4().hex for pk in ids}
+        self.l2.set_many(values, timeout=None)
+        if settings.CACHE_GENERATION_TTL:
+            # Leituras seguintes no mesmo processo já usam a geração nova
+            for key, generation in values.items():
+                self.l1.set(key, generation.encode(), ttl=settings.CACHE_GENERATION_TTL)
+
+    def get_many(self, namespace, ids, loader, variant=''):
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            return {}
+        generations = self.generations(namespace, ids)
+        keys = {pk: f'{namespace}:{pk}:{generations[pk]}{variant}' for pk in ids}
+        found = {}
+        for pk, key in keys.items():
+            blob = self.l1.get(key)
+            if blob is not MISSING:
+                found[pk] = pickle.loads(blob)
+        l1_hits = len(found)
+        remote = {keys[pk]: pk for pk in ids if pk not in found}
+        if remote:
+            for key, blob in self.l2.get_many(list(remote)).items():
+                self.l1.set(key, blob)
+                found[remote[key]] = pickle.loads(blob)
+        if l1_hits:
+            metrics.CACHE_REQUESTS.inc(namespace, 'l1_hit', amount=l1_hits)
+        if len(found) > l1_hits:
+            metrics.CACHE_REQUESTS.inc(namespace, 'l2_hit', amount=len(found) - l1_hits)
+        missing = [pk for pk in ids if pk not in found]
+        if missing:
+            metrics.CACHE_REQUESTS.inc(namespace, 'miss', amount=len(missing))
+            # Sempre do primário: uma réplica atrasada gravaria o valor antigo sob a geração nova
+            with routing.primary():
+                loaded = loader(missing)
+            blobs = {keys[pk]: pickle.dumps(value, pickle.HIGHEST_PROTOCOL) for pk, value in loaded.items()}
+            self.l2.set_many(blobs, timeout=settings.CACHE_TTL)
+            for key, blob in blobs.items():
+                self.l1.set(key, blob)
+            # Devolvido pelo pickle, como nos acertos: quem chama pode alterar os dicts
+            found.update((pk, pickle.loads(blobs[keys[pk]])) for pk in loaded)
+        return found
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TwoTierCache(settings.CACHE_L2, settings.CACHE_L1_MAX_BYTES)
+    return _cache
+
+
+def enabled():
+    return settings.CACHE_ENABLED
+
+
+def get_many(namespace, ids, loader, variant=''):
+    """{id: valor} pelo L1, depois L2, e loader(ids que faltam) -> {id: valor} para o resto.
+    variant distingue vários valores por entidade (ex.: páginas da timeline)."""
+    if not settings.CACHE_ENABLED:
+        return loader(list(ids))
+    return get_cache().get_many(namespace, ids, loader, variant)
+
+
+def get(namespace, pk, loader, variant=''):
+    return get_many(namespace, [pk], lambda ids: {pk: loader()}, variant)[pk]
+
+
+def variant_key(*parts):
+    return ':' + hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def generations_key(namespace, ids):
+    """Token das gerações atuais das entidades, para a variant de um valor derivado de
+    várias delas: um bump em qualquer uma troca o token e o valor deixa de ser encontrado."""
+    if not settings.CACHE_ENABLED:
+        return ''
+    return variant_key(*sorted(get_cache().generations(namespace, ids).items()))
+
+
+def invalidate(namespace, ids):
+    """Troca a geração das entidades após o commit: antes dele, uma leitura concorrente
+    poderia guardar o valor antigo já com a geração nova."""
+    if not settings.CACHE_ENABLED:
+        return
+    ids = list(ids)
+    if ids:
+        transaction.on_commit(lambda: get_cache().bump(namespace, ids))
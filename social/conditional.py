@@ -0,0 +1,31 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    return quote_etag(hashlib.sha1(repr(parts).encode()).hexdigest())
+
+
+def _timestamp(last_modified):
+    return int(last_modified.timestamp()) if last_modified else None
+
+
+def not_modified(request, etag, last_modified=None):
+    """304 (ou 412) quando os validadores do cliente ainda valem; None caso contrário.
+
+    Deve ser chamado antes de montar o corpo: só os carimbos de versão são lidos."""
+    response = get_conditional_response(request, etag=etag, last_modified=_timestamp(last_modified))
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(_timestamp(last_modified))
+    # Respostas por usuário: o cliente revalida sempre, proxies não guardam
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,602 @@
+import atexit
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Case, Count, F, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from rest_framework.exceptions import APIException
+
+from . import caching, events, ranking
+from .models import Comment, CounterFlush, Post, PostAction
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+Follow = User.following.through
+
+ACTION_COUNTERS = {
+    'like': 'likes_count',
+    'repost': 'reposts_count',
+    'share': 'shares_count',
+}
+# Tentativas de um toggle que colide com requests simultâneos do mesmo usuário
+TOGGLE_ATTEMPTS = 5
+
+
+class ToggleConflict(APIException):
+    """O estado não se firmou em TOGGLE_ATTEMPTS tentativas: 409, o cliente repete."""
+    status_code = 409
+    default_detail = 'Alteração simultânea em andamento, tente novamente'
+    default_code = 'conflict'
+
+
+COUNTER_FIELDS = ('likes_count', 'reposts_count', 'comments_count', 'shares_count')
+USER_COUNTER_FIELDS = ('followers_count', 'following_count', 'posts_count')
+
+
+def _update_returning(model, pk, field, delta):
+    connection = connections[router.db_for_write(model)]
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    column = qn(model._meta.get_field(field).column)
+    pk_column = qn(model._meta.pk.column)
+    stamp_column = qn(model._meta.get_field('updated_at').column)
+    stamp = connection.ops.adapt_datetimefield_value(timezone.now())
+    value = f'CASE WHEN {column} + %s > 0 THEN {column} + %s ELSE 0 END'
+    assignments, params = [f'{column} = {value}'], [delta, delta]
+    if model is Post:
+        # hot_score no mesmo UPDATE, a partir dos contadores antigos e do novo valor
+        assignments.insert(0, f'{qn("hot_score")} = {ranking.hot_score_sql(qn, field, value)}')
+        params = [delta, delta, *params]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET {", ".join(assignments)}, '
+            f'{stamp_column} = %s WHERE {pk_column} = %s RETURNING {column}',
+            [*params, stamp, pk],
+        )
+        row = cursor.fetchone()
+    if row:
+        caching.invalidate(model._meta.model_name, [pk])
+    return row[0] if row else None
+
+
+def change_counter(post_id, field, delta):
+    """Aplica delta a um contador do post num único UPDATE condicional, que também
+    atualiza hot_score, e devolve o novo valor (RETURNING), sem reler a linha. None se o
+    post não existe."""
+    if field not in COUNTER_FIELDS:
+        raise ValueError(f'Contador desconhecido: {field}')
+    return _update_returning(Post, post_id, field, delta)
+
+
+def refresh_hot_scores(post_ids):
+    """Recalcula hot_score dos posts a partir dos contadores gravados: uma leitura
+    e um UPDATE. Para os reparos (reconcile, rebuild); as mudanças de contador já
+    atualizam hot_score no próprio UPDATE."""
+    rows = Post.objects.filter(id__in=post_ids).values('id', 'created_at', *COUNTER_FIELDS)
+    posts = [Post(id=row['id'], hot_score=ranking.hot_score(row, row['created_at'])) for row in rows]
+    if len(posts) == 1:
+        Post.objects.filter(id=posts[0].id).update(hot_score=posts[0].hot_score)
+    else:
+        Post.objects.bulk_update(posts, ['hot_score'])
+    return len(posts)
+
+
+def rebuild_hot_scores(chunk_size=1000):
+    """Recalcula hot_score de todos os posts em lotes (ex.: após mudar HOT_SCORE_DECAY)."""
+    total = 0
+    last_id = 0
+    while True:
+        ids = list(Post.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return total
+        last_id = ids[-1]
+        total += refresh_hot_scores(ids)
+
+
+def change_user_counter(user_id, field, delta):
+    if field not in USER_COUNTER_FIELDS:
+        raise ValueError(f'Contador desconhecido: {field}')
+    return _update_returning(User, user_id, field, delta)
+
+
+def adjust_counter(post_id, field, delta):
+    """Ajusta um contador e devolve o valor visível ao cliente.
+
+    Com COUNTER_WRITE_BEHIND o delta vai para o buffer (após o commit) e o
+    valor devolvido já inclui os deltas pendentes. O novo valor é publicado
+    (após o commit) para as conexões SSE que acompanham o post."""
+    if not settings.COUNTER_WRITE_BEHIND:
+        count = change_counter(post_id, field, delta)
+    else:
+        stored = Post.objects.filter(id=post_id).values_list(field, flat=True).first()
+        if stored is None:
+            return None
+        buffer = get_buffer()
+        pending = buffer.pending([post_id]).get(post_id, {}).get(field, 0)
+        transaction.on_commit(lambda: record_delta(post_id, field, delta), using=router.db_for_write(Post))
+        count = max(0, stored + pending + delta)
+    if count is not None:
+        events.counter_changed(post_id, field, count)
+    return count
+
+
+def adjust_counters(deltas, post_ids=()):
+    """Versão em lote de adjust_counter: aplica {(post_id, campo): delta} de uma vez
+    e devolve {post_id: {campo: valor visível}} dos posts afetados e de post_ids."""
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if settings.COUNTER_WRITE_BEHIND:
+        for (post_id, field), delta in deltas.items():
+            transaction.on_commit(
+                lambda post_id=post_id, field=field, delta=delta: record_delta(post_id, field, delta),
+                using=router.db_for_write(Post),
+            )
+    else:
+        bulk_change_counters(Post, deltas)
+    ids = {post_id for post_id, _ in deltas} | set(post_ids)
+    rows = apply_pending(Post.objects.filter(id__in=ids).values('id', *COUNTER_FIELDS))
+    values = {}
+    for row in rows:
+        values[row['id']] = {field: row[field] for field in COUNTER_FIELDS}
+        for field in COUNTER_FIELDS:
+            delta = deltas.get((row['id'], field))
+            if delta is None:
+                continue
+            if settings.COUNTER_WRITE_BEHIND:
+                # O delta só entra no buffer após o commit
+                values[row['id']][field] = max(0, row[field] + delta)
+            events.counter_changed(row['id'], field, values[row['id']][field])
+    return values
+
+
+def toggle_action(user, post_id, action_type):
+    """Liga/desliga a ação do usuário no post e ajusta o contador na mesma transação.
+
+    Devolve (ativo, novo_contador). Levanta Post.DoesNotExist se o post não existe e
+    ToggleConflict se o estado não se firma em TOGGLE_ATTEMPTS tentativas.
+    """
+    field = ACTION_COUNTERS[action_type]
+    for _ in range(TOGGLE_ATTEMPTS):
+        try:
+            with transaction.atomic(using=router.db_for_write(PostAction)):
+                deleted, _ = PostAction.objects.filter(
+                    user=user, post_id=post_id, action_type=action_type
+                ).delete()
+                delta = -1 if deleted else 1
+                count = adjust_counter(post_id, field, delta)
+                if count is None:
+                    raise Post.DoesNotExist(f'Post {post_id} não existe')
+                if delta > 0:
+                    PostAction.objects.create(user=user, post_id=post_id, action_type=action_type)
+                return delta > 0, count
+        except IntegrityError:
+            # Outro request do mesmo usuário criou a ação em paralelo: repete, relendo o estado
+            logger.debug(f"Conflito ao alternar {action_type} no post {post_id}, repetindo")
+    raise ToggleConflict()
+
+
+def toggle_follow(user, target_id):
+    """Segue/deixa de seguir e ajusta following_count/followers_count na mesma transação.
+
+    Devolve (seguindo, following_count do usuário). ToggleConflict como em toggle_action."""
+    for _ in range(TOGGLE_ATTEMPTS):
+        try:
+            with transaction.atomic(using=router.db_for_write(Follow)):
+                deleted, _ = Follow.objects.filter(from_customuser_id=user.id, to_customuser_id=target_id).delete()
+                if not deleted:
+                    Follow.objects.create(from_customuser_id=user.id, to_customuser_id=target_id)
+                delta = -1 if deleted else 1
+                change_user_counter(target_id, 'followers_count', delta)
+                return delta > 0, change_user_counter(user.id, 'following_count', delta)
+        except IntegrityError:
+            logger.debug(f"Conflito ao alternar follow {user.id} -> {target_id}, repetindo")
+    raise ToggleConflict()
+
+
+def reconcile_users(chunk_size=1000):
+    """Recalcula followers_count/following_count/posts_count em lotes de usuários."""
+    repaired = 0
+    last_id = 0
+    while True:
+        ids = list(User.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return repaired
+        last_id = ids[-1]
+        totals = {user_id: dict.fromkeys(USER_COUNTER_FIELDS, 0) for user_id in ids}
+        for user_id, total in (
+            Follow.objects.filter(to_customuser_id__in=ids).values('to_customuser_id')
+            .annotate(total=Count('id')).values_list('to_customuser_id', 'total')
+        ):
+            totals[user_id]['followers_count'] = total
+        for user_id, total in (
+            Follow.objects.filter(from_customuser_id__in=ids).values('from_customuser_id')
+            .annotate(total=Count('id')).values_list('from_customuser_id', 'total')
+        ):
+            totals[user_id]['following_count'] = total
+        for user_id, total in (
+            Post.objects.filter(author_id__in=ids).values('author_id')
+            .annotate(total=Count('id')).values_list('author_id', 'total')
+        ):
+            totals[user_id]['posts_count'] = total
+        now = timezone.now()
+        stale = [
+            User(id=row['id'], updated_at=now, **totals[row['id']])
+            for row in User.objects.filter(id__in=ids).values('id', *USER_COUNTER_FIELDS)
+            if any(row[field] != totals[row['id']][field] for field in USER_COUNTER_FIELDS)
+        ]
+        User.objects.bulk_update(stale, [*USER_COUNTER_FIELDS, 'updated_at'])
+        caching.invalidate('customuser', [user.id for user in stale])
+        repaired += len(stale)
+
+
+# Write-behind: deltas acumulados num buffer e aplicados em lote
+
+
+class LocalCounterBuffer:
+    """Buffer em memória do processo. Serve para desenvolvimento e testes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._deltas = defaultdict(int)
+        self._journal = None
+
+    def add(self, post_id, field, delta):
+        with self._lock:
+            self._deltas[(post_id, field)] += delta
+            return len(self._deltas)
+
+    def pending(self, post_ids):
+        post_ids = set(post_ids)
+        result = defaultdict(dict)
+        with self._lock:
+            for (post_id, field), delta in self._deltas.items():
+                if post_id in post_ids and delta:
+                    result[post_id][field] = delta
+        return dict(result)
+
+    def drain(self, batch_id=None):
+        with self._lock:
+            deltas, self._deltas = self._deltas, defaultdict(int)
+            deltas = {key: delta for key, delta in deltas.items() if delta}
+            if batch_id is not None and deltas:
+                self._journal = (batch_id, deltas)
+        return deltas
+
+    def complete_drain(self, batch_id, deltas):
+        pass
+
+    def restore(self, deltas):
+        with self._lock:
+            for key, delta in deltas.items():
+                self._deltas[key] += delta
+
+    def size(self):
+        return len(self._deltas)
+
+    def save_journal(self, batch_id, deltas):
+        self._journal = (batch_id, deltas)
+
+    def load_journal(self):
+        return self._journal
+
+    def clear_journal(self):
+        self._journal = None
+
+
+class CacheCounterBuffer:
+    """Buffer compartilhado entre workers sobre um backend de cache com incr atômico
+    (Redis, Memcached). O journal do lote em andamento fica no próprio cache."""
+
+    lock_timeout = 10
+
+    def __init__(self, alias='default', prefix='counters'):
+        self.alias = alias
+        self.prefix = prefix
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _key(self, post_id, field):
+        return f'{self.prefix}:d:{post_id}:{field}'
+
+    def _lock(self):
+        key = f'{self.prefix}:lock'
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_timeout
+        while not self.cache.add(key, token, timeout=self.lock_timeout):
+            if time.monotonic() > deadline:
+                raise TimeoutError('Lock do buffer de contadores indisponível')
+            time.sleep(0.005)
+        return key
+
+    def _register(self, post_id, field):
+        lock = self._lock()
+        try:
+            registry = self.cache.get(f'{self.prefix}:registry') or set()
+            registry.add((post_id, field))
+            self.cache.set(f'{self.prefix}:registry', registry, timeout=None)
+        finally:
+            self.cache.delete(lock)
+
+    def add(self, post_id, field, delta):
+        key = self._key(post_id, field)
+        if not self.cache.add(key, delta, timeout=None):
+            try:
+                self.cache.incr(key, delta)
+            except ValueError:
+                self.cache.add(key, 0, timeout=None)
+                self.cache.incr(key, delta)
+        # A marca garante que a chave esteja no registro lido pelo flush
+        if self.cache.add(f'{key}:reg', 1, timeout=None):
+            self._register(post_id, field)
+        try:
+            return self.cache.incr(f'{self.prefix}:n')
+        except ValueError:
+            self.cache.add(f'{self.prefix}:n', 1, timeout=None)
+            return 1
+
+    def pending(self, post_ids):
+        keys = {self._key(post_id, field): (post_id, field) for post_id in post_ids for field in COUNTER_FIELDS}
+        result = defaultdict(dict)
+        for key, delta in self.cache.get_many(list(keys)).items():
+            if delta:
+                post_id, field = keys[key]
+                result[post_id][field] = delta
+        return dict(result)
+
+    def drain(self, batch_id=None):
+        """Retira os deltas do buffer. Com batch_id, o journal do lote é gravado antes de
+        qualquer decr: um crash no meio é retomado por recover, sem perder deltas."""
+        deltas = {}
+        lock = self._lock()
+        try:
+            registry = self.cache.get(f'{self.prefix}:registry') or set()
+            keys = {self._key(post_id, field): (post_id, field) for post_id, field in registry}
+            stored = self.cache.get_many(list(keys))
+            for key, (post_id, field) in keys.items():
+                delta = stored.get(key) or 0
+                if delta:
+                    deltas[(post_id, field)] = delta
+                    continue
+                self.cache.delete(f'{key}:reg')
+                if self.cache.get(key):
+                    self.cache.add(f'{key}:reg', 1, timeout=None)
+                else:
+                    registry.discard((post_id, field))
+            if batch_id is not None and deltas:
+                self.save_journal(batch_id, deltas)
+            self.complete_drain(batch_id, deltas)
+            self.cache.set(f'{self.prefix}:registry', registry, timeout=None)
+            self.cache.set(f'{self.prefix}:n', 0, timeout=None)
+        finally:
+            self.cache.delete(lock)
+        return deltas
+
+    def complete_drain(self, batch_id, deltas):
+        # decr em vez de delete: incrementos concorrentes não se perdem. A marca por chave,
+        # gravada após o decr, evita decrementar de novo quando recover retoma o lote
+        for (post_id, field), delta in deltas.items():
+            done = f'{self.prefix}:done:{batch_id}:{post_id}:{field}'
+            if batch_id is not None and self.cache.get(done):
+                continue
+            try:
+                self.cache.decr(self._key(post_id, field), delta)
+            except ValueError:
+                pass
+            if batch_id is not None:
+                self.cache.set(done, 1, timeout=86400)
+
+    def restore(self, deltas):
+        for (post_id, field), delta in deltas.items():
+            self.add(post_id, field, delta)
+
+    def size(self):
+        return self.cache.get(f'{self.prefix}:n') or 0
+
+    def save_journal(self, batch_id, deltas):
+        self.cache.set(f'{self.prefix}:journal', (batch_id, deltas), timeout=None)
+
+    def load_journal(self):
+        return self.cache.get(f'{self.prefix}:journal')
+
+    def clear_journal(self):
+        self.cache.delete(f'{self.prefix}:journal')
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                if settings.COUNTER_BUFFER == 'cache':
+                    _buffer = CacheCounterBuffer(alias=settings.COUNTER_BUFFER_CACHE)
+                else:
+                    _buffer = LocalCounterBuffer()
+    return _buffer
+
+
+def pending_deltas(post_ids):
+    if not settings.COUNTER_WRITE_BEHIND or not post_ids:
+        return {}
+    return get_buffer().pending(post_ids)
+
+
+def apply_pending(posts):
+    """Soma os deltas ainda não gravados aos contadores dos posts (instâncias ou dicts)."""
+    posts = list(posts)
+    pending = pending_deltas([p['id'] if isinstance(p, dict) else p.id for p in posts])
+    for post in posts:
+        post_id = post['id'] if isinstance(post, dict) else post.id
+        for field, delta in pending.get(post_id, {}).items():
+            if isinstance(post, dict):
+                post[field] = max(0, post[field] + delta)
+            else:
+                setattr(post, field, max(0, getattr(post, field) + delta))
+    return posts
+
+
+def record_delta(post_id, field, delta):
+    size = get_buffer().add(post_id, field, delta)
+    # COUNTER_FLUSH_INTERVAL=0 desliga a thread; o flush fica a cargo do comando flush_counters
+    if not settings.COUNTER_FLUSH_INTERVAL:
+        return
+    flusher.start()
+    if size >= settings.COUNTER_FLUSH_THRESHOLD:
+        flusher.wake()
+
+
+def bulk_change_counters(model, deltas):
+    """Aplica {(pk, campo): delta} num único UPDATE com CASE por campo, sem deixar
+    contadores negativos. Em Post o mesmo UPDATE atualiza hot_score."""
+    by_field = defaultdict(dict)
+    for (pk, field), delta in deltas.items():
+        if delta:
+            by_field[field][pk] = delta
+    pks = {pk for per_pk in by_field.values() for pk in per_pk}
+    if not pks:
+        return
+    updates = {
+        field: Greatest(
+            F(field) + Case(
+                *[When(pk=pk, then=Value(delta)) for pk, delta in per_pk.items()],
+                default=Value(0),
+            ),
+            Value(0),
+        )
+        for field, per_pk in by_field.items()
+    }
+    if model is Post:
+        # Primeiro no SET, para ler os contadores antigos também em bancos que avaliam em ordem
+        updates = {'hot_score': ranking.hot_score_update(updates), **updates}
+    model.objects.filter(pk__in=pks).update(**updates, updated_at=timezone.now())
+    caching.invalidate(model._meta.model_name, pks)
+
+
+def apply_deltas(deltas, batch_id):
+    """Aplica um lote num único UPDATE por lote. Idempotente por batch_id."""
+    try:
+        with transaction.atomic(using=router.db_for_write(Post)):
+            CounterFlush.objects.create(batch_id=batch_id)
+            bulk_change_counters(Post, deltas)
+    except IntegrityError:
+        logger.info(f"Lote de contadores {batch_id} já aplicado, ignorando")
+        return False
+    return True
+
+
+def recover(buffer=None):
+    """Reaplica o lote que estava em andamento quando o processo caiu, se houver."""
+    buffer = buffer or get_buffer()
+    journal = buffer.load_journal()
+    if not journal:
+        return False
+    batch_id, deltas = journal
+    applied = apply_deltas(deltas, batch_id)
+    # O processo pode ter caído antes de retirar os deltas do buffer
+    buffer.complete_drain(batch_id, deltas)
+    buffer.clear_journal()
+    logger.info(f"Journal de contadores {batch_id} recuperado (reaplicado={applied})")
+    return applied
+
+
+def flush(buffer=None):
+    buffer = buffer or get_buffer()
+    recover(buffer)
+    batch_id = uuid.uuid4().hex
+    # O journal é gravado pelo drain, antes de retirar os deltas do buffer e antes do
+    # UPDATE; CounterFlush impede a dupla aplicação na recuperação
+    deltas = buffer.drain(batch_id)
+    if not deltas:
+        return 0
+    try:
+        apply_deltas(deltas, batch_id)
+    except Exception:
+        buffer.restore(deltas)
+        buffer.clear_journal()
+        raise
+    buffer.clear_journal()
+    CounterFlush.objects.filter(applied_at__lt=timezone.now() - timedelta(days=1)).delete()
+    logger.debug(f"Flush de contadores: {len(deltas)} deltas, lote {batch_id}")
+    return len(deltas)
+
+
+def reconcile(chunk_size=1000):
+    """Recalcula os contadores a partir de PostAction e Comment (reparo de drift)."""
+    repaired = 0
+    last_id = 0
+    while True:
+        ids = list(Post.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return repaired
+        last_id = ids[-1]
+        totals = defaultdict(dict)
+        actions = PostAction.objects.filter(post_id__in=ids).values_list('post_id', 'action_type')
+        for post_id, action_type in actions.order_by().iterator():
+            field = ACTION_COUNTERS[action_type]
+            totals[post_id][field] = totals[post_id].get(field, 0) + 1
+        for post_id in Comment.objects.filter(post_id__in=ids).values_list('post_id', flat=True).iterator():
+            totals[post_id]['comments_count'] = totals[post_id].get('comments_count', 0) + 1
+        rows = Post.objects.filter(id__in=ids).values('id', *COUNTER_FIELDS)
+        now = timezone.now()
+        stale = []
+        for row in rows:
+            expected = {field: totals[row['id']].get(field, 0) for field in COUNTER_FIELDS}
+            if any(row[field] != expected[field] for field in COUNTER_FIELDS):
+                stale.append(Post(id=row['id'], updated_at=now, **expected))
+        Post.objects.bulk_update(stale, [*COUNTER_FIELDS, 'updated_at'])
+        caching.invalidate('post', [post.id for post in stale])
+        refresh_hot_scores([post.id for post in stale])
+        repaired += len(stale)
+
+
+class Flusher:
+    """Thread daemon que esvazia o buffer a cada COUNTER_FLUSH_INTERVAL segundos
+    ou antes, quando o buffer passa de COUNTER_FLUSH_THRESHOLD."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='counter-flusher', daemon=True)
+                self._thread.start()
+                atexit.register(self._flush_once)
+
+    def wake(self):
+        self._event.set()
+
+    def _flush_once(self):
+        try:
+            flush()
+        except Exception as e:
+            logger.error(f"Erro no flush de contadores: {e}")
+        finally:
+            connections.close_all()
+
+    def _run(self):
+        while True:
+            self._event.wait(settings.COUNTER_FLUSH_INTERVAL)
+            self._event.clear()
+            self._flush_once()
+
+
+flusher = Flusher()
@@ -0,0 +1,210 @@
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Canais: author:<id> recebe os posts novos do autor; post:<id> as mudanças de contadores
+
+
+def author_channel(author_id):
+    return f'author:{author_id}'
+
+
+def post_channel(post_id):
+    return f'post:{post_id}'
+
+
+class Subscription:
+    """Fila de eventos de uma conexão SSE, presa ao event loop que a criou.
+
+    publish() pode vir de qualquer thread (views síncronas): a entrega passa por
+    call_soon_threadsafe. Fila cheia marca overflow e o cliente é avisado para ressincronizar."""
+
+    def __init__(self, broker, channels, maxsize):
+        self.broker = broker
+        self.channels = set(channels)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.overflow = False
+
+    def push(self, event):
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # Loop já encerrado: a conexão caiu sem passar pelo close()
+            self.broker.unsubscribe(self)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflow = True
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """Pub/sub no próprio processo. Suficiente com um único processo ASGI."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, channels, maxsize=None):
+        subscription = Subscription(self, channels, maxsize or settings.EVENTS_QUEUE_SIZE)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+    def subscriber_count(self):
+        with self._lock:
+            return len({subscription for subscribers in self._subscribers.values() for subscription in subscribers})
+
+    def deliver(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.push(event)
+
+    def publish(self, channel, event):
+        self.deliver(channel, event)
+
+
+class RedisBroker(LocalBroker):
+    """Entrega entre processos via Redis pub/sub (EVENTS_REDIS_URL).
+
+    publish() vai para o Redis; uma thread por processo assina o prefixo dos canais
+    e repassa cada mensagem aos assinantes locais."""
+
+    def __init__(self, url=None, prefix='zuppi:events:'):
+        super().__init__()
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured('RedisBroker requer o pacote redis')
+        url = url or settings.EVENTS_REDIS_URL
+        if not url:
+            raise ImproperlyConfigured('RedisBroker requer EVENTS_REDIS_URL')
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(url)
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def subscribe(self, channels, maxsize=None):
+        self._start_listener()
+        return super().subscribe(channels, maxsize)
+
+    def publish(self, channel, event):
+        self.client.publish(f'{self.prefix}{channel}', json.dumps(event, separators=(',', ':')))
+
+    def _start_listener(self):
+        if self._listener is not None:
+            return
+        with self._listener_lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='events-redis', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(f'{self.prefix}*')
+                for message in pubsub.listen():
+                    channel = message['channel'].decode()[len(self.prefix):]
+                    self.deliver(channel, json.loads(message['data']))
+            except Exception as e:
+                logger.error(f"Conexão de eventos com o Redis caiu ({e}), reconectando")
+                threading.Event().wait(1)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.EVENTS_BACKEND)()
+    return _broker
+
+
+def publish(channel, event):
+    """Publica após o commit da transação corrente (ou já, fora de transação)."""
+    def send():
+        try:
+            get_broker().publish(channel, event)
+        except Exception as e:
+            # Eventos são best-effort: falha no broker não derruba a escrita
+            logger.error(f"Falha ao publicar evento em {channel}: {e}")
+    transaction.on_commit(send)
+
+
+def post_created(post):
+    publish(author_channel(post.author_id), {'type': 'post', 'id': post.id, 'author_id': post.author_id})
+
+
+def counter_changed(post_id, field, value):
+    publish(post_channel(post_id), {'type': 'counters', 'id': post_id, field: value})
+
+
+def _format(event_id, event):
+    data = json.dumps({key: value for key, value in event.items() if key != 'type'}, separators=(',', ':'))
+    return f"id: {event_id}\nevent: {event['type']}\ndata: {data}\n\n"
+
+
+async def stream(channels, once=False):
+    """Corpo text/event-stream de uma conexão. A assinatura é feita aqui, no event loop
+    que consome a resposta, e desfeita quando a conexão cai ou expira (EVENTS_MAX_AGE).
+
+    once=True encerra no primeiro lote de eventos ou heartbeat (long-polling, para WSGI)."""
+    subscription = get_broker().subscribe(channels)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.EVENTS_MAX_AGE
+    sequence = 0
+    try:
+        yield 'retry: 3000\n\n'
+        while loop.time() < deadline:
+            event = await subscription.get(settings.EVENTS_HEARTBEAT)
+            if subscription.overflow:
+                # Eventos perdidos: o cliente deve reler o feed (GET condicional) em vez de confiar nos deltas
+                subscription.overflow = False
+                yield 'event: resync\ndata: {}\n\n'
+            if event is None:
+                if once:
+                    return
+                yield ': ping\n\n'
+                continue
+            sequence += 1
+            yield _format(sequence, event)
+            if once and subscription.queue.empty():
+                return
+    finally:
+        subscription.close()
@@ -0,0 +1,71 @@
+import logging
+import os
+import sys
+import tempfile
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+FORMAT_EXTENSIONS = {'WEBP': '.webp', 'JPEG': '.jpg'}
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def variant_extension():
+    return FORMAT_EXTENSIONS[settings.IMAGE_FORMAT]
+
+
+def _open(path):
+    largest = max(settings.IMAGE_VARIANTS.values())
+    try:
+        img = Image.open(path)
+        width, height = img.size
+        if width * height > settings.IMAGE_MAX_PIXELS:
+            img.close()
+            raise InvalidImage(f'Imagem grande demais: {width}x{height}')
+        # Só o JPEG decodifica em escala reduzida; PNG/WebP/GIF são decodificados inteiros
+        # (até 4 bytes por pixel em RGBA, por thread de upload): teto próprio, menor
+        if img.format != 'JPEG' and width * height > settings.IMAGE_MAX_FULL_DECODE_PIXELS:
+            img.close()
+            raise InvalidImage(f'Imagem {img.format} grande demais: {width}x{height}')
+        # JPEG: decodifica já em escala reduzida (DCT), sem carregar a imagem inteira
+        img.draft('RGB', (largest, largest))
+        img.load()
+    except (OSError, Image.DecompressionBombError) as e:
+        raise InvalidImage(str(e))
+    return img
+
+
+def _normalize(img):
+    img = ImageOps.exif_transpose(img)
+    keep_alpha = settings.IMAGE_FORMAT == 'WEBP' and img.mode in ('RGBA', 'LA', 'P')
+    return img.convert('RGBA' if keep_alpha else 'RGB')
+
+
+def render_variants(path):
+    """Gera as variantes configuradas em IMAGE_VARIANTS (nome -> largura máxima),
+    reencodadas em IMAGE_FORMAT e sem metadados. Devolve nome -> arquivo temporário."""
+    outputs = {}
+    with _open(path) as source:
+        img = _normalize(source)
+        try:
+            # Da maior para a menor: cada variante é reduzida a partir da anterior
+            for name, width in sorted(settings.IMAGE_VARIANTS.items(), key=lambda item: -item[1]):
+                # Só a largura é limitada: retratos mantêm a largura pedida, com altura maior
+                img.thumbnail((width, sys.maxsize), Image.Resampling.LANCZOS, reducing_gap=3.0)
+                with tempfile.NamedTemporaryFile(suffix=variant_extension(), delete=False) as tmp:
+                    # Sem exif/icc: o save não copia os metadados do original
+                    img.save(tmp, settings.IMAGE_FORMAT, quality=settings.IMAGE_QUALITY, optimize=True)
+                outputs[name] = tmp.name
+        except Exception:
+            for output in outputs.values():
+                os.unlink(output)
+            raise
+        finally:
+            img.close()
+    logger.debug(f"Variantes geradas para {path}: {list(outputs)}")
+    return outputs
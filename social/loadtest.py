@@ -0,0 +1,207 @@
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from .models import Post
+
+# Harness de carga: cenários (método, caminho, corpo) executados pelo test client do
+# Django (custo do framework e do banco, sem rede) ou contra um gunicorn local.
+
+SERVERS = {
+    'wsgi': ['zuppi.wsgi:application'],
+    'asgi': ['zuppi.asgi:application', '-c', os.path.join('zuppi', 'gunicorn_asgi.py')],
+}
+DEFAULT_MIX = {'feed': 50, 'profile': 20, 'like': 20, 'comment': 10}
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+def summarize(latencies, errors, duration):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'rps': len(latencies) / duration if duration else 0.0,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'errors': errors,
+    }
+
+
+def parse_mix(text):
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in DEFAULT_MIX:
+            raise ValueError(f'Cenário desconhecido: {name}')
+        mix[name] = int(weight or 1)
+    return mix
+
+
+class Workload:
+    """Sorteia requisições do mix a partir de usuários e posts existentes (ex.: seed_data)."""
+
+    def __init__(self, mix, users=50, seed=None):
+        self.mix = mix
+        self.random = random.Random(seed)
+        User = get_user_model()
+        user_ids = list(User.objects.filter(is_active=True).order_by('-following_count').values_list('id', flat=True)[:users])
+        if not user_ids:
+            raise ValueError('Sem usuários: rode seed_data antes')
+        existing = dict(Token.objects.filter(user_id__in=user_ids).values_list('user_id', 'key'))
+        Token.objects.bulk_create([Token(user_id=user_id, key=Token.generate_key()) for user_id in user_ids if user_id not in existing])
+        self.tokens = list(Token.objects.filter(user_id__in=user_ids).values_list('key', flat=True))
+        bounds = Post.objects.order_by('id').values_list('id', flat=True)
+        self.first_post, self.last_post = bounds.first(), bounds.last()
+        if self.first_post is None:
+            raise ValueError('Sem posts: rode seed_data antes')
+
+    def next(self):
+        name = self.random.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        token = self.random.choice(self.tokens)
+        post_id = self.random.randint(self.first_post, self.last_post)
+        if name == 'feed':
+            return name, token, 'GET', '/api/feed/', None
+        if name == 'profile':
+            return name, token, 'GET', '/api/profile/', None
+        if name == 'like':
+            return name, token, 'POST', f'/api/posts/{post_id}/like/', None
+        return name, token, 'POST', f'/api/posts/{post_id}/comment/', {'text': 'comentário de carga'}
+
+
+def _report(samples, errors, duration):
+    report = {name: summarize(samples.get(name, []), errors.get(name, 0), duration) for name in {*samples, *errors}}
+    report['total'] = summarize([value for values in samples.values() for value in values], sum(errors.values()), duration)
+    return report
+
+
+def run_client(workload, requests):
+    """Executa as requisições em sequência pelo django.test.Client, no banco configurado."""
+    client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+    samples, errors = {}, {}
+    start = time.perf_counter()
+    for _ in range(requests):
+        name, token, method, path, body = workload.next()
+        kwargs = {'HTTP_AUTHORIZATION': f'Token {token}'}
+        began = time.perf_counter()
+        if method == 'GET':
+            response = client.get(path, **kwargs)
+        else:
+            response = client.post(path, json.dumps(body or {}), content_type='application/json', **kwargs)
+        samples.setdefault(name, []).append((time.perf_counter() - began) * 1000)
+        # 404 em like/comment é esperado (ids sorteados podem não existir); 429 indica throttling
+        if response.status_code >= 500 or response.status_code == 429:
+            errors[name] = errors.get(name, 0) + 1
+    return _report(samples, errors, time.perf_counter() - start)
+
+
+def start_gunicorn(name, port, workers, env=None):
+    command = [
+        sys.executable, '-m', 'gunicorn', *SERVERS[name],
+        '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--log-level', 'warning',
+        '--access-logfile', os.devnull,
+    ]
+    process = subprocess.Popen(command, cwd=settings.BASE_DIR, env={**os.environ, **(env or {})})
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{name}: gunicorn saiu com código {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f'{name}: servidor não respondeu em 30s')
+
+
+def run_http(port, next_request, concurrency, duration):
+    """Clientes HTTP com keep-alive em threads até duration segundos.
+    next_request() devolve (cenário, token, método, caminho, corpo)."""
+    samples, errors = {}, {}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(_):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local, failed = {}, {}
+        while time.monotonic() < deadline:
+            with lock:
+                name, token, method, path, body = next_request()
+            headers = {'Authorization': f'Token {token}', 'Accept': 'application/json'}
+            payload = None
+            if body is not None:
+                payload = json.dumps(body)
+                headers['Content-Type'] = 'application/json'
+            began = time.perf_counter()
+            try:
+                connection.request(method, path, body=payload, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                if response.status >= 500 or response.status == 429:
+                    failed[name] = failed.get(name, 0) + 1
+            except (OSError, http.client.HTTPException):
+                failed[name] = failed.get(name, 0) + 1
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                continue
+            local.setdefault(name, []).append((time.perf_counter() - began) * 1000)
+        connection.close()
+        with lock:
+            for name, latencies in local.items():
+                samples.setdefault(name, []).extend(latencies)
+            for name, count in failed.items():
+                errors[name] = errors.get(name, 0) + count
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(client, range(concurrency)))
+    return _report(samples, errors, duration)
+
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(path, results, meta):
+    with open(path, 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=2, sort_keys=True)
+
+
+def compare(results, baseline, tolerance):
+    """Linhas (alvo, cenário, métrica, antes, agora, variação, piorou) e se houve regressão além da tolerância.
+    Latência é comparada por cenário; req/s só no total, já que por cenário depende do sorteio do mix."""
+    rows = []
+    regressed = False
+    for target, scenarios in results.items():
+        for name, current in scenarios.items():
+            previous = baseline.get('results', {}).get(target, {}).get(name)
+            if not previous:
+                continue
+            metrics = (('p95', True), ('p99', True), ('rps', False)) if name == 'total' else (('p95', True), ('p99', True))
+            for metric, higher_is_worse in metrics:
+                before, now = previous[metric], current[metric]
+                change = (now - before) / before if before else 0.0
+                worse = change > tolerance if higher_is_worse else change < -tolerance
+                regressed = regressed or worse
+                rows.append((target, name, metric, before, now, change, worse))
+    return rows, regressed
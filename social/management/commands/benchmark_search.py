@@ -0,0 +1,63 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from social import search
+from social.models import Post
+
+WORDS = (
+    'praia sol mar viagem cafe livro musica show futebol treino receita bolo cidade noite '
+    'trabalho projeto codigo python django foto cachorro gato filme serie jogo amigos'
+).split()
+
+
+class FakeRequest:
+    def __init__(self, params):
+        self.query_params = params
+
+
+class Command(BaseCommand):
+    help = 'Mede a latência da busca (p50/p95/p99) com consultas aleatórias.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='Cria N posts sintéticos antes de medir')
+        parser.add_argument('--queries', type=int, default=500)
+        parser.add_argument('--type', choices=['posts', 'users'], default='posts')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def seed(self, total, batch_size):
+        author, _ = get_user_model().objects.get_or_create(username='benchmark_search')
+        created = 0
+        while created < total:
+            size = min(batch_size, total - created)
+            with transaction.atomic():
+                Post.objects.bulk_create([
+                    Post(author=author, text=' '.join(random.choices(WORDS, k=random.randint(5, 30))))
+                    for _ in range(size)
+                ])
+            created += size
+            self.stdout.write(f'{created}/{total} posts criados')
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.seed(options['seed'], options['batch_size'])
+        timings = []
+        for _ in range(options['queries']):
+            words = random.sample(WORDS, random.randint(1, 2))
+            # Último termo truncado: exercita a busca por prefixo do autocomplete
+            words[-1] = words[-1][:random.randint(2, len(words[-1]))]
+            start = time.perf_counter()
+            search.search(options['type'], ' '.join(words), FakeRequest({}))
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+
+        def percentile(p):
+            return timings[min(len(timings) - 1, int(len(timings) * p))]
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(timings)} consultas: p50={percentile(0.50):.2f}ms "
+            f"p95={percentile(0.95):.2f}ms p99={percentile(0.99):.2f}ms"
+        ))
@@ -0,0 +1,52 @@
+import itertools
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from social import loadtest
+
+
+class Command(BaseCommand):
+    help = 'Sobe o gunicorn em modo WSGI (workers sync) e ASGI (uvicorn) e compara req/s e latência p99.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servers', default='wsgi,asgi')
+        parser.add_argument('--paths', default='/api/posts/,/api/feed/,/api/profile/')
+        parser.add_argument('--workers', type=int, default=2, help='Processos por servidor (iguais para os dois)')
+        parser.add_argument('--concurrency', type=int, default=64, help='Clientes simultâneos')
+        parser.add_argument('--duration', type=float, default=15.0, help='Segundos de carga por servidor')
+        parser.add_argument('--port', type=int, default=8765)
+
+    def token(self):
+        user, _ = get_user_model().objects.get_or_create(username='benchmark_http')
+        return Token.objects.get_or_create(user=user)[0].key
+
+    def handle(self, *args, **options):
+        paths = [path.strip() for path in options['paths'].split(',') if path.strip()]
+        token = self.token()
+        requests = itertools.cycle([('GET', token, 'GET', path, None) for path in paths])
+        results = {}
+        for offset, name in enumerate(options['servers'].split(',')):
+            if name not in loadtest.SERVERS:
+                raise CommandError(f'Servidor desconhecido: {name}')
+            port = options['port'] + offset
+            try:
+                process = loadtest.start_gunicorn(name, port, options['workers'])
+            except RuntimeError as e:
+                # Ex.: uvicorn-worker não instalado; os demais servidores continuam medidos
+                self.stderr.write(str(e))
+                continue
+            try:
+                # Aquecimento: imports, conexões e caches antes da medição
+                loadtest.run_http(port, requests.__next__, 4, 1.0)
+                results[name] = loadtest.run_http(port, requests.__next__, options['concurrency'], options['duration'])['GET']
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+        self.stdout.write(f"{'servidor':<8} {'reqs':>8} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'erros':>6}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<8} {result['requests']:>8} {result['rps']:>9.1f} "
+                f"{result['p50']:>9.2f} {result['p99']:>9.2f} {result['errors']:>6}"
+            )
@@ -0,0 +1,21 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from social import suggestions
+
+
+class Command(BaseCommand):
+    help = 'Recalcula o top-K de sugestões de cada usuário a partir do grafo de follows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Recalcula apenas para este usuário (id)')
+        parser.add_argument('--top-k', type=int, help='Tamanho da lista por usuário (padrão: SUGGESTIONS_TOP_K)')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if options['user']:
+            user = get_user_model().objects.get(id=options['user'])
+            total = suggestions.compute_for_user(user, options['top_k'])
+        else:
+            total = suggestions.compute_all(options['top_k'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'{total} sugestões gravadas'))
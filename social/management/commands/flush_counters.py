@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from social import counters
+
+
+class Command(BaseCommand):
+    help = 'Grava no banco os deltas de contadores pendentes no buffer write-behind.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reconcile', action='store_true', help='Recalcula os contadores a partir de PostAction e Comment')
+        parser.add_argument('--hot-scores', action='store_true', help='Recalcula hot_score de todos os posts')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        flushed = counters.flush()
+        self.stdout.write(f'{flushed} deltas gravados')
+        if options['reconcile']:
+            repaired = counters.reconcile(chunk_size=options['chunk_size'])
+            self.stdout.write(f'{repaired} posts reconciliados')
+        if options['hot_scores']:
+            total = counters.rebuild_hot_scores(chunk_size=options['chunk_size'])
+            self.stdout.write(f'{total} hot scores recalculados')
+        self.stdout.write(self.style.SUCCESS('Contadores atualizados'))
@@ -0,0 +1,94 @@
+import logging
+import os
+import platform
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.utils import timezone
+
+from social import loadtest
+
+
+class Command(BaseCommand):
+    help = (
+        'Carga mista (feed, perfil, like, comentário) pelo test client do Django e/ou por um gunicorn local. '
+        'Reporta req/s e p50/p95/p99 por cenário e compara com um baseline salvo.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--targets', default='client,wsgi', help='client, wsgi e/ou asgi, separados por vírgula')
+        parser.add_argument('--mix', default='', help='Pesos por cenário, ex.: feed=50,profile=20,like=20,comment=10')
+        parser.add_argument('--requests', type=int, default=2000, help='Requisições no test client')
+        parser.add_argument('--duration', type=float, default=15.0, help='Segundos de carga no gunicorn')
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--port', type=int, default=8775)
+        parser.add_argument('--users', type=int, default=50, help='Usuários (os que mais seguem) que geram a carga')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--baseline', default=os.path.join(settings.BASE_DIR, 'loadtest_baseline.json'))
+        parser.add_argument('--save-baseline', action='store_true', help='Grava este resultado como o novo baseline')
+        parser.add_argument('--tolerance', type=float, default=0.15, help='Piora relativa aceita antes de acusar regressão')
+        parser.add_argument('--fail-on-regression', action='store_true')
+        parser.add_argument('--throttle', action='store_true', help='Mantém o rate limiting (por padrão desligado na carga)')
+
+    def handle(self, *args, **options):
+        # Os logs DEBUG das views (um por requisição) distorcem a medição no test client
+        logging.getLogger('social').setLevel(logging.WARNING)
+        try:
+            mix = loadtest.parse_mix(options['mix'])
+            workload = loadtest.Workload(mix, users=options['users'], seed=options['seed'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        results = {}
+        for offset, target in enumerate(options['targets'].split(',')):
+            if target == 'client':
+                with override_settings(THROTTLE_ENABLED=options['throttle']):
+                    # Aquecimento antes da medição, como no gunicorn
+                    loadtest.run_client(workload, min(100, options['requests']))
+                    results[target] = loadtest.run_client(workload, options['requests'])
+                continue
+            if target not in loadtest.SERVERS:
+                raise CommandError(f'Alvo desconhecido: {target}')
+            port = options['port'] + offset
+            try:
+                process = loadtest.start_gunicorn(
+                    target, port, options['workers'], env={'THROTTLE_ENABLED': str(options['throttle']).lower()}
+                )
+            except RuntimeError as e:
+                self.stderr.write(str(e))
+                continue
+            try:
+                loadtest.run_http(port, workload.next, 4, 1.0)
+                results[target] = loadtest.run_http(port, workload.next, options['concurrency'], options['duration'])
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+
+        self.stdout.write(f"{'alvo':<7} {'cenário':<8} {'reqs':>7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'erros':>6}")
+        for target, scenarios in results.items():
+            for name, result in sorted(scenarios.items(), key=lambda item: (item[0] == 'total', item[0])):
+                self.stdout.write(
+                    f"{target:<7} {name:<8} {result['requests']:>7} {result['rps']:>9.1f} {result['p50']:>8.2f} "
+                    f"{result['p95']:>8.2f} {result['p99']:>8.2f} {result['errors']:>6}"
+                )
+
+        baseline = loadtest.load_baseline(options['baseline'])
+        regressed = False
+        if baseline:
+            rows, regressed = loadtest.compare(results, baseline, options['tolerance'])
+            self.stdout.write(f"\nComparação com o baseline de {baseline['meta'].get('saved_at', '?')}:")
+            for target, name, metric, before, now, change, worse in rows:
+                line = f'{target:<7} {name:<8} {metric:<4} {before:>9.2f} -> {now:>9.2f} ({change:+.1%})'
+                self.stdout.write(self.style.ERROR(line) if worse else line)
+        if options['save_baseline']:
+            loadtest.save_baseline(options['baseline'], results, {
+                'saved_at': timezone.now().isoformat(),
+                'mix': mix,
+                'python': platform.python_version(),
+                'database': settings.DATABASES['default']['ENGINE'],
+            })
+            self.stdout.write(self.style.SUCCESS(f"Baseline salvo em {options['baseline']}"))
+        if regressed and options['fail_on_regression']:
+            raise CommandError(f"Regressão acima de {options['tolerance']:.0%} em relação ao baseline")
@@ -0,0 +1,20 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from social import timeline
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói as home timelines materializadas a partir do grafo de follows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Reconstrói apenas a timeline deste usuário (id)')
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.order_by('id')
+        if options['user']:
+            users = users.filter(id=options['user'])
+        total = 0
+        for user in users.iterator(chunk_size=500):
+            total += timeline.rebuild(user)
+        self.stdout.write(self.style.SUCCESS(f'{total} entradas de timeline criadas'))
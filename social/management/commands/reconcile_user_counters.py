@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from social import counters
+
+
+class Command(BaseCommand):
+    help = 'Recalcula followers_count, following_count e posts_count dos usuários em lotes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        repaired = counters.reconcile_users(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'{repaired} usuários reconciliados'))
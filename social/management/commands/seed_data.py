@@ -0,0 +1,171 @@
+import bisect
+import contextlib
+import itertools
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from social import counters, timeline
+from social.models import Comment, Post, PostAction
+
+WORDS = (
+    'praia sol mar viagem cafe livro musica show futebol treino receita bolo cidade noite '
+    'trabalho projeto codigo python django foto cachorro gato filme serie jogo amigos'
+).split()
+ACTION_TYPES = ['like', 'like', 'like', 'repost', 'share']
+
+
+class Zipf:
+    """Amostra posições 0..n-1 com probabilidade proporcional a 1/(posição+1)^alpha."""
+
+    def __init__(self, n, alpha, rng):
+        self.rng = rng
+        self.cumulative = list(itertools.accumulate(1 / (rank + 1) ** alpha for rank in range(n)))
+
+    def sample(self):
+        return bisect.bisect_left(self.cumulative, self.rng.random() * self.cumulative[-1])
+
+
+@contextlib.contextmanager
+def explicit_timestamps(*models):
+    # bulk_create respeita auto_now/auto_now_add: desligados para gravar datas espalhadas no tempo
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera dados sintéticos em volume: usuários com grafo de follows em lei de potência (Zipf), '
+        'posts, comentários e PostActions. Depois recalcula contadores, hot scores e timelines.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--posts-per-user', type=float, default=20, help='Média (distribuição exponencial)')
+        parser.add_argument('--follows-per-user', type=float, default=50, help='Média (distribuição exponencial)')
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument('--actions', type=int, default=100000)
+        parser.add_argument('--alpha', type=float, default=1.1, help='Expoente Zipf de follows e engajamento')
+        parser.add_argument('--days', type=int, default=90, help='Janela de created_at dos posts')
+        parser.add_argument('--prefix', default='carga_', help='Prefixo dos usernames gerados')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=None, help='Semente do gerador (execuções reprodutíveis)')
+        parser.add_argument('--skip-timelines', action='store_true', help='Não reconstrói as timelines')
+
+    def log(self, message, started):
+        self.stdout.write(f'{message} ({time.monotonic() - started:.1f}s)')
+
+    def bulk(self, model, rows, batch_size, **kwargs):
+        total = 0
+        rows = iter(rows)
+        while batch := list(itertools.islice(rows, batch_size)):
+            with transaction.atomic(), explicit_timestamps(model):
+                model.objects.bulk_create(batch, batch_size=batch_size, **kwargs)
+            total += len(batch)
+        return total
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        User = get_user_model()
+        Follow = User.following.through
+        batch_size = options['batch_size']
+        now = timezone.now()
+        window = timedelta(days=options['days']).total_seconds()
+        started = time.monotonic()
+
+        def moment():
+            return now - timedelta(seconds=rng.random() * window)
+
+        def text(low=5, high=30):
+            return ' '.join(rng.choices(WORDS, k=rng.randint(low, high)))
+
+        # Hash calculado uma vez: make_password por usuário dominaria o tempo do seed
+        password = make_password('carga123')
+        offset = User.objects.filter(username__startswith=options['prefix']).count()
+        self.bulk(User, (
+            User(username=f"{options['prefix']}{offset + i}", password=password, bio=text(3, 12),
+                 date_joined=now - timedelta(seconds=window), updated_at=now)
+            for i in range(options['users'])
+        ), batch_size)
+        users = list(
+            User.objects.filter(username__startswith=options['prefix']).order_by('id').values_list('id', flat=True)[offset:]
+        )
+        self.log(f'{len(users)} usuários', started)
+
+        # Popularidade pela posição (sorteada): poucos usuários concentram a maior parte dos seguidores
+        ranking = users[:]
+        rng.shuffle(ranking)
+        popular = Zipf(len(ranking), options['alpha'], rng)
+
+        def follows():
+            for user_id in users:
+                targets = set()
+                wanted = min(len(users) - 1, int(rng.expovariate(1 / options['follows_per_user'])))
+                for _ in range(wanted * 2):
+                    if len(targets) >= wanted:
+                        break
+                    target = ranking[popular.sample()]
+                    if target != user_id:
+                        targets.add(target)
+                for target in targets:
+                    yield Follow(from_customuser_id=user_id, to_customuser_id=target)
+
+        total = self.bulk(Follow, follows(), batch_size, ignore_conflicts=True)
+        self.log(f'{total} follows', started)
+
+        def posts():
+            for user_id in users:
+                for _ in range(int(rng.expovariate(1 / options['posts_per_user']))):
+                    created_at = moment()
+                    yield Post(author_id=user_id, text=text(), created_at=created_at, updated_at=created_at)
+
+        last_id = Post.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        total = self.bulk(Post, posts(), batch_size)
+        post_ids = list(Post.objects.filter(id__gt=last_id, author_id__in=users).order_by('-created_at').values_list('id', flat=True))
+        self.log(f'{total} posts', started)
+        if not post_ids:
+            return
+
+        # Engajamento concentrado nos posts mais recentes (posição 0 = mais novo)
+        engaged = Zipf(len(post_ids), options['alpha'], rng)
+
+        def comments():
+            for _ in range(options['comments']):
+                yield Comment(post_id=post_ids[engaged.sample()], author_id=rng.choice(users),
+                              text=text(2, 15), created_at=moment())
+
+        def actions():
+            for _ in range(options['actions']):
+                yield PostAction(user_id=rng.choice(users), post_id=post_ids[engaged.sample()],
+                                 action_type=rng.choice(ACTION_TYPES), created_at=moment())
+
+        total = self.bulk(Comment, comments(), batch_size)
+        self.log(f'{total} comentários', started)
+        total = self.bulk(PostAction, actions(), batch_size, ignore_conflicts=True)
+        self.log(f'{total} ações sorteadas (duplicadas ignoradas)', started)
+
+        counters.reconcile(chunk_size=batch_size)
+        counters.reconcile_users(chunk_size=batch_size)
+        counters.rebuild_hot_scores(chunk_size=batch_size)
+        self.log('Contadores e hot scores recalculados', started)
+
+        if not options['skip_timelines']:
+            total = sum(timeline.rebuild(user) for user in User.objects.filter(id__in=users).iterator(chunk_size=500))
+            self.log(f'{total} entradas de timeline', started)
+        self.stdout.write(self.style.SUCCESS('Seed concluído'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from social import media
+
+
+class Command(BaseCommand):
+    help = 'Retoma uploads de imagem interrompidos e marca como failed os que se perderam (uma execução por vez, via cron).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--timeout', type=int, help='Segundos até um upload pending ser considerado parado (padrão: MEDIA_PENDING_TIMEOUT)')
+
+    def handle(self, *args, **options):
+        requeued, failed = media.sweep(options['timeout'])
+        self.stdout.write(self.style.SUCCESS(f'{requeued} uploads retomados, {failed} marcados como failed'))
@@ -0,0 +1,245 @@
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import cloudinary
+import cloudinary.uploader
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from django.utils.text import slugify
+
+from . import caching, images, metrics
+from .models import MEDIA_FAILED, MEDIA_PENDING, MEDIA_READY, CustomUser, Post
+
+logger = logging.getLogger(__name__)
+
+
+def sanitized_name(filename):
+    name, ext = os.path.splitext(filename)
+    return f"{slugify(name)}_{os.urandom(8).hex()}{ext.lower()}"
+
+
+class CloudinaryBackend:
+    def upload(self, path, folder, public_id):
+        current_timestamp = int(time.time())
+        logger.debug(f"Generated timestamp: {current_timestamp} for upload")
+        if current_timestamp < 1700000000:
+            raise ValueError('Timestamp inválido')
+        cloudinary.config(
+            cloud_name=os.getenv('CLOUDINARY_CLOUD_NAME'),
+            api_key=os.getenv('CLOUDINARY_API_KEY'),
+            api_secret=os.getenv('CLOUDINARY_API_SECRET')
+        )
+        upload_result = cloudinary.uploader.upload(
+            path,
+            folder=folder,
+            public_id=public_id,
+            overwrite=True,
+            timestamp=current_timestamp
+        )
+        return upload_result['secure_url']
+
+
+class LocalMediaBackend:
+    """Grava em MEDIA_ROOT. Permite testar o pipeline sem rede."""
+
+    def upload(self, path, folder, public_id):
+        directory = os.path.join(settings.MEDIA_ROOT, folder)
+        os.makedirs(directory, exist_ok=True)
+        shutil.copyfile(path, os.path.join(directory, public_id))
+        return f'{settings.MEDIA_URL}{folder}/{public_id}'
+
+
+def get_backend():
+    return import_string(settings.MEDIA_UPLOAD_BACKEND)()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.MEDIA_UPLOAD_WORKERS, thread_name_prefix='media-upload')
+    return _executor
+
+
+def spool_dir():
+    os.makedirs(settings.MEDIA_SPOOL_DIR, exist_ok=True)
+    return settings.MEDIA_SPOOL_DIR
+
+
+def spool(uploaded_file, folder, pk, public_id):
+    # O arquivo do request deixa de existir ao fim da resposta: copia para o spool. O nome
+    # identifica o registro, para que sweep retome o upload se o worker cair no meio
+    path = os.path.join(spool_dir(), f'{folder}__{pk}__{public_id}')
+    with open(path, 'wb') as spooled:
+        for chunk in uploaded_file.chunks():
+            spooled.write(chunk)
+    return path
+
+
+def parse_spool_name(name):
+    parts = name.split('__', 2)
+    if len(parts) != 3 or parts[0] not in TARGETS or not parts[1].isdigit():
+        return None
+    return parts[0], int(parts[1]), parts[2]
+
+
+def upload_with_retry(path, folder, public_id):
+    backend = get_backend()
+    attempts = settings.MEDIA_UPLOAD_RETRIES + 1
+    for attempt in range(attempts):
+        try:
+            with metrics.media_timer(type(backend).__name__):
+                return backend.upload(path, folder, public_id)
+        except Exception as e:
+            if attempt == attempts - 1:
+                raise
+            delay = settings.MEDIA_UPLOAD_BACKOFF * 2 ** attempt
+            logger.warning(f"Upload de {public_id} falhou ({e}), nova tentativa em {delay:.1f}s")
+            time.sleep(delay)
+
+
+def run_upload(path, folder, pk, public_id):
+    _, _, on_success, on_failure = TARGETS[folder]
+    variants = {}
+    try:
+        variants = images.render_variants(path)
+        base, _ = os.path.splitext(public_id)
+        ext = images.variant_extension()
+        urls = {
+            name: upload_with_retry(variant_path, folder, f'{base}_{name}{ext}')
+            for name, variant_path in variants.items()
+        }
+    except Exception as e:
+        logger.error(f"Upload de {public_id} falhou definitivamente: {e}")
+        on_failure(pk)
+    else:
+        on_success(pk, urls)
+        logger.debug(f"Upload concluído: {public_id} -> {urls}")
+    finally:
+        for temp_path in [path, *variants.values()]:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+
+
+def claim(folder, pk, before):
+    """Reivindica o upload de um registro pending: avança updated_at se ninguém o tocou
+    desde `before`. O UPDATE condicional é atômico, então só um entre o job da fila e o
+    sweep segue com o mesmo arquivo; False quer dizer que outro já o pegou."""
+    model, status_field, _, _ = TARGETS[folder]
+    pending = model.objects.filter(id=pk, updated_at__lte=before, **{status_field: MEDIA_PENDING})
+    return pending.update(updated_at=timezone.now()) == 1
+
+
+def _job(path, folder, pk, public_id, queued_at):
+    close_old_connections()
+    try:
+        # Job que esperou na fila além do timeout pode já ter sido retomado pelo sweep
+        if not claim(folder, pk, queued_at):
+            logger.debug(f"Upload de {public_id} já reivindicado, job descartado")
+            return
+        run_upload(path, folder, pk, public_id)
+    finally:
+        close_old_connections()
+
+
+def enqueue_upload(uploaded_file, folder, pk):
+    """Agenda o upload para depois do commit. MEDIA_UPLOAD_WORKERS=0 executa no próprio request."""
+    public_id = sanitized_name(uploaded_file.name)
+    path = spool(uploaded_file, folder, pk, public_id)
+    if not settings.MEDIA_UPLOAD_WORKERS:
+        transaction.on_commit(lambda: run_upload(path, folder, pk, public_id))
+    else:
+        transaction.on_commit(lambda: get_executor().submit(_job, path, folder, pk, public_id, timezone.now()))
+    return public_id
+
+
+def _update(model, pk, **fields):
+    model.objects.filter(id=pk).update(**fields, updated_at=timezone.now())
+    caching.invalidate(model._meta.model_name, [pk])
+
+
+def _post_image_ready(pk, urls):
+    _update(Post, pk, image=urls['full'], image_variants=urls, image_status=MEDIA_READY)
+
+
+def _post_image_failed(pk):
+    _update(Post, pk, image_status=MEDIA_FAILED)
+
+
+def _profile_picture_ready(pk, urls):
+    _update(
+        CustomUser, pk,
+        profile_picture=urls['full'], profile_picture_variants=urls, profile_picture_status=MEDIA_READY,
+    )
+
+
+def _profile_picture_failed(pk):
+    _update(CustomUser, pk, profile_picture_status=MEDIA_FAILED)
+
+
+# Pasta de destino -> (modelo, campo de status, sucesso, falha)
+TARGETS = {
+    'post_pics': (Post, 'image_status', _post_image_ready, _post_image_failed),
+    'profile_pics': (CustomUser, 'profile_picture_status', _profile_picture_ready, _profile_picture_failed),
+}
+
+
+def upload_post_image(post, image):
+    return enqueue_upload(image, 'post_pics', post.id)
+
+
+def upload_profile_picture(user, picture):
+    return enqueue_upload(picture, 'profile_pics', user.id)
+
+
+def sweep(timeout=None):
+    """Retoma uploads interrompidos (worker reiniciado ou caído no meio). Arquivos do spool
+    mais antigos que MEDIA_PENDING_TIMEOUT voltam ao pipeline se o registro segue pending e
+    parado (reivindicado via claim, para não correr com um job que ainda está na fila);
+    registros pending há mais tempo que isso e sem arquivo no spool (perdido com a máquina)
+    viram failed, para que o cliente peça um novo envio. Devolve (retomados, falhos)."""
+    timeout = settings.MEDIA_PENDING_TIMEOUT if timeout is None else timeout
+    cutoff = time.time() - timeout
+    stale = timezone.now() - timedelta(seconds=timeout)
+    spooled = set()
+    requeued = 0
+    for name in sorted(os.listdir(spool_dir())):
+        parsed = parse_spool_name(name)
+        if parsed is None:
+            continue
+        folder, pk, public_id = parsed
+        spooled.add((folder, pk))
+        path = os.path.join(settings.MEDIA_SPOOL_DIR, name)
+        if os.path.getmtime(path) > cutoff:
+            continue
+        if not claim(folder, pk, stale):
+            # Pending e tocado há pouco: o job da fila ou outro sweep está com ele
+            model, status_field, _, _ = TARGETS[folder]
+            if not model.objects.filter(id=pk, **{status_field: MEDIA_PENDING}).exists():
+                os.unlink(path)
+            continue
+        logger.warning(f"Upload interrompido de {public_id} retomado")
+        run_upload(path, folder, pk, public_id)
+        requeued += 1
+
+    failed = 0
+    for folder, (model, status_field, _, on_failure) in TARGETS.items():
+        pending = model.objects.filter(updated_at__lt=stale, **{status_field: MEDIA_PENDING})
+        for pk in pending.values_list('id', flat=True):
+            if (folder, pk) not in spooled:
+                logger.warning(f"Upload de {folder}/{pk} perdido: marcado como failed")
+                on_failure(pk)
+                failed += 1
+    return requeued, failed
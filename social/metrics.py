@@ -0,0 +1,237 @@
+import bisect
+import contextvars
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+# Métricas em memória do processo, expostas em /metrics no formato texto do Prometheus.
+# Com vários workers cada processo tem o próprio registro (o scrape vê um worker por vez).
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for label_values, (counts, total, count) in sorted(snapshot.items()):
+            labels = _labels(self.labels, label_values)
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += bucket_count
+                le = _labels(('le',), (bound,))
+                lines.append(f'{self.name}_bucket{{{labels + "," if labels else ""}{le}}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            snapshot = dict(self._values)
+        for label_values, value in sorted(snapshot.items()):
+            lines.append(f'{self.name}{{{_labels(self.labels, label_values)}}} {value}')
+        return lines
+
+
+def _labels(names, values):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+
+
+REQUESTS = Counter('zuppi_http_requests_total', 'Requisições por rota, método e status.', ('route', 'method', 'status'))
+REQUEST_DURATION = Histogram(
+    'zuppi_http_request_duration_seconds', 'Tempo de parede da requisição (até o primeiro byte em streaming).',
+    ('route', 'method'), LATENCY_BUCKETS,
+)
+RESPONSE_SIZE = Histogram('zuppi_http_response_size_bytes', 'Tamanho do corpo da resposta.', ('route',), SIZE_BUCKETS)
+DB_QUERIES = Histogram('zuppi_db_queries_per_request', 'Consultas por requisição (amostrado).', ('route',), QUERY_BUCKETS)
+DB_DURATION = Histogram('zuppi_db_duration_seconds', 'Tempo em banco por requisição (amostrado).', ('route',), LATENCY_BUCKETS)
+MEDIA_DURATION = Histogram(
+    'zuppi_media_upload_duration_seconds', 'Duração de cada chamada ao backend de mídia (Cloudinary).',
+    ('backend', 'outcome'), LATENCY_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    'zuppi_cache_requests_total', 'Leituras do cache em dois níveis (social/caching.py) por namespace e resultado.',
+    ('namespace', 'result'),
+)
+CACHE_EVICTIONS = Counter('zuppi_cache_l1_evictions_total', 'Entradas removidas do L1 por falta de espaço.', ())
+DB_READ_ROUTES = Counter(
+    'zuppi_db_read_routes_total', 'Leituras roteadas por banco e motivo (replica, pinned, failover).',
+    ('database', 'reason'),
+)
+REGISTRY = [
+    REQUESTS, REQUEST_DURATION, RESPONSE_SIZE, DB_QUERIES, DB_DURATION, MEDIA_DURATION, CACHE_REQUESTS, CACHE_EVICTIONS,
+    DB_READ_ROUTES,
+]
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_time', 'media_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.media_time = 0.0
+
+
+# Requisição amostrada em andamento. ContextVar passa pelo sync_to_async, então as consultas
+# feitas nas threads do ORM assíncrono também são contadas.
+_current = contextvars.ContextVar('request_stats', default=None)
+
+
+def query_timer(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_time += time.perf_counter() - start
+
+
+def install_query_timer(sender, connection, **kwargs):
+    # connection_created: vale para toda conexão, em qualquer thread
+    if query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_timer)
+
+
+@contextmanager
+def media_timer(backend):
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        elapsed = time.perf_counter() - start
+        MEDIA_DURATION.observe(elapsed, backend, outcome)
+        stats = _current.get()
+        if stats is not None:
+            stats.media_time += elapsed
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else 'unmatched'
+
+
+def server_timing(total, stats):
+    parts = [f'app;dur={total * 1000:.1f}', f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries"']
+    if stats.media_time:
+        parts.append(f'media;dur={stats.media_time * 1000:.1f}')
+    return ', '.join(parts)
+
+
+class MetricsMiddleware:
+    """Mede cada requisição por rota (nome em social/urls.py): tempo de parede, status e
+    tamanho da resposta. Uma fração METRICS_SAMPLE_RATE das requisições também mede
+    consultas, tempo de banco e de mídia, devolvidos no header Server-Timing."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, token, start = self.begin()
+        try:
+            response = self.get_response(request)
+        finally:
+            if token is not None:
+                _current.reset(token)
+        return self.finish(request, response, stats, start)
+
+    async def __acall__(self, request):
+        stats, token, start = self.begin()
+        try:
+            response = await self.get_response(request)
+        finally:
+            if token is not None:
+                _current.reset(token)
+        return self.finish(request, response, stats, start)
+
+    def begin(self):
+        stats = token = None
+        if random.random() < settings.METRICS_SAMPLE_RATE:
+            stats = RequestStats()
+            token = _current.set(stats)
+        return stats, token, time.perf_counter()
+
+    def finish(self, request, response, stats, start):
+        elapsed = time.perf_counter() - start
+        route = route_name(request)
+        REQUESTS.inc(route, request.method, response.status_code)
+        REQUEST_DURATION.observe(elapsed, route, request.method)
+        if not response.streaming:
+            RESPONSE_SIZE.observe(len(response.content), route)
+        if stats is not None:
+            DB_QUERIES.observe(stats.queries, route)
+            DB_DURATION.observe(stats.db_time, route)
+            response['Server-Timing'] = server_timing(elapsed, stats)
+        return response
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    # Sem METRICS_TOKEN o endpoint só existe em desenvolvimento
+    token = settings.METRICS_TOKEN
+    if token:
+        if request.headers.get('Authorization') != f'Bearer {token}':
+            return HttpResponse(status=401)
+    elif not settings.DEBUG:
+        raise Http404
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.4 on 2026-10-17 00:58
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    CustomUser = apps.get_model('social', 'CustomUser')
+    Post = apps.get_model('social', 'Post')
+    Follow = CustomUser._meta.get_field('following').remote_field.through
+
+    def total(queryset, field):
+        counted = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(n=Count('*')).values('n')
+        return Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+
+    CustomUser.objects.update(
+        followers_count=total(Follow.objects.all(), 'to_customuser'),
+        following_count=total(Follow.objects.all(), 'from_customuser'),
+        posts_count=total(Post.objects.all(), 'author'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social', '0006_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
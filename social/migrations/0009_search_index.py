@@ -0,0 +1,67 @@
+from django.db import migrations
+
+SQLITE_FORWARD = [
+    # Índices FTS5 de conteúdo externo: o texto fica só nas tabelas originais
+    "CREATE VIRTUAL TABLE social_post_fts USING fts5("
+    "text, content='social_post', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER social_post_fts_ai AFTER INSERT ON social_post BEGIN "
+    "INSERT INTO social_post_fts(rowid, text) VALUES (new.id, new.text); END",
+    "CREATE TRIGGER social_post_fts_ad AFTER DELETE ON social_post BEGIN "
+    "INSERT INTO social_post_fts(social_post_fts, rowid, text) VALUES ('delete', old.id, old.text); END",
+    "CREATE TRIGGER social_post_fts_au AFTER UPDATE OF text ON social_post BEGIN "
+    "INSERT INTO social_post_fts(social_post_fts, rowid, text) VALUES ('delete', old.id, old.text); "
+    "INSERT INTO social_post_fts(rowid, text) VALUES (new.id, new.text); END",
+    "INSERT INTO social_post_fts(social_post_fts) VALUES ('rebuild')",
+    "CREATE VIRTUAL TABLE social_user_fts USING fts5("
+    "username, bio, content='social_customuser', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER social_user_fts_ai AFTER INSERT ON social_customuser BEGIN "
+    "INSERT INTO social_user_fts(rowid, username, bio) VALUES (new.id, new.username, new.bio); END",
+    "CREATE TRIGGER social_user_fts_ad AFTER DELETE ON social_customuser BEGIN "
+    "INSERT INTO social_user_fts(social_user_fts, rowid, username, bio) VALUES ('delete', old.id, old.username, old.bio); END",
+    "CREATE TRIGGER social_user_fts_au AFTER UPDATE OF username, bio ON social_customuser BEGIN "
+    "INSERT INTO social_user_fts(social_user_fts, rowid, username, bio) VALUES ('delete', old.id, old.username, old.bio); "
+    "INSERT INTO social_user_fts(rowid, username, bio) VALUES (new.id, new.username, new.bio); END",
+    "INSERT INTO social_user_fts(social_user_fts) VALUES ('rebuild')",
+]
+SQLITE_REVERSE = [
+    'DROP TRIGGER IF EXISTS social_post_fts_ai',
+    'DROP TRIGGER IF EXISTS social_post_fts_ad',
+    'DROP TRIGGER IF EXISTS social_post_fts_au',
+    'DROP TABLE IF EXISTS social_post_fts',
+    'DROP TRIGGER IF EXISTS social_user_fts_ai',
+    'DROP TRIGGER IF EXISTS social_user_fts_ad',
+    'DROP TRIGGER IF EXISTS social_user_fts_au',
+    'DROP TABLE IF EXISTS social_user_fts',
+]
+
+# Índices GIN de expressão: o PostgreSQL os mantém a cada INSERT/UPDATE
+POSTGRES_FORWARD = [
+    "CREATE INDEX post_text_search_idx ON social_post USING GIN (to_tsvector('simple', text))",
+    "CREATE INDEX user_search_idx ON social_customuser USING GIN "
+    "(to_tsvector('simple', username || ' ' || coalesce(bio, '')))",
+]
+POSTGRES_REVERSE = [
+    'DROP INDEX IF EXISTS post_text_search_idx',
+    'DROP INDEX IF EXISTS user_search_idx',
+]
+
+
+def run(statements_by_vendor):
+    def operation(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social', '0008_user_suggestions'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            run({'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRES_REVERSE}),
+        ),
+    ]
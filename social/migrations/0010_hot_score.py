@@ -0,0 +1,37 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:03
+
+from django.db import migrations, models
+
+from social import ranking
+
+
+def backfill_hot_scores(apps, schema_editor):
+    Post = apps.get_model('social', 'Post')
+    batch = []
+    for post in Post.objects.only('id', 'created_at', *ranking.HOT_WEIGHTS).iterator(chunk_size=1000):
+        post.hot_score = ranking.hot_score({field: getattr(post, field) for field in ranking.HOT_WEIGHTS}, post.created_at)
+        batch.append(post)
+        if len(batch) >= 1000:
+            Post.objects.bulk_update(batch, ['hot_score'])
+            batch = []
+    Post.objects.bulk_update(batch, ['hot_score'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social', '0009_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='hot_score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(backfill_hot_scores, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-hot_score', '-id'], name='post_hot_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def populate_timelines(apps, schema_editor):
+    # Mesmo resultado de rebuild_timelines para os follows anteriores à timeline materializada:
+    # os TIMELINE_BACKFILL_SIZE posts mais recentes de cada autor seguido, exceto os de alto
+    # fan-out, que são mesclados na leitura. Entradas já existentes são mantidas
+    CustomUser = apps.get_model('social', 'CustomUser')
+    Post = apps.get_model('social', 'Post')
+    TimelineEntry = apps.get_model('social', 'TimelineEntry')
+    Follow = CustomUser.following.through
+    authors = (
+        CustomUser.objects.filter(followers_count__gt=0, followers_count__lte=settings.TIMELINE_FANOUT_THRESHOLD)
+        .values_list('id', flat=True)
+    )
+    for author_id in authors.iterator(chunk_size=BATCH_SIZE):
+        recent = list(
+            Post.objects.filter(author_id=author_id)
+            .order_by('-created_at', '-id')
+            .values_list('id', 'created_at')[:settings.TIMELINE_BACKFILL_SIZE]
+        )
+        if not recent:
+            continue
+        followers = Follow.objects.filter(to_customuser_id=author_id).values_list('from_customuser_id', flat=True)
+        entries = []
+        for user_id in followers.iterator(chunk_size=BATCH_SIZE):
+            entries.extend(
+                TimelineEntry(user_id=user_id, post_id=post_id, author_id=author_id, created_at=created_at)
+                for post_id, created_at in recent
+            )
+            if len(entries) >= BATCH_SIZE:
+                TimelineEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE, ignore_conflicts=True)
+                entries = []
+        TimelineEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social', '0011_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_timelines, migrations.RunPython.noop),
+    ]
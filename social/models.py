@@ -1,13 +1,34 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
+from django.utils import timezone
+
+from . import ranking
+
+# Estado do upload assíncrono de imagens (social/media.py)
+MEDIA_PENDING = 'pending'
+MEDIA_READY = 'ready'
+MEDIA_FAILED = 'failed'
+MEDIA_STATUS_CHOICES = [
+    (MEDIA_PENDING, 'Pending'),
+    (MEDIA_READY, 'Ready'),
+    (MEDIA_FAILED, 'Failed'),
+]
 
 class CustomUser(AbstractUser):
     bio = models.TextField(blank=True, null=True)
     location = models.CharField(max_length=100, blank=True, null=True)
     profile_picture = models.URLField(blank=True, null=True)
+    profile_picture_status = models.CharField(max_length=10, choices=MEDIA_STATUS_CHOICES, default=MEDIA_READY)
+    profile_picture_variants = models.JSONField(default=dict, blank=True)  # thumb/feed/full -> URL
     cover_image = models.URLField(blank=True, null=True)
     following = models.ManyToManyField('self', symmetrical=False, blank=True, related_name='followers_set')
+    # Contadores mantidos por FollowUser/PostCreate; reparados por reconcile_user_counters
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    posts_count = models.PositiveIntegerField(default=0)
+    # Carimbo de versão do perfil (inclui os contadores): validador do GET condicional
+    updated_at = models.DateTimeField(auto_now=True)
 
     groups = models.ManyToManyField(
         'auth.Group',
@@ -20,6 +41,12 @@ class CustomUser(AbstractUser):
         blank=True,
     )
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Sugestões de fallback (usuários mais seguidos)
+            models.Index(fields=['-followers_count', 'id'], name='user_popular_idx'),
+        ]
+
     def __str__(self):
         return self.username
 
@@ -27,11 +54,32 @@ class Post(models.Model):
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='posts')
     text = models.TextField()
     image = models.URLField(blank=True, null=True)
+    image_status = models.CharField(max_length=10, choices=MEDIA_STATUS_CHOICES, default=MEDIA_READY)
+    image_variants = models.JSONField(default=dict, blank=True)  # thumb/feed/full -> URL
     created_at = models.DateTimeField(auto_now_add=True)
     likes_count = models.PositiveIntegerField(default=0)
     reposts_count = models.PositiveIntegerField(default=0)
     comments_count = models.PositiveIntegerField(default=0)
     shares_count = models.PositiveIntegerField(default=0)
+    hot_score = models.FloatField(default=0)  # ranking.hot_score, atualizado junto com os contadores
+    # Carimbo de versão: muda com o texto, a imagem e os contadores (GET condicional)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Listas paginadas por (created_at, id): geral e por autor (perfil, fan-out, timeline)
+            models.Index(fields=['-created_at', '-id'], name='post_recent_idx'),
+            models.Index(fields=['author', '-created_at', '-id'], name='post_author_recent_idx'),
+            models.Index(fields=['-hot_score', '-id'], name='post_hot_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and not self.hot_score:
+            self.hot_score = ranking.hot_score(
+                {field: getattr(self, field) for field in ranking.HOT_WEIGHTS},
+                self.created_at or timezone.now(),
+            )
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f'{self.author.username}: {self.text[:20]}'
@@ -42,6 +90,11 @@ class Comment(models.Model):
     text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', '-created_at'], name='comment_post_recent_idx'),
+        ]
+
     def __str__(self):
         return f'{self.author.username} commented on {self.post.id}: {self.text[:20]}'
 
@@ -62,4 +115,46 @@ class PostAction(models.Model):
         unique_together = ('user', 'post', 'action_type')
 
     def __str__(self):
-        return f'{self.user.username} {self.action_type} on {self.post.id}'
\ No newline at end of file
+        return f'{self.user.username} {self.action_type} on {self.post.id}'
+
+class TimelineEntry(models.Model):
+    # Timeline materializada (fan-out na escrita): uma linha por post de quem o usuário segue
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField()  # cópia de post.created_at para a varredura por intervalo
+
+    class Meta:
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-post'], name='timeline_user_recent_idx'),
+            models.Index(fields=['user', 'author'], name='timeline_user_author_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} <- {self.post_id}'
+
+class CounterFlush(models.Model):
+    # Lotes de contadores já aplicados: torna o flush write-behind idempotente após um crash
+    batch_id = models.CharField(max_length=32, unique=True)
+    applied_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.batch_id
+
+class UserSuggestion(models.Model):
+    # Top-K de sugestões pré-calculado por compute_suggestions (amigos de amigos + atividade)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='suggestions')
+    candidate = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    mutual_count = models.PositiveIntegerField(default=0)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'candidate')
+        indexes = [
+            models.Index(fields=['user', '-score', '-candidate'], name='suggestion_user_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} -> {self.candidate_id} ({self.score:.2f})'
@@ -0,0 +1,196 @@
+import base64
+import datetime
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import ParseError
+
+
+def _cursor_value(value):
+    # isoformat() mantém os microssegundos, que o DjangoJSONEncoder truncaria
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(values, direction='next'):
+    values = [_cursor_value(value) for value in values]
+    payload = json.dumps({'v': values, 'd': direction}, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        values, direction = payload['v'], payload['d']
+    except (ValueError, KeyError, TypeError):
+        raise ParseError('Cursor inválido')
+    if direction not in ('next', 'prev') or not isinstance(values, list):
+        raise ParseError('Cursor inválido')
+    return values, direction
+
+
+def get_page_size(request, max_size=None):
+    max_size = max_size or settings.POSTS_MAX_PAGE_SIZE
+    raw = request.query_params.get('limit')
+    if raw is None:
+        return min(settings.POSTS_PAGE_SIZE, max_size)
+    try:
+        size = int(raw)
+    except ValueError:
+        raise ParseError('Parâmetro limit inválido')
+    return max(1, min(size, max_size))
+
+
+class CursorPaginator:
+    """Paginação por keyset sobre uma ordenação descendente (ex.: created_at, id).
+
+    Cada página é uma única consulta de intervalo no índice da ordenação,
+    independente do tamanho da tabela.
+    """
+
+    def __init__(self, fields=('created_at', 'id'), max_page_size=None):
+        self.fields = tuple(fields)
+        self.max_page_size = max_page_size
+
+    def parse(self, request, model, max_page_size=None):
+        token = request.query_params.get('cursor')
+        limit = get_page_size(request, max_page_size or self.max_page_size)
+        if not token:
+            return None, 'next', limit
+        values, direction = decode_cursor(token)
+        if len(values) != len(self.fields):
+            raise ParseError('Cursor inválido')
+        try:
+            position = tuple(
+                model._meta.get_field(name).to_python(value)
+                for name, value in zip(self.fields, values)
+            )
+        except Exception:
+            raise ParseError('Cursor inválido')
+        return position, direction, limit
+
+    def _seek(self, position, direction):
+        # Expande (a, b) < (x, y) em a < x OR (a = x AND b < y). O limite redundante
+        # a <= x dá ao banco o ponto de partida da busca no índice composto.
+        lookup = 'lt' if direction == 'next' else 'gt'
+        condition = Q()
+        for i, name in enumerate(self.fields):
+            clause = Q(**{f'{name}__{lookup}': position[i]})
+            for prev_name, prev_value in zip(self.fields[:i], position[:i]):
+                clause &= Q(**{prev_name: prev_value})
+            condition |= clause
+        return Q(**{f'{self.fields[0]}__{lookup}e': position[0]}) & condition
+
+    def window(self, queryset, position, direction, limit):
+        if direction == 'next':
+            ordering = [f'-{name}' for name in self.fields]
+        else:
+            ordering = list(self.fields)
+        if position is not None:
+            queryset = queryset.filter(self._seek(position, direction))
+        return queryset.order_by(*ordering)[:limit + 1]
+
+    def key(self, item):
+        if isinstance(item, dict):
+            return tuple(item[name] for name in self.fields)
+        return tuple(getattr(item, name) for name in self.fields)
+
+    def page(self, rows, position, direction, limit):
+        rows = list(rows)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if direction == 'prev':
+            rows.reverse()
+            has_next = position is not None
+            has_prev = has_more
+        else:
+            has_next = has_more
+            has_prev = position is not None
+        next_cursor = encode_cursor(self.key(rows[-1]), 'next') if rows and has_next else None
+        prev_cursor = encode_cursor(self.key(rows[0]), 'prev') if rows and has_prev else None
+        return rows, next_cursor, prev_cursor
+
+    def paginate(self, queryset, request):
+        position, direction, limit = self.parse(request, queryset.model)
+        rows = self.window(queryset, position, direction, limit)
+        return self.page(rows, position, direction, limit)
+
+    async def apaginate(self, queryset, request):
+        position, direction, limit = self.parse(request, queryset.model)
+        rows = [row async for row in self.window(queryset, position, direction, limit)]
+        return self.page(rows, position, direction, limit)
+
+    def _stream_state(self, queryset, request):
+        position, direction, limit = self.parse(request, queryset.model, settings.STREAMING_MAX_PAGE_SIZE)
+        return self.window(queryset, position, direction, limit), position, direction, limit
+
+    def _stream_cursors(self, cursors, first, last, count, position, limit):
+        if last is not None:
+            cursors['next'] = encode_cursor(self.key(last), 'next') if count > limit else None
+            cursors['prev'] = encode_cursor(self.key(first), 'prev') if position is not None else None
+
+    def stream(self, queryset, request, chunk_size):
+        """Como paginate, mas entrega a página em lotes lidos com iterator(chunk_size).
+
+        Devolve (lotes, cursores): cursores() só pode ser chamado depois de consumir os
+        lotes. Na direção 'prev' a página é lida invertida e precisa ser materializada.
+        O limite de página sobe para STREAMING_MAX_PAGE_SIZE."""
+        rows, position, direction, limit = self._stream_state(queryset, request)
+        cursors = {'next': None, 'prev': None}
+
+        def chunks():
+            if direction == 'prev':
+                page, cursors['next'], cursors['prev'] = self.page(rows, position, direction, limit)
+                for start in range(0, len(page), chunk_size):
+                    yield page[start:start + chunk_size]
+                return
+            batch, first, last, count = [], None, None, 0
+            for row in rows.iterator(chunk_size=chunk_size):
+                count += 1
+                if count > limit:
+                    break
+                first = first or row
+                last = row
+                batch.append(row)
+                if len(batch) == chunk_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+            self._stream_cursors(cursors, first, last, count, position, limit)
+
+        return chunks(), lambda: dict(cursors)
+
+    def astream(self, queryset, request, chunk_size):
+        """Versão assíncrona de stream(): os lotes vêm de um gerador assíncrono (aiterator)."""
+        rows, position, direction, limit = self._stream_state(queryset, request)
+        cursors = {'next': None, 'prev': None}
+
+        async def chunks():
+            if direction == 'prev':
+                page, cursors['next'], cursors['prev'] = self.page(
+                    [row async for row in rows], position, direction, limit
+                )
+                for start in range(0, len(page), chunk_size):
+                    yield page[start:start + chunk_size]
+                return
+            batch, first, last, count = [], None, None, 0
+            async for row in rows.aiterator(chunk_size=chunk_size):
+                count += 1
+                if count > limit:
+                    break
+                first = first or row
+                last = row
+                batch.append(row)
+                if len(batch) == chunk_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+            self._stream_cursors(cursors, first, last, count, position, limit)
+
+        return chunks(), lambda: dict(cursors)
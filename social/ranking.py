@@ -0,0 +1,48 @@
+import math
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db.models import F, Value
+from django.db.models.functions import Log
+
+# Peso de cada interação no engajamento do post
+HOT_WEIGHTS = {
+    'likes_count': 1,
+    'reposts_count': 3,
+    'comments_count': 2,
+    'shares_count': 2,
+}
+HOT_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def engagement(counts):
+    return sum(weight * (counts.get(field) or 0) for field, weight in HOT_WEIGHTS.items())
+
+
+def hot_score(counts, created_at):
+    """Score com decaimento no tempo: log10(1 + engajamento) mais a idade em unidades de
+    HOT_SCORE_DECAY segundos. Cada HOT_SCORE_DECAY de atraso equivale a 10x menos
+    engajamento. O score só muda quando um contador muda, por isso pode ser indexado."""
+    age = (created_at - HOT_EPOCH).total_seconds()
+    return math.log10(1 + engagement(counts)) + age / settings.HOT_SCORE_DECAY
+
+
+# O termo da idade não muda depois da criação: quando os contadores mudam, hot_score muda só
+# em log10(1 + engajamento). As versões abaixo trocam esse termo no próprio UPDATE dos
+# contadores, lendo os valores antigos das colunas (o lado direito do SET vê a linha antiga).
+# Partem de um hot_score coerente com os contadores; rebuild_hot_scores recalcula do zero.
+
+
+def hot_score_update(counts):
+    """Expressão do novo hot_score para um update(), dadas as expressões dos contadores
+    que mudam ({campo: expressão}); os demais campos ficam como estão."""
+    old = sum((weight * F(field) for field, weight in HOT_WEIGHTS.items()), Value(1))
+    new = sum((weight * counts.get(field, F(field)) for field, weight in HOT_WEIGHTS.items()), Value(1))
+    return F('hot_score') - Log(10, old) + Log(10, new)
+
+
+def hot_score_sql(qn, field, value):
+    """O mesmo em SQL, para UPDATEs escritos à mão: value é o SQL do novo valor de field."""
+    def total(new):
+        return ' + '.join(f'{weight} * {new if name == field else qn(name)}' for name, weight in HOT_WEIGHTS.items())
+    return f'{qn("hot_score")} - LOG(10, 1 + {total(qn(field))}) + LOG(10, 1 + {total(f"({value})")})'
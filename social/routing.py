@@ -0,0 +1,261 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.recorder import MigrationRecorder
+from rest_framework.permissions import SAFE_METHODS
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Réplicas de leitura. As views de leitura marcadas (ReplicaReadMixin, read_replica nas
+# views assíncronas) leem de uma réplica saudável; escritas e todo o resto vão ao primário.
+# Quem escreveu fica no primário por DATABASE_STICKY_SECONDS (marca no cache compartilhado,
+# vale entre workers), para ler as próprias escritas apesar do atraso da replicação.
+
+# Atraso da réplica em segundos, por vendor. Zero quando tudo o que foi recebido já foi
+# aplicado: sem escritas no primário, o último replay envelhece sem haver atraso.
+LAG_QUERIES = {
+    'postgresql': (
+        'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+        'ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END'
+    ),
+}
+
+
+class RoutingState:
+    """Banco de leitura escolhido para a requisição e se ela já escreveu."""
+
+    def __init__(self):
+        self.read_alias = None
+        self.wrote = False
+
+
+_state = ContextVar('db_routing', default=None)
+
+
+def pin_key(user_id):
+    return f'dbpin:{user_id}'
+
+
+def pinned(user_id):
+    return caches[settings.DATABASE_PIN_CACHE].get(pin_key(user_id)) is not None
+
+
+def pin(user_id):
+    if settings.DATABASE_STICKY_SECONDS:
+        caches[settings.DATABASE_PIN_CACHE].set(pin_key(user_id), 1, settings.DATABASE_STICKY_SECONDS)
+
+
+_leaf_migrations = None
+
+
+def leaf_migrations():
+    """Últimas migrations de cada app no código em execução, lidas uma vez por processo."""
+    global _leaf_migrations
+    if _leaf_migrations is None:
+        _leaf_migrations = set(MigrationLoader(None, ignore_no_migrations=True).graph.leaf_nodes())
+    return _leaf_migrations
+
+
+class ReplicaHealth:
+    """Estado das réplicas por processo, reavaliado a cada DATABASE_REPLICA_CHECK_INTERVAL:
+    uma réplica fora do ar, sem as migrations do código ou atrasada além de
+    DATABASE_REPLICA_MAX_LAG sai da rotação.
+
+    Só a primeira verificação de cada réplica é feita na requisição (limitada pelo
+    connect_timeout); as seguintes rodam numa thread, e enquanto isso vale o último estado."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked = {}
+        self._probing = set()
+
+    def check(self, connection):
+        """(saudável, motivo) para a conexão. Uma réplica vazia ou ainda sem o schema
+        responderia a qualquer SELECT 1; a tabela de migrations mostra que tem o schema."""
+        if not leaf_migrations() <= set(MigrationRecorder(connection).applied_migrations()):
+            return False, 'migrations do código não aplicadas'
+        sql = LAG_QUERIES.get(connection.vendor)
+        if sql is None:
+            return True, None
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+            lag = float(cursor.fetchone()[0] or 0)
+        if lag > settings.DATABASE_REPLICA_MAX_LAG:
+            return False, f'atrasada {lag:.1f}s'
+        return True, None
+
+    def probe(self, alias):
+        try:
+            healthy, reason = self.check(connections[alias])
+        except Exception as e:
+            logger.warning(f"Réplica {alias} indisponível: {e}")
+            return False
+        if not healthy:
+            logger.warning(f"Réplica {alias} {reason}: leituras no primário")
+        return healthy
+
+    def refresh(self, alias):
+        try:
+            healthy = self.probe(alias)
+            with self._lock:
+                checked = self._checked.get(alias)
+                self._checked[alias] = (healthy, time.monotonic())
+            if checked is not None and checked[0] != healthy:
+                logger.info(f"Réplica {alias} {'de volta à rotação' if healthy else 'fora da rotação'}")
+        finally:
+            with self._lock:
+                self._probing.discard(alias)
+            if alias in connections:
+                # Conexão da thread da verificação: sem isso ficaria aberta até o fim do processo
+                connections[alias].close()
+
+    def healthy(self, alias, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            checked = self._checked.get(alias)
+            if checked is not None and now - checked[1] < settings.DATABASE_REPLICA_CHECK_INTERVAL:
+                return checked[0]
+            if checked is not None:
+                if alias not in self._probing:
+                    self._probing.add(alias)
+                    threading.Thread(target=self.refresh, args=(alias,), daemon=True).start()
+                return checked[0]
+        healthy = self.probe(alias)
+        with self._lock:
+            self._checked[alias] = (healthy, now)
+        return healthy
+
+
+_health = None
+_health_lock = threading.Lock()
+
+
+def get_health():
+    global _health
+    if _health is None:
+        with _health_lock:
+            if _health is None:
+                _health = ReplicaHealth()
+    return _health
+
+
+def enabled():
+    return bool(settings.DATABASE_REPLICAS)
+
+
+def route_reads(request):
+    """Depois da autenticação: leituras da requisição numa réplica saudável, salvo para
+    usuários com escrita recente. Sem RoutingMiddleware (estado) tudo fica no primário."""
+    state = _state.get()
+    if state is None or not enabled() or request.method not in SAFE_METHODS:
+        return
+    user = request.user
+    if user.is_authenticated and pinned(user.pk):
+        metrics.DB_READ_ROUTES.inc(DEFAULT_DB_ALIAS, 'pinned')
+        return
+    health = get_health()
+    replicas = [alias for alias in settings.DATABASE_REPLICAS if health.healthy(alias)]
+    if not replicas:
+        metrics.DB_READ_ROUTES.inc(DEFAULT_DB_ALIAS, 'failover')
+        return
+    state.read_alias = random.choice(replicas)
+    metrics.DB_READ_ROUTES.inc(state.read_alias, 'replica')
+
+
+@contextmanager
+def primary():
+    """Leituras do bloco no primário, mesmo numa requisição roteada para réplica."""
+    state = _state.get()
+    if state is None or state.read_alias is None:
+        yield
+        return
+    alias, state.read_alias = state.read_alias, None
+    try:
+        yield
+    finally:
+        state.read_alias = alias
+
+
+class ReplicaReadMixin:
+    """Para views DRF de leitura: GETs vão à réplica (ver route_reads)."""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        route_reads(request)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.wrote:
+            return None
+        return state.read_alias
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            # Depois de escrever, a própria requisição também lê do primário
+            state.wrote = True
+        # Explícito: sem isso o Django escreveria no banco de onde a instância foi lida
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class RoutingMiddleware:
+    """Estado de roteamento por requisição. Ao fim, quem escreveu é fixado no primário.
+    Corpos em streaming consumidos depois da resposta leem do primário."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        self.finish(request, state)
+        return response
+
+    async def __acall__(self, request):
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote and enabled():
+            # request.user pode ser o usuário da sessão, ainda não carregado
+            await sync_to_async(self.finish)(request, state)
+        return response
+
+    def finish(self, request, state):
+        if not state.wrote or not enabled():
+            return
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            pin(user.pk)
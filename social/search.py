@@ -0,0 +1,163 @@
+import logging
+import re
+
+from django.conf import settings
+from django.db import connections, router
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import ParseError
+
+from .models import CustomUser, Post
+from .pagination import decode_cursor, encode_cursor, get_page_size
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Reinstalados após cada migrate: o SQLite recria a tabela em alguns ALTERs e descarta os triggers
+SQLITE_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS social_post_fts_ai AFTER INSERT ON social_post BEGIN "
+    "INSERT INTO social_post_fts(rowid, text) VALUES (new.id, new.text); END",
+    "CREATE TRIGGER IF NOT EXISTS social_post_fts_ad AFTER DELETE ON social_post BEGIN "
+    "INSERT INTO social_post_fts(social_post_fts, rowid, text) VALUES ('delete', old.id, old.text); END",
+    "CREATE TRIGGER IF NOT EXISTS social_post_fts_au AFTER UPDATE OF text ON social_post BEGIN "
+    "INSERT INTO social_post_fts(social_post_fts, rowid, text) VALUES ('delete', old.id, old.text); "
+    "INSERT INTO social_post_fts(rowid, text) VALUES (new.id, new.text); END",
+    "CREATE TRIGGER IF NOT EXISTS social_user_fts_ai AFTER INSERT ON social_customuser BEGIN "
+    "INSERT INTO social_user_fts(rowid, username, bio) VALUES (new.id, new.username, new.bio); END",
+    "CREATE TRIGGER IF NOT EXISTS social_user_fts_ad AFTER DELETE ON social_customuser BEGIN "
+    "INSERT INTO social_user_fts(social_user_fts, rowid, username, bio) VALUES ('delete', old.id, old.username, old.bio); END",
+    "CREATE TRIGGER IF NOT EXISTS social_user_fts_au AFTER UPDATE OF username, bio ON social_customuser BEGIN "
+    "INSERT INTO social_user_fts(social_user_fts, rowid, username, bio) VALUES ('delete', old.id, old.username, old.bio); "
+    "INSERT INTO social_user_fts(rowid, username, bio) VALUES (new.id, new.username, new.bio); END",
+]
+
+
+def install_sqlite_triggers(using='default', **kwargs):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'social_post_fts'")
+        if cursor.fetchone() is None:
+            return
+        for statement in SQLITE_TRIGGERS:
+            cursor.execute(statement)
+
+
+def terms(query):
+    return TOKEN_RE.findall(query.lower())[:settings.SEARCH_MAX_TERMS]
+
+
+class SearchBackend:
+    """Busca ranqueada: devolve (score, id) em ordem decrescente, após a posição do cursor."""
+
+    def __init__(self, using):
+        self.connection = connections[using]
+
+    def fetch(self, sql, params):
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def _seek_sql(self, position):
+        if position is None:
+            return '', []
+        return 'WHERE score < %s OR (score = %s AND id < %s)', [position[0], position[0], position[1]]
+
+
+class SQLiteSearchBackend(SearchBackend):
+    tables = {'posts': 'social_post_fts', 'users': 'social_user_fts'}
+
+    def match(self, query):
+        # Cada termo entre aspas (sem operadores FTS5 vindos do usuário); prefixo no último
+        words = terms(query)
+        if not words:
+            return None
+        return ' '.join(f'"{word}"' for word in words[:-1]) + f' "{words[-1]}"*'
+
+    def search(self, kind, query, position, limit):
+        expression = self.match(query)
+        if expression is None:
+            return []
+        table = self.tables[kind]
+        seek, seek_params = self._seek_sql(position)
+        # bm25 é menor para os melhores resultados: invertido para ordenar de forma decrescente
+        sql = (
+            f'SELECT score, id FROM (SELECT -bm25({table}) AS score, rowid AS id FROM {table} '
+            f'WHERE {table} MATCH %s) {seek} ORDER BY score DESC, id DESC LIMIT %s'
+        )
+        return self.fetch(sql, [expression, *seek_params, limit])
+
+
+class PostgresSearchBackend(SearchBackend):
+    # Mesmas expressões dos índices GIN criados na migração 0009
+    documents = {
+        'posts': ('social_post', "to_tsvector('simple', text)"),
+        'users': ('social_customuser', "to_tsvector('simple', username || ' ' || coalesce(bio, ''))"),
+    }
+
+    def search(self, kind, query, position, limit):
+        words = terms(query)
+        if not words:
+            return []
+        table, document = self.documents[kind]
+        tsquery = ' & '.join(words[:-1] + [f'{words[-1]}:*'])
+        seek, seek_params = self._seek_sql(position)
+        sql = (
+            f"SELECT score, id FROM (SELECT ts_rank({document}, q) AS score, id FROM {table}, "
+            f"to_tsquery('simple', %s) q WHERE {document} @@ q) s {seek} ORDER BY score DESC, id DESC LIMIT %s"
+        )
+        return self.fetch(sql, [tsquery, *seek_params, limit])
+
+
+class BasicSearchBackend(SearchBackend):
+    """Fallback sem índice invertido (icontains), para bancos sem FTS."""
+
+    def search(self, kind, query, position, limit):
+        words = terms(query)
+        if not words:
+            return []
+        if kind == 'posts':
+            queryset = Post.objects.all()
+            for word in words:
+                queryset = queryset.filter(text__icontains=word)
+        else:
+            queryset = CustomUser.objects.all()
+            for word in words:
+                queryset = queryset.filter(username__icontains=word) | queryset.filter(bio__icontains=word)
+        if position is not None:
+            queryset = queryset.filter(id__lt=position[1])
+        return [(0.0, pk) for pk in queryset.order_by('-id').values_list('id', flat=True)[:limit]]
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend(model):
+    using = router.db_for_read(model)
+    if settings.SEARCH_BACKEND:
+        return import_string(settings.SEARCH_BACKEND)(using)
+    vendor = connections[using].vendor
+    return BACKENDS.get(vendor, BasicSearchBackend)(using)
+
+
+def search(kind, query, request):
+    """Uma página de ids ranqueados para 'posts' ou 'users', com cursor (score, id)."""
+    model = Post if kind == 'posts' else CustomUser
+    limit = get_page_size(request)
+    position = None
+    token = request.query_params.get('cursor')
+    if token:
+        values, direction = decode_cursor(token)
+        if direction != 'next' or len(values) != 2:
+            raise ParseError('Cursor inválido')
+        try:
+            position = (float(values[0]), int(values[1]))
+        except (TypeError, ValueError):
+            raise ParseError('Cursor inválido')
+    rows = get_backend(model).search(kind, query, position, limit + 1)
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return [row[1] for row in rows[:limit]], next_cursor
@@ -1,7 +1,10 @@
+from asgiref.sync import sync_to_async
 from rest_framework import serializers
+from django.conf import settings
 from django.utils.text import slugify
 import os
-from .models import CustomUser  # Alterado de Profile para CustomUser
+from . import caching, counters
+from .models import CustomUser, Post, PostAction  # Alterado de Profile para CustomUser
 
 class ProfileSerializer(serializers.ModelSerializer):
     class Meta:
@@ -16,4 +19,172 @@ class ProfileSerializer(serializers.ModelSerializer):
             sanitized_name = f"{slugify(name)}{ext.lower()}"
             value.name = sanitized_name
             return value
-        return value
\ No newline at end of file
+        return value
+
+# Projeções usadas pelas listas: uma única consulta com JOIN no autor, só as colunas necessárias
+
+POST_COLUMNS = (
+    'id', 'text', 'image', 'image_status', 'image_variants', 'created_at',
+    'likes_count', 'reposts_count', 'comments_count', 'shares_count', 'hot_score', 'updated_at',
+    'author__username', 'author__profile_picture', 'author__profile_picture_variants', 'author__updated_at',
+)
+PROFILE_COLUMNS = (
+    'username', 'bio', 'location', 'profile_picture', 'profile_picture_status',
+    'profile_picture_variants', 'cover_image', 'followers_count', 'following_count',
+    'posts_count', 'updated_at',
+)
+COMMENT_COLUMNS = (
+    'id', 'text', 'created_at',
+    'author__username', 'author__profile_picture', 'author__profile_picture_variants',
+)
+
+
+# Linha de post no cache (social/caching.py): sem as colunas do autor, que vêm do perfil
+# em cache. Trocar avatar ou username invalida só o perfil, não cada post do autor.
+CACHED_POST_COLUMNS = (
+    'id', 'text', 'image', 'image_status', 'image_variants', 'created_at',
+    'likes_count', 'reposts_count', 'comments_count', 'shares_count', 'updated_at', 'author_id',
+)
+
+
+def post_rows(queryset):
+    return queryset.values(*POST_COLUMNS)
+
+
+def _load_posts(post_ids):
+    return {row['id']: row for row in Post.objects.filter(id__in=post_ids).values(*CACHED_POST_COLUMNS)}
+
+
+def _load_profiles(user_ids):
+    return {row['id']: row for row in CustomUser.objects.filter(id__in=user_ids).values('id', *PROFILE_COLUMNS)}
+
+
+def profile_rows(user_ids):
+    """{id: linha com PROFILE_COLUMNS}, pelo cache em dois níveis quando ligado."""
+    return caching.get_many('customuser', user_ids, _load_profiles)
+
+
+def post_rows_by_id(post_ids):
+    """Linhas com as chaves de post_rows (sem hot_score no cache), na ordem de post_ids."""
+    if not caching.enabled():
+        rows = {row['id']: row for row in post_rows(Post.objects.filter(id__in=post_ids))}
+        return [rows[post_id] for post_id in post_ids if post_id in rows]
+    posts = caching.get_many('post', post_ids, _load_posts)
+    authors = profile_rows({row['author_id'] for row in posts.values()})
+    rows = []
+    for post_id in post_ids:
+        row = posts.get(post_id)
+        author = authors.get(row['author_id']) if row else None
+        if author is None:
+            continue
+        row['author__username'] = author['username']
+        row['author__profile_picture'] = author['profile_picture']
+        row['author__profile_picture_variants'] = author['profile_picture_variants']
+        row['author__updated_at'] = author['updated_at']
+        rows.append(row)
+    return rows
+
+
+def modification_stamps(rows):
+    """(posts, autores): últimas mudanças dos posts e dos perfis embutidos (username,
+    avatar) nas linhas de post_rows, para os validadores das listas."""
+    return (
+        max((row['updated_at'] for row in rows), default=None),
+        max((row['author__updated_at'] for row in rows), default=None),
+    )
+
+
+def comment_rows(queryset):
+    return queryset.values(*COMMENT_COLUMNS)
+
+
+def serialize_post(row):
+    return {
+        'id': row['id'],
+        'text': row['text'],
+        'author': row['author__username'],
+        'author_profile_picture': row['author__profile_picture'] or '',
+        # Variantes à parte: a URL acima segue sendo a da imagem original, como antes
+        'author_profile_picture_variants': row['author__profile_picture_variants'] or {},
+        'likes_count': row['likes_count'],
+        'reposts_count': row['reposts_count'],
+        'comments_count': row['comments_count'],
+        'shares_count': row['shares_count'],
+        'image': row['image'] or '',
+        'image_status': row['image_status'],
+        'image_variants': row['image_variants'] or {},
+        'created_at': row['created_at'].isoformat(),
+    }
+
+
+def _action_rows(user, actions):
+    if user is None or not user.is_authenticated or not actions:
+        return None
+    return PostAction.objects.filter(user=user, post_id__in=list(actions)).values_list('post_id', 'action_type')
+
+
+def serialize_profile(row):
+    return {
+        'username': row['username'],
+        'handle': row['username'].lower(),
+        'bio': row['bio'] or '',
+        'location': row['location'] or '',
+        'profile_picture': row['profile_picture'] or '',
+        'profile_picture_status': row['profile_picture_status'],
+        'profile_picture_variants': row['profile_picture_variants'],
+        'cover_image': row['cover_image'] or '',
+        'followers': row['followers_count'],
+        'following': row['following_count'],
+        'posts_count': row['posts_count'],
+    }
+
+
+def viewer_actions(user, post_ids):
+    """Flags like/repost/share do usuário para cada post, numa única consulta."""
+    actions = {post_id: {action: False for action in counters.ACTION_COUNTERS} for post_id in post_ids}
+    for post_id, action_type in _action_rows(user, actions) or []:
+        actions[post_id][action_type] = True
+    return actions
+
+
+async def aviewer_actions(user, post_ids):
+    actions = {post_id: {action: False for action in counters.ACTION_COUNTERS} for post_id in post_ids}
+    rows = _action_rows(user, actions)
+    if rows is not None:
+        async for post_id, action_type in rows:
+            actions[post_id][action_type] = True
+    return actions
+
+
+def serialize_posts(rows, viewer=None):
+    rows = counters.apply_pending(rows)
+    data = [serialize_post(row) for row in rows]
+    actions = viewer_actions(viewer, [post['id'] for post in data])
+    for post in data:
+        post['viewer_actions'] = actions[post['id']]
+    return data
+
+
+async def aserialize_posts(rows, viewer=None):
+    if settings.COUNTER_WRITE_BEHIND:
+        rows = await sync_to_async(counters.apply_pending)(rows)
+    data = [serialize_post(row) for row in rows]
+    actions = await aviewer_actions(viewer, [post['id'] for post in data])
+    for post in data:
+        post['viewer_actions'] = actions[post['id']]
+    return data
+
+
+def serialize_comment(row):
+    return {
+        'id': row['id'],
+        'text': row['text'],
+        'author': row['author__username'],
+        'created_at': row['created_at'].isoformat(),
+        'profile_picture': row['author__profile_picture'] or '',
+        'profile_picture_variants': row['author__profile_picture_variants'] or {},
+    }
+
+
+def serialize_comments(rows):
+    return [serialize_comment(row) for row in rows]
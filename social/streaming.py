@@ -0,0 +1,87 @@
+import json
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def wants_stream(request):
+    return request.query_params.get('stream') in ('1', 'true')
+
+
+def _dumps(value):
+    # Mesmo formato do JSONRenderer do DRF (compacto, UTF-8)
+    return json.dumps(value, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+def json_response(data, status=200):
+    return HttpResponse(_dumps(data), content_type='application/json', status=status)
+
+
+def iter_json(key, chunks, extra=None):
+    """Gera {"<key>": [...], **extra} aos pedaços. chunks produz listas já serializadas;
+    extra é chamado só no fim (ex.: cursores conhecidos após percorrer as linhas)."""
+    yield f'{{{_dumps(key)}:['
+    first = True
+    for chunk in chunks:
+        for item in chunk:
+            yield _dumps(item) if first else ',' + _dumps(item)
+            first = False
+    yield ']'
+    for name, value in (extra() if extra else {}).items():
+        yield f',{_dumps(name)}:{_dumps(value)}'
+    yield '}'
+
+
+async def aiter_json(key, chunks, extra=None):
+    # Sob ASGI o Django só transmite iteradores assíncronos; um síncrono seria lido inteiro
+    yield f'{{{_dumps(key)}:['
+    first = True
+    async for chunk in chunks:
+        for item in chunk:
+            yield _dumps(item) if first else ',' + _dumps(item)
+            first = False
+    yield ']'
+    for name, value in (extra() if extra else {}).items():
+        yield f',{_dumps(name)}:{_dumps(value)}'
+    yield '}'
+
+
+def streaming_response(key, chunks, extra=None):
+    return StreamingHttpResponse(iter_json(key, chunks, extra), content_type='application/json')
+
+
+def astreaming_response(key, chunks, extra=None):
+    return StreamingHttpResponse(aiter_json(key, chunks, extra), content_type='application/json')
+
+
+def chunked(items, size=None):
+    size = size or settings.STREAMING_CHUNK_SIZE
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def iter_chunks(queryset, size=None):
+    """Percorre o queryset com iterator(chunk_size), sem cache de resultados, em listas de size linhas."""
+    size = size or settings.STREAMING_CHUNK_SIZE
+    batch = []
+    for row in queryset.iterator(chunk_size=size):
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def aiter_chunks(queryset, size=None):
+    size = size or settings.STREAMING_CHUNK_SIZE
+    batch = []
+    async for row in queryset.aiterator(chunk_size=size):
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,131 @@
+import logging
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import Post, UserSuggestion
+from .pagination import CursorPaginator
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+Follow = User.following.through
+
+suggestion_paginator = CursorPaginator(fields=('score', 'candidate_id'), max_page_size=50)
+
+ACTIVITY_WEIGHT = 0.5
+POPULARITY_WEIGHT = 0.1
+
+
+def score(mutual_count, recent_posts, followers_count):
+    return (
+        mutual_count
+        + ACTIVITY_WEIGHT * math.log1p(recent_posts)
+        + POPULARITY_WEIGHT * math.log1p(followers_count)
+    )
+
+
+def popular_candidates(limit):
+    return list(
+        User.objects.filter(is_active=True).order_by('-followers_count', 'id')
+        .values_list('id', 'followers_count')[:limit]
+    )
+
+
+def rank_candidates(user, top_k, popular):
+    """Candidatos a partir dos amigos de amigos, pontuados por seguidores em comum,
+    atividade recente e popularidade. Sem follows, cai para os usuários mais seguidos."""
+    following = set(Follow.objects.filter(from_customuser_id=user.id).values_list('to_customuser_id', flat=True))
+    excluded = following | {user.id}
+    mutuals = dict(
+        Follow.objects.filter(from_customuser_id__in=following)
+        .exclude(to_customuser_id__in=excluded)
+        .values('to_customuser_id').annotate(mutual=Count('id'))
+        .order_by('-mutual').values_list('to_customuser_id', 'mutual')[:top_k * 4]
+    )
+    for candidate_id, _ in popular:
+        if len(mutuals) >= top_k * 4:
+            break
+        if candidate_id not in excluded:
+            mutuals.setdefault(candidate_id, 0)
+    if not mutuals:
+        return []
+    since = timezone.now() - timedelta(days=settings.SUGGESTIONS_ACTIVITY_DAYS)
+    recent = dict(
+        Post.objects.filter(author_id__in=mutuals, created_at__gte=since)
+        .values('author_id').annotate(total=Count('id')).values_list('author_id', 'total')
+    )
+    followers = dict(User.objects.filter(id__in=mutuals, is_active=True).values_list('id', 'followers_count'))
+    ranked = [
+        (score(mutual, recent.get(candidate_id, 0), followers[candidate_id]), candidate_id, mutual)
+        for candidate_id, mutual in mutuals.items()
+        if candidate_id in followers
+    ]
+    ranked.sort(reverse=True)
+    return ranked[:top_k]
+
+
+def compute_for_user(user, top_k=None, popular=None):
+    top_k = top_k or settings.SUGGESTIONS_TOP_K
+    if popular is None:
+        popular = popular_candidates(top_k * 4)
+    ranked = rank_candidates(user, top_k, popular)
+    with transaction.atomic():
+        UserSuggestion.objects.filter(user=user).delete()
+        UserSuggestion.objects.bulk_create([
+            UserSuggestion(user=user, candidate_id=candidate_id, score=value, mutual_count=mutual)
+            for value, candidate_id, mutual in ranked
+        ])
+    return len(ranked)
+
+
+def compute_all(top_k=None, chunk_size=500):
+    top_k = top_k or settings.SUGGESTIONS_TOP_K
+    popular = popular_candidates(top_k * 4)
+    total = 0
+    for user in User.objects.filter(is_active=True).order_by('id').iterator(chunk_size=chunk_size):
+        total += compute_for_user(user, top_k, popular)
+    logger.info(f"Sugestões recalculadas: {total} linhas")
+    return total
+
+
+def suggestions_page(user, request):
+    """Página das sugestões pré-calculadas, sem quem o usuário já passou a seguir."""
+    rows = (
+        UserSuggestion.objects.filter(user=user)
+        .exclude(candidate__in=Follow.objects.filter(from_customuser_id=user.id).values('to_customuser_id'))
+        .values('score', 'candidate_id', 'mutual_count', 'candidate__username', 'candidate__profile_picture')
+    )
+    rows, next_cursor, prev_cursor = suggestion_paginator.paginate(rows, request)
+    if not rows and request.query_params.get('cursor') is None:
+        return popular_fallback(user, request), None, None
+    data = [
+        {
+            'id': row['candidate_id'],
+            'username': row['candidate__username'],
+            'profile_picture': row['candidate__profile_picture'] or '',
+            'mutual_count': row['mutual_count'],
+        }
+        for row in rows
+    ]
+    return data, next_cursor, prev_cursor
+
+
+def popular_fallback(user, request):
+    # Usuário ainda sem sugestões calculadas: os mais seguidos (índice user_popular_idx)
+    limit = min(settings.POSTS_PAGE_SIZE, suggestion_paginator.max_page_size)
+    users = (
+        User.objects.filter(is_active=True).exclude(id=user.id)
+        .exclude(id__in=Follow.objects.filter(from_customuser_id=user.id).values('to_customuser_id'))
+        .order_by('-followers_count', 'id')
+        .values('id', 'username', 'profile_picture')[:limit]
+    )
+    return [
+        {'id': row['id'], 'username': row['username'], 'profile_picture': row['profile_picture'] or '', 'mutual_count': 0}
+        for row in users
+    ]
@@ -1,3 +1,1388 @@
-from django.test import TestCase
+import asyncio
+import base64
+import importlib
+import io
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+import traceback
+from typing import NamedTuple
+from unittest import skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.signals import request_finished, request_started
+from django.db import IntegrityError, close_old_connections, connection, connections, transaction
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from . import (
+    async_views, caching, counters, events, loadtest, media, metrics, ranking, routing, suggestions, throttling, timeline,
+)
+from .counters import toggle_action
+from .models import Comment, CounterFlush, CustomUser, Post, PostAction, TimelineEntry
+from .pagination import CursorPaginator
+from .serializers import comment_rows, post_rows
+
+
+LOCMEM = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'social-tests'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'social-tests-shared'},
+}
+
+
+def read_streaming(response):
+    if not response.is_async:
+        return b''.join(response.streaming_content)
+
+    async def collect():
+        return b''.join([chunk async for chunk in response.streaming_content])
+    return async_to_sync(collect)()
+
+
+def auth_client(user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.get_or_create(user=user)[0].key}')
+    return client
+
+
+class CounterToggleTests(TestCase):
+    def setUp(self):
+        self.author = CustomUser.objects.create_user('author')
+        self.post = Post.objects.create(author=self.author, text='hello')
+
+    def test_like_toggle_returns_new_count(self):
+        client = auth_client(self.author)
+        response = client.post(f'/api/posts/{self.post.id}/like/')
+        self.assertEqual(response.json(), {'likes_count': 1, 'id': self.post.id})
+        response = client.post(f'/api/posts/{self.post.id}/like/')
+        self.assertEqual(response.json()['likes_count'], 0)
+        self.assertFalse(PostAction.objects.exists())
+
+    def test_contended_toggle_retries_then_returns_409(self):
+        client = auth_client(self.author)
+        like = f'/api/posts/{self.post.id}/like/'
+        conflicts = []
+
+        def concurrent_insert(limit):
+            # Outro request do mesmo usuário insere a mesma ação antes deste, limit vezes
+            def wrapper(execute, sql, params, many, context):
+                if sql.startswith('INSERT INTO "social_postaction"') and len(conflicts) < limit:
+                    conflicts.append(sql)
+                    raise IntegrityError('UNIQUE constraint failed')
+                return execute(sql, params, many, context)
+            return wrapper
+
+        with connection.execute_wrapper(concurrent_insert(counters.TOGGLE_ATTEMPTS - 1)):
+            self.assertEqual(client.post(like).json()['likes_count'], 1)
+        conflicts.clear()
+        with connection.execute_wrapper(concurrent_insert(counters.TOGGLE_ATTEMPTS)):
+            client.post(like)
+            response = client.post(like)
+        self.assertEqual(response.status_code, 409)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, PostAction.objects.filter(post=self.post).count())
+
+    def test_toggle_on_missing_post_is_404(self):
+        response = auth_client(self.author).post('/api/posts/999/repost/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_comment_increments_counter(self):
+        response = auth_client(self.author).post(f'/api/posts/{self.post.id}/comment/', {'text': 'hi'}, format='json')
+        self.assertEqual(response.json()['comments_count'], 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+
+
+class BatchMutationTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('user')
+        self.author = CustomUser.objects.create_user('author')
+        self.posts = [Post.objects.create(author=self.author, text=f'post {i}') for i in range(3)]
+        self.client = auth_client(self.user)
+
+    def send(self, operations):
+        return self.client.post('/api/batch/', {'operations': operations}, format='json')
+
+    def test_applies_operations_in_one_transaction(self):
+        first, second, third = (post.id for post in self.posts)
+        toggle_action(self.user, third, 'share')
+        operations = [
+            {'op': 'like', 'target_id': first},
+            {'op': 'like', 'target_id': second},
+            {'op': 'repost', 'target_id': first},
+            {'op': 'unshare', 'target_id': third},
+            {'op': 'follow', 'target_id': self.author.id},
+            {'op': 'like', 'target_id': 999},
+            {'op': 'follow', 'target_id': self.user.id},
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.send(operations)
+        results = response.json()['results']
+        self.assertEqual([r['status'] for r in results], ['ok'] * 5 + ['not_found', 'invalid'])
+        self.assertEqual(results[0], {'op': 'like', 'target_id': first, 'status': 'ok', 'active': True, 'count': 1})
+        self.assertEqual(results[3]['count'], 0)
+        self.assertEqual(results[4]['count'], 1)
+        self.assertEqual(response.json()['following_count'], 1)
+        # Um INSERT em lote de PostAction e um UPDATE de contadores e hot_score para todos os posts
+        self.assertEqual(sum(q['sql'].startswith('INSERT INTO "social_postaction"') for q in ctx.captured_queries), 1)
+        self.assertEqual(sum(q['sql'].startswith('UPDATE "social_post" SET') for q in ctx.captured_queries), 1)
+
+        # Reenvio do mesmo lote (cliente offline) não altera nada
+        self.send(operations)
+        post = Post.objects.get(id=first)
+        self.assertEqual((post.likes_count, post.reposts_count), (1, 1))
+        self.assertEqual(CustomUser.objects.get(id=self.author.id).followers_count, 1)
+        self.assertEqual(TimelineEntry.objects.filter(user=self.user).count(), 3)
+
+    def test_rows_removed_concurrently_are_not_counted_twice(self):
+        post = self.posts[0]
+        toggle_action(self.author, post.id, 'like')
+        toggle_action(self.user, post.id, 'like')
+        raced = []
+
+        def concurrent_unlike(execute, sql, params, many, context):
+            # Outro request remove a mesma curtida entre a leitura do lote e o DELETE dele
+            if sql.startswith('DELETE FROM "social_postaction"') and not raced:
+                raced.append(sql)
+                toggle_action(self.user, post.id, 'like')
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(concurrent_unlike):
+            results = self.send([{'op': 'unlike', 'target_id': post.id}]).json()['results']
+        self.assertEqual(len(raced), 1)
+        self.assertEqual((results[0]['active'], results[0]['count']), (False, 1))
+        post.refresh_from_db()
+        self.assertEqual(post.likes_count, PostAction.objects.filter(post=post, action_type='like').count())
+
+    def test_rejects_malformed_batches(self):
+        self.assertEqual(self.send([]).status_code, 400)
+        self.assertEqual(self.send([{'op': 'explode', 'target_id': 1}]).status_code, 400)
+        self.assertEqual(self.send([{'op': 'like', 'target_id': 'x'}]).status_code, 400)
+        self.assertFalse(PostAction.objects.exists())
+
+
+class SocialGraphCounterTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('follower')
+        self.target = CustomUser.objects.create_user('target')
+        self.client = auth_client(self.user)
+
+    def test_follow_toggle_maintains_counters(self):
+        self.assertEqual(self.client.post(f'/api/follow/{self.target.id}/').json()['following_count'], 1)
+        self.client.post('/api/posts/create/', {'text': 'oi'}, format='json')
+        profile = self.client.get('/api/profile/').json()
+        self.assertEqual((profile['followers'], profile['following'], profile['posts_count']), (0, 1, 1))
+        self.target.refresh_from_db()
+        self.assertEqual(self.target.followers_count, 1)
+        self.assertEqual(self.client.post(f'/api/follow/{self.target.id}/').json()['following_count'], 0)
+        self.target.refresh_from_db()
+        self.assertEqual(self.target.followers_count, 0)
+
+    def test_reconcile_repairs_drift(self):
+        self.user.following.add(self.target)
+        Post.objects.create(author=self.target, text='x')
+        self.assertEqual(counters.reconcile_users(chunk_size=1), 2)
+        self.target.refresh_from_db()
+        self.assertEqual((self.target.followers_count, self.target.posts_count), (1, 1))
+        self.assertEqual(counters.reconcile_users(), 0)
+
+
+@override_settings(THROTTLE_ENABLED=False)
+class HomeTimelineTests(TestCase):
+    def setUp(self):
+        self.author = CustomUser.objects.create_user('author')
+        self.viewer = CustomUser.objects.create_user('viewer')
+        self.client = auth_client(self.viewer)
+        self.author_client = auth_client(self.author)
+
+    def feed_texts(self, url='/api/feed/'):
+        return [post['text'] for post in self.client.get(url).json()['posts']]
+
+    def create(self, client, text):
+        return client.post('/api/posts/create/', {'text': text}, format='json').json()['id']
+
+    def test_follow_backfills_post_fans_out_and_unfollow_prunes(self):
+        self.create(self.author_client, 'antes')
+        self.assertEqual(self.feed_texts(), [])
+        self.client.post(f'/api/follow/{self.author.id}/')
+        self.assertEqual(self.feed_texts(), ['antes'])
+        self.create(self.author_client, 'depois')
+        self.assertEqual(self.feed_texts(), ['depois', 'antes'])
+        self.assertEqual(TimelineEntry.objects.filter(user=self.viewer).count(), 2)
+
+        self.client.post(f'/api/follow/{self.author.id}/')
+        self.assertEqual(self.feed_texts(), [])
+        self.assertFalse(TimelineEntry.objects.filter(user=self.viewer).exists())
+
+    @override_settings(TIMELINE_FANOUT_THRESHOLD=1)
+    def test_high_fanout_authors_are_merged_on_read(self):
+        celebrity = CustomUser.objects.create_user('celebrity')
+        for user in [self.viewer, CustomUser.objects.create_user('fan')]:
+            counters.toggle_follow(user, celebrity.id)
+        self.client.post(f'/api/follow/{self.author.id}/')
+        celebrity_client = auth_client(celebrity)
+        for client, text in [(self.author_client, 'a1'), (celebrity_client, 'c1'), (self.author_client, 'a2'), (celebrity_client, 'c2')]:
+            self.create(client, text)
+        # Sem fan-out para o autor acima do limite: só os posts do autor comum viram entradas
+        self.assertEqual(TimelineEntry.objects.filter(user=self.viewer).count(), 2)
+
+        first = self.client.get('/api/feed/?limit=3').json()
+        self.assertEqual([post['text'] for post in first['posts']], ['c2', 'a2', 'c1'])
+        self.assertEqual(self.feed_texts(f"/api/feed/?limit=3&cursor={first['next']}"), ['a1'])
+
+    def test_migration_populates_existing_follows(self):
+        self.create(self.author_client, 'antigo')
+        # Follow anterior à timeline materializada: sem backfill
+        self.viewer.following.add(self.author)
+        counters.reconcile_users()
+        TimelineEntry.objects.all().delete()
+        migration = importlib.import_module('social.migrations.0012_populate_timelines')
+        migration.populate_timelines(apps, None)
+        self.assertEqual(self.feed_texts(), ['antigo'])
+        # Reexecutar não duplica entradas
+        migration.populate_timelines(apps, None)
+        self.assertEqual(TimelineEntry.objects.filter(user=self.viewer).count(), 1)
+
+
+class UserSuggestionTests(TestCase):
+    def test_friends_of_friends_ranked_and_followed_excluded(self):
+        me, friend, other, fof, popular = (CustomUser.objects.create_user(name) for name in ['me', 'friend', 'other', 'fof', 'popular'])
+        for user, target in [(me, friend), (me, other), (friend, fof), (other, fof), (friend, popular)]:
+            counters.toggle_follow(user, target.id)
+        suggestions.compute_all(top_k=10)
+        client = auth_client(me)
+        data = client.get('/api/suggestions/').json()['suggestions']
+        self.assertEqual([row['username'] for row in data], ['fof', 'popular'])
+        self.assertEqual(data[0]['mutual_count'], 2)
+
+        client.post(f'/api/follow/{fof.id}/')
+        data = client.get('/api/suggestions/?limit=1').json()
+        self.assertEqual([row['username'] for row in data['suggestions']], ['popular'])
+
+
+class HotRankingTests(TestCase):
+    def test_score_follows_counters_and_pages_by_rank(self):
+        author = CustomUser.objects.create_user('author')
+        old, new, quiet = (Post.objects.create(author=author, text=name) for name in ['old', 'new', 'quiet'])
+        Post.objects.filter(id=old.id).update(created_at=timezone.now() - timezone.timedelta(days=2))
+        counters.rebuild_hot_scores()
+        fans = [CustomUser.objects.create_user(f'fan{i}') for i in range(20)]
+        for fan in fans:
+            toggle_action(fan, old.id, 'like')
+        toggle_action(fans[0], new.id, 'like')
+        client = APIClient()
+        first = client.get('/api/posts/hot/?limit=2').json()
+        # Dois dias de idade pesam mais que 20 likes; o like coloca "new" acima de "quiet"
+        self.assertEqual([post['text'] for post in first['posts']], ['new', 'quiet'])
+        second = client.get(f"/api/posts/hot/?limit=2&cursor={first['next']}").json()
+        self.assertEqual([post['text'] for post in second['posts']], ['old'])
+
+        # Um só UPDATE por toggle: contador e hot_score juntos, sem reler o post
+        with CaptureQueriesContext(connection) as ctx:
+            toggle_action(fans[0], new.id, 'like')
+        self.assertEqual([q['sql'].split()[0] for q in ctx.captured_queries if 'social_post"' in q['sql']], ['UPDATE'])
+        new.refresh_from_db()
+        self.assertAlmostEqual(new.hot_score, ranking.hot_score({}, new.created_at))
+
+    @override_settings(COUNTER_WRITE_BEHIND=True, COUNTER_FLUSH_INTERVAL=0)
+    def test_write_behind_flush_updates_score(self):
+        self.addCleanup(counters.get_buffer().drain)
+        author = CustomUser.objects.create_user('author')
+        post = Post.objects.create(author=author, text='post')
+        before = post.hot_score
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(5):
+                toggle_action(CustomUser.objects.create_user(f'fan{i}'), post.id, 'repost')
+        post.refresh_from_db()
+        self.assertEqual(post.hot_score, before)
+        counters.flush()
+        post.refresh_from_db()
+        self.assertAlmostEqual(post.hot_score - before, math.log10(16), places=5)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.author = CustomUser.objects.create_user('author')
+        self.viewer = CustomUser.objects.create_user('viewer')
+        counters.toggle_follow(self.viewer, self.author.id)
+        self.post = Post.objects.create(author=self.author, text='post')
+        timeline.fan_out_post(self.post)
+        self.client = auth_client(self.viewer)
+
+    def revalidate(self, url):
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        return response, etag, ctx
+
+    def test_not_modified_until_version_changes(self):
+        for url in ['/api/feed/', '/api/profile/', f'/api/posts/{self.post.id}/comments/']:
+            with self.subTest(url):
+                response, etag, ctx = self.revalidate(url)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+                # Nada de post_rows/viewer_actions/comment_rows no caminho do 304
+                self.assertFalse(any('"text"' in q['sql'] for q in ctx.captured_queries))
+
+        feed_etag = self.client.get('/api/feed/')['ETag']
+        comments_etag = self.client.get(f'/api/posts/{self.post.id}/comments/')['ETag']
+        self.client.post(f'/api/posts/{self.post.id}/comment/', {'text': 'oi'}, format='json')
+        self.assertEqual(self.client.get('/api/feed/', HTTP_IF_NONE_MATCH=feed_etag).status_code, 200)
+        response = self.client.get(f'/api/posts/{self.post.id}/comments/', HTTP_IF_NONE_MATCH=comments_etag)
+        self.assertEqual(len(response.json()['comments']), 1)
+
+        profile = self.client.get('/api/profile/')
+        counters.toggle_follow(self.author, self.viewer.id)
+        response = self.client.get('/api/profile/', HTTP_IF_NONE_MATCH=profile['ETag'])
+        self.assertEqual(response.json()['followers'], 1)
+
+    @override_settings(THROTTLE_ENABLED=False)
+    def test_author_profile_changes_invalidate_embedded_lists(self):
+        Comment.objects.create(post=self.post, author=self.author, text='oi')
+        urls = ['/api/feed/', f'/api/posts/{self.post.id}/comments/']
+        etags = {url: self.client.get(url)['ETag'] for url in urls}
+        response = auth_client(self.author).patch('/api/profile/update/', {'username': 'renamed'}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        feed = self.client.get('/api/feed/', HTTP_IF_NONE_MATCH=etags['/api/feed/'])
+        self.assertEqual(feed.json()['posts'][0]['author'], 'renamed')
+        comments = self.client.get(urls[1], HTTP_IF_NONE_MATCH=etags[urls[1]])
+        self.assertEqual(comments.json()['comments'][0]['author'], 'renamed')
+
+    def test_if_modified_since(self):
+        response = self.client.get('/api/profile/')
+        self.assertEqual(
+            self.client.get('/api/profile/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304
+        )
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        author = CustomUser.objects.create_user('author')
+        self.ids = [Post.objects.create(author=author, text=f'post {i}').id for i in range(7)]
+        self.client = APIClient()
+
+    def page(self, cursor=None):
+        response = self.client.get('/api/posts/?limit=3' + (f'&cursor={cursor}' if cursor else ''))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return [post['id'] for post in data['posts']], data['next'], data['prev']
+
+    def test_equal_timestamps_page_by_id_without_gaps(self):
+        # Mesmo created_at em todos: o id desempata, sem repetir nem pular posts
+        Post.objects.update(created_at=timezone.now())
+        pages, cursor = [], None
+        while True:
+            ids, cursor, _ = self.page(cursor)
+            pages.append(ids)
+            if cursor is None:
+                break
+        self.assertEqual([len(ids) for ids in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), sorted(self.ids, reverse=True))
+
+        # Voltando da última página pelo prev chega-se às mesmas páginas
+        _, second, _ = self.page()
+        ids, third, _ = self.page(second)
+        self.assertEqual(ids, pages[1])
+        _, _, back = self.page(third)
+        self.assertEqual(self.page(back)[0], pages[1])
+
+    def test_invalid_cursor_is_rejected(self):
+        def cursor(payload):
+            return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+        for token in ['lixo', cursor([1, 2]), cursor({'v': ['2024-01-01T00:00:00'], 'd': 'next'}),
+                      cursor({'v': ['ontem', 1], 'd': 'next'}), cursor({'v': ['2024-01-01T00:00:00', 1], 'd': 'up'})]:
+            with self.subTest(token):
+                response = self.client.get(f'/api/posts/?cursor={token}')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'detail': 'Cursor inválido'})
+
+
+@override_settings(STREAMING_CHUNK_SIZE=2)
+class StreamingTests(TestCase):
+    def setUp(self):
+        self.author = CustomUser.objects.create_user('author')
+        self.viewer = CustomUser.objects.create_user('viewer')
+        counters.toggle_follow(self.viewer, self.author.id)
+        self.posts = [Post.objects.create(author=self.author, text=f'post {i}') for i in range(5)]
+        for post in self.posts:
+            timeline.fan_out_post(post)
+            Comment.objects.create(post=self.posts[0], author=self.viewer, text=f'comentário {post.id}')
+        toggle_action(self.viewer, self.posts[1].id, 'like')
+        self.client = auth_client(self.viewer)
+
+    def fetch(self, url):
+        separator = '&' if '?' in url else '?'
+        response = self.client.get(f'{url}{separator}stream=1')
+        self.assertTrue(response.streaming)
+        return json.loads(read_streaming(response))
+
+    def test_stream_matches_regular_response(self):
+        urls = ['/api/posts/?limit=3', '/api/posts/hot/', '/api/feed/?limit=4', '/api/profile/posts/',
+                f'/api/posts/{self.posts[0].id}/comments/']
+        for url in urls:
+            with self.subTest(url):
+                self.assertEqual(self.fetch(url), self.client.get(url).json())
+        page = self.client.get('/api/posts/?limit=2').json()
+        second = f"/api/posts/?limit=2&cursor={page['next']}"
+        back = f"/api/posts/?limit=2&cursor={self.client.get(second).json()['prev']}"
+        for url in [second, back]:
+            with self.subTest(url):
+                self.assertEqual(self.fetch(url), self.client.get(url).json())
+
+    def test_stream_reads_rows_in_chunks(self):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.fetch('/api/posts/?limit=5')
+        self.assertEqual(len(data['posts']), 5)
+        self.assertIsNone(data['next'])
+        # viewer_actions por lote de 2 posts
+        self.assertEqual(sum('social_postaction' in q['sql'] for q in ctx.captured_queries), 3)
+
+
+class AsyncReadViewTests(TestCase):
+    def setUp(self):
+        self.author = CustomUser.objects.create_user('author')
+        self.viewer = CustomUser.objects.create_user('viewer')
+        counters.toggle_follow(self.viewer, self.author.id)
+        self.post = Post.objects.create(author=self.author, text='post')
+        timeline.fan_out_post(self.post)
+        Comment.objects.create(post=self.post, author=self.viewer, text='oi')
+        toggle_action(self.viewer, self.post.id, 'like')
+        self.token = Token.objects.create(user=self.viewer).key
+        self.client = auth_client(self.viewer)
+        self.factory = AsyncRequestFactory()
+
+    async def call(self, view, url, token=True, **kwargs):
+        headers = {'Authorization': f'Token {self.token}'} if token else {}
+        return await view.as_view()(self.factory.get(url, headers=headers), **kwargs)
+
+    async def test_same_payload_as_sync_views(self):
+        cases = [
+            (async_views.PostList, '/api/posts/', {}),
+            (async_views.FeedList, '/api/feed/', {}),
+            (async_views.Profile, '/api/profile/', {}),
+            (async_views.PostCommentsList, f'/api/posts/{self.post.id}/comments/', {'post_id': self.post.id}),
+        ]
+        for view, url, kwargs in cases:
+            response = await self.call(view, url, **kwargs)
+            expected = await sync_to_async(self.client.get)(url)
+            self.assertEqual(json.loads(response.content), expected.json(), url)
+            self.assertEqual(response.get('ETag'), expected.get('ETag'), url)
+
+    async def test_errors_use_drf_format(self):
+        response = await self.call(async_views.FeedList, '/api/feed/', token=False)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+        response = await self.call(async_views.PostCommentsList, '/api/posts/999/comments/', post_id=999)
+        self.assertEqual(response.status_code, 404)
+        response = await self.call(async_views.PostList, '/api/posts/?cursor=lixo')
+        self.assertEqual(json.loads(response.content), {'detail': 'Cursor inválido'})
+
+    async def test_stream_is_async(self):
+        response = await self.call(async_views.PostList, '/api/posts/?stream=1')
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(json.loads(body)['posts'][0]['viewer_actions']['like'], True)
+
+
+class EventStreamTests(TestCase):
+    async def test_pushes_new_posts_and_counter_deltas(self):
+        author = await sync_to_async(CustomUser.objects.create_user)('author')
+        viewer = await sync_to_async(CustomUser.objects.create_user)('viewer')
+        await sync_to_async(counters.toggle_follow)(viewer, author.id)
+        post = await Post.objects.acreate(author=author, text='post')
+        token = await Token.objects.acreate(user=viewer)
+        request = AsyncRequestFactory().get(f'/api/events/?posts={post.id}', headers={'Authorization': f'Token {token.key}'})
+        response = await async_views.EventStream.as_view()(request)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 3000\n\n')
+
+        def write():
+            with self.captureOnCommitCallbacks(execute=True):
+                toggle_action(author, post.id, 'like')
+                timeline.fan_out_post(Post.objects.create(author=author, text='novo'))
+        await sync_to_async(write)()
+        first, second = await anext(stream), await anext(stream)
+        self.assertEqual(first, f'id: 1\nevent: counters\ndata: {{"id":{post.id},"likes_count":1}}\n\n'.encode())
+        self.assertIn(b'event: post', second)
+        # Cliente desconectado: o ASGI handler cancela a leitura pendente
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0.01)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertEqual(events.get_broker().subscriber_count(), 0)
+
+    @override_settings(EVENTS_HEARTBEAT=0.05)
+    def test_long_polling_under_wsgi(self):
+        response = auth_client(CustomUser.objects.create_user('viewer')).get('/api/events/')
+        self.assertEqual(read_streaming(response), b'retry: 3000\n\n')
+
+    async def test_browser_event_source_with_query_token(self):
+        author = await sync_to_async(CustomUser.objects.create_user)('author')
+        viewer = await sync_to_async(CustomUser.objects.create_user)('viewer')
+        await sync_to_async(counters.toggle_follow)(viewer, author.id)
+        response = await sync_to_async(lambda: auth_client(viewer).post('/api/events/token/'))()
+        token = response.json()['token']
+        # Como o EventSource: GET pelo handler ASGI, sem Authorization, lendo o corpo em partes
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': '/api/events/', 'raw_path': b'/api/events/', 'root_path': '',
+            'query_string': f'token={token}'.encode(), 'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+            'headers': [(b'host', b'testserver'), (b'accept', b'text/event-stream'), (b'cache-control', b'no-cache')],
+        }
+        inbox, outbox = asyncio.Queue(), asyncio.Queue()
+        await inbox.put({'type': 'http.request', 'body': b'', 'more_body': False})
+        # Como o cliente de testes do Django: a conexão do TestCase não pode ser fechada
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        try:
+            handler = asyncio.ensure_future(ASGIHandler()(scope, inbox.get, outbox.put))
+            start = await asyncio.wait_for(outbox.get(), 5)
+            self.assertEqual(start['status'], 200)
+            self.assertIn((b'Content-Type', b'text/event-stream'), start['headers'])
+            self.assertEqual((await asyncio.wait_for(outbox.get(), 5))['body'], b'retry: 3000\n\n')
+
+            def write():
+                with self.captureOnCommitCallbacks(execute=True):
+                    timeline.fan_out_post(Post.objects.create(author=author, text='novo'))
+            await sync_to_async(write)()
+            message = await asyncio.wait_for(outbox.get(), 5)
+            self.assertIn(b'event: post', message['body'])
+            self.assertTrue(message['more_body'])
+            await inbox.put({'type': 'http.disconnect'})
+            await asyncio.wait_for(handler, 5)
+        finally:
+            request_started.connect(close_old_connections)
+            request_finished.connect(close_old_connections)
+        self.assertEqual(events.get_broker().subscriber_count(), 0)
+
+    def test_query_token_is_signed_and_short_lived(self):
+        viewer = CustomUser.objects.create_user('viewer')
+        token = auth_client(viewer).post('/api/events/token/').json()['token']
+        self.assertEqual(APIClient().get(f'/api/events/?token={token}x').status_code, 401)
+        with override_settings(EVENTS_TOKEN_MAX_AGE=-1):
+            self.assertEqual(APIClient().get(f'/api/events/?token={token}').status_code, 401)
+
+
+@override_settings(METRICS_SAMPLE_RATE=1.0, METRICS_TOKEN='scrape')
+class MetricsTests(TestCase):
+    def test_server_timing_and_prometheus_histograms(self):
+        author = CustomUser.objects.create_user('author')
+        Post.objects.create(author=author, text='post')
+        client = APIClient()
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get('/api/posts/')
+        self.assertRegex(response['Server-Timing'], rf'^app;dur=[\d.]+, db;dur=[\d.]+;desc="{len(ctx.captured_queries)} queries"$')
+
+        self.assertEqual(client.get('/metrics').status_code, 401)
+        body = client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape').content.decode()
+        self.assertIn('zuppi_http_requests_total{route="post_list",method="GET",status="200"}', body)
+        self.assertRegex(body, r'zuppi_http_request_duration_seconds_bucket\{route="post_list",method="GET",le="\+Inf"\} \d+')
+        self.assertIn('zuppi_db_queries_per_request_count{route="post_list"}', body)
+
+    async def test_counts_queries_from_async_orm_threads(self):
+        stats = metrics.RequestStats()
+        token = metrics._current.set(stats)
+        try:
+            await Post.objects.filter(id=0).aexists()
+        finally:
+            metrics._current.reset(token)
+        self.assertEqual(stats.queries, 1)
+
+
+@override_settings(THROTTLE_RATES={'post_toggle': {'user': (2, 60), 'ip': (3, 60)}, 'login': {'ip': (1, 6)}})
+class ThrottlingTests(TestCase):
+    def setUp(self):
+        throttling._buckets = throttling.LocalBuckets()
+        self.addCleanup(setattr, throttling, '_buckets', None)
+        self.post = Post.objects.create(author=CustomUser.objects.create_user('author'), text='post')
+
+    def test_per_user_and_per_ip_buckets_with_retry_after(self):
+        first, second = (auth_client(CustomUser.objects.create_user(name)) for name in ('a', 'b'))
+        like = f'/api/posts/{self.post.id}/like/'
+        self.assertEqual([first.post(like).status_code for _ in range(2)], [200, 200])
+        # Outro usuário no mesmo IP: o balde do usuário tem tokens, o do IP só mais um
+        self.assertEqual(second.post(like).status_code, 200)
+        response = second.post(like)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(first.post(like).status_code, 429)
+
+        response = APIClient().post('/api/login/', {'username': 'a', 'password': 'x'}, format='json')
+        self.assertEqual(response.status_code, 401)
+        response = APIClient().post('/api/login/', {'username': 'a', 'password': 'x'}, format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '10')
+
+    def test_batch_operations_are_charged_to_their_route_buckets(self):
+        client = auth_client(CustomUser.objects.create_user('a'))
+        likes = [{'op': 'like', 'target_id': self.post.id}] * 3
+        # Três toggles num lote custam três tokens do post_toggle, cuja rajada é de dois
+        response = client.post('/api/batch/', {'operations': likes}, format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertFalse(PostAction.objects.exists())
+        response = client.post('/api/batch/', {'operations': likes[:2]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.post(f'/api/posts/{self.post.id}/like/').status_code, 429)
+
+    def test_ip_bucket_ignores_client_forwarded_for(self):
+        login = {'username': 'a', 'password': 'x'}
+        for i in range(10):
+            APIClient().post('/api/login/', login, format='json', HTTP_X_FORWARDED_FOR=f'10.0.0.{i}')
+        # Sem proxy configurado o header vem do cliente: o balde continua sendo o do REMOTE_ADDR
+        response = APIClient().post('/api/login/', login, format='json', HTTP_X_FORWARDED_FOR='10.0.1.1')
+        self.assertEqual(response.status_code, 429)
+
+    @override_settings(CACHES=LOCMEM)
+    def test_shared_cache_buckets_refill_over_time(self):
+        self.addCleanup(cache.clear)
+        for buckets in (throttling.LocalBuckets(), throttling.CacheBuckets()):
+            with self.subTest(type(buckets).__name__):
+                # Balde de 2 tokens repostos a 1 por segundo
+                self.assertEqual([buckets.consume('k', 2, 60, now=100) for _ in range(2)], [0, 0])
+                self.assertAlmostEqual(buckets.consume('k', 2, 60, now=100), 1.0)
+                # Recusados não consomem: meio segundo depois, falta meio token
+                self.assertAlmostEqual(buckets.consume('k', 2, 60, now=100.5), 0.5)
+                self.assertEqual(buckets.consume('k', 2, 60, now=101), 0)
+                self.assertGreater(buckets.consume('k', 2, 60, now=101), 0)
+                # Ocioso por muito tempo: o balde enche só até a capacidade
+                self.assertEqual([buckets.consume('k', 2, 60, now=1000) for _ in range(2)], [0, 0])
+                self.assertGreater(buckets.consume('k', 2, 60, now=1000), 0)
+                # Custo maior que 1: o balde cheio paga dois de uma vez, mais que a capacidade nunca
+                self.assertEqual(buckets.consume('k', 2, 60, now=2000, cost=2), 0)
+                self.assertAlmostEqual(buckets.consume('k', 2, 60, now=2000, cost=2), 2.0)
+                self.assertGreater(buckets.consume('k', 2, 60, now=3000, cost=3), 0)
+
+
+class LoadTestHarnessTests(TestCase):
+    def test_seeded_counters_match_rows_and_client_run_reports_percentiles(self):
+        call_command('seed_data', users=30, posts_per_user=3, follows_per_user=5, comments=40, actions=80, seed=7, stdout=io.StringIO())
+        users = CustomUser.objects.filter(username__startswith='carga_')
+        self.assertEqual(users.count(), 30)
+        self.assertEqual(counters.reconcile(), 0)
+        self.assertEqual(counters.reconcile_users(), 0)
+        follower = users.filter(following_count__gt=0).first()
+        self.assertEqual(TimelineEntry.objects.filter(user=follower).exists(), Post.objects.filter(author__in=follower.following.all()).exists())
+
+        workload = loadtest.Workload(loadtest.parse_mix('feed=1,profile=1,like=1,comment=1'), users=5, seed=7)
+        report = loadtest.run_client(workload, 40)
+        self.assertEqual(report['total']['requests'], 40)
+        self.assertEqual(report['total']['errors'], 0)
+        self.assertLessEqual(report['total']['p50'], report['total']['p99'])
+
+        slower = {'client': {'total': dict(report['total'], p95=report['total']['p95'] * 2)}}
+        rows, regressed = loadtest.compare(slower, {'results': {'client': report}}, 0.15)
+        self.assertTrue(regressed)
+        self.assertEqual([row[2] for row in rows if row[-1]], ['p95'])
+
+
+class SearchTests(TestCase):
+    def test_ranked_prefix_search_with_cursor(self):
+        author = CustomUser.objects.create_user('joana', bio='fotógrafa')
+        for i in range(3):
+            Post.objects.create(author=author, text='praia ' * (i + 1) + f'dia {i}')
+        Post.objects.create(author=author, text='montanha')
+        client = APIClient()
+        first = client.get('/api/search/?q=pra&limit=2').json()
+        self.assertEqual([p['text'] for p in first['posts']], ['praia praia praia dia 2', 'praia praia dia 1'])
+        second = client.get(f"/api/search/?q=pra&limit=2&cursor={first['next']}").json()
+        self.assertEqual([p['text'] for p in second['posts']], ['praia dia 0'])
+        self.assertIsNone(second['next'])
+        self.assertEqual(client.get('/api/search/').status_code, 400)
+
+    def test_index_follows_writes(self):
+        user = CustomUser.objects.create_user('joana', bio='fotógrafa')
+        client = APIClient()
+        self.assertEqual(client.get('/api/search/?q=fotógrafa&type=users').json()['users'][0]['username'], 'joana')
+        user.bio = 'surfista'
+        user.save()
+        self.assertEqual(client.get('/api/search/?q=fotógrafa&type=users').json()['users'], [])
+        self.assertEqual(len(client.get('/api/search/?q=surf&type=users').json()['users']), 1)
+        post = Post.objects.create(author=user, text='onda grande')
+        post.delete()
+        self.assertEqual(client.get('/api/search/?q=onda').json()['posts'], [])
+
+
+class ListQueryCountTests(TestCase):
+    def setUp(self):
+        self.viewer = CustomUser.objects.create_user('viewer')
+        self.client = auth_client(self.viewer)
+        self.authors = [self.viewer] + [
+            CustomUser.objects.create_user(f'author{i}', profile_picture=f'https://img/{i}.jpg') for i in range(4)
+        ]
+
+    def create_posts(self, count):
+        for i in range(count):
+            author = self.authors[i % len(self.authors)]
+            post = Post.objects.create(author=author, text=f'post {i}')
+            Comment.objects.create(post=post, author=author, text='c')
+            if author != self.viewer:
+                self.viewer.following.add(author)
+                TimelineEntry.objects.create(user=self.viewer, post=post, author=author, created_at=post.created_at)
+        Comment.objects.bulk_create(Comment(post_id=self.first_post_id(), author=a, text='c') for a in self.authors)
+
+    def first_post_id(self):
+        return Post.objects.order_by('id').values_list('id', flat=True).first()
+
+    def count_queries(self):
+        # Token já no cache de autenticação: conta só as consultas da listagem
+        self.client.get('/api/profile/')
+        counts = {}
+        for url in ['/api/posts/?limit=50', '/api/feed/?limit=50', '/api/profile/posts/?limit=50',
+                    f'/api/posts/{self.first_post_id()}/comments/']:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            counts[url] = len(ctx.captured_queries)
+        return counts
+
+    def test_query_count_is_constant_in_page_size(self):
+        self.create_posts(3)
+        small = self.count_queries()
+        self.create_posts(40)
+        self.assertEqual(self.count_queries(), small)
+
+    def test_post_payload_embeds_author_avatar(self):
+        self.create_posts(2)
+        post = self.client.get('/api/posts/').json()['posts'][0]
+        self.assertEqual(post['author'], 'author0')
+        self.assertEqual(post['author_profile_picture'], 'https://img/0.jpg')
+
+    def test_viewer_actions_embedded_and_bulk(self):
+        self.create_posts(2)
+        liked = Post.objects.order_by('id').first()
+        toggle_action(self.viewer, liked.id, 'like')
+        posts = {post['id']: post for post in self.client.get('/api/posts/').json()['posts']}
+        self.assertEqual(posts[liked.id]['viewer_actions'], {'like': True, 'repost': False, 'share': False})
+        response = self.client.post('/api/posts/actions/', {'post_ids': list(posts)}, format='json')
+        self.assertTrue(response.json()['actions'][str(liked.id)]['like'])
+        self.assertEqual(sum(flags['like'] for flags in response.json()['actions'].values()), 1)
+
+
+def hot_queries(user):
+    """Consultas quentes como as views as executam: (nome, queryset, ordenação em memória permitida)."""
+    posts = CursorPaginator()
+    timeline = CursorPaginator(fields=('created_at', 'post_id'))
+    hot = CursorPaginator(fields=('hot_score', 'id'))
+    position = (timezone.now(), 10**6)
+    return [
+        ('hot_first_page', hot.window(post_rows(Post.objects.all()), None, 'next', 20), False),
+        ('hot_next_page', hot.window(post_rows(Post.objects.all()), (1000.0, 10**6), 'next', 20), False),
+        ('post_list_first_page', posts.window(post_rows(Post.objects.all()), None, 'next', 20), False),
+        ('post_list_next_page', posts.window(post_rows(Post.objects.all()), position, 'next', 20), False),
+        ('post_list_prev_page', posts.window(post_rows(Post.objects.all()), position, 'prev', 20), False),
+        ('profile_posts', posts.window(post_rows(Post.objects.filter(author=user)), position, 'next', 20), False),
+        # Mescla de vários autores na leitura: cada autor é uma busca no índice, mas a
+        # ordenação final da união (limitada a LIMIT linhas por autor) é inevitável
+        ('feed_merged_authors', posts.window(post_rows(Post.objects.filter(author__in=[user.id, user.id + 1])), position, 'next', 20), True),
+        ('timeline', timeline.window(TimelineEntry.objects.filter(user=user).values('created_at', 'post_id'), position, 'next', 20), False),
+        ('comments', comment_rows(Comment.objects.filter(post_id=1).order_by('-created_at')), False),
+        ('viewer_actions', PostAction.objects.filter(user=user, post_id__in=[1, 2, 3]).values_list('post_id', 'action_type'), False),
+    ]
+
+
+class QueryPlanTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('planner')
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite')
+    def test_sqlite_hot_queries_use_indexes(self):
+        for name, queryset, sort_allowed in hot_queries(self.user):
+            with self.subTest(name):
+                plan = queryset.explain()
+                self.assertIsNone(re.search(r'\bSCAN \w+\s*$', plan, re.M), f'{name} faz full scan:\n{plan}')
+                if not sort_allowed:
+                    self.assertNotIn('USE TEMP B-TREE', plan, f'{name} ordena em memória:\n{plan}')
+
+    @skipUnless(connection.vendor == 'postgresql', 'PostgreSQL')
+    def test_postgresql_hot_queries_use_indexes(self):
+        for name, queryset, sort_allowed in hot_queries(self.user):
+            with self.subTest(name), transaction.atomic():
+                # Tabelas de teste são minúsculas: sem isso o planner sempre prefere Seq Scan
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+                    cursor.execute('SET LOCAL enable_sort = off')
+                plan = queryset.explain()
+                self.assertNotIn('Seq Scan', plan, f'{name} faz full scan:\n{plan}')
+                if not sort_allowed:
+                    self.assertIsNone(re.search(r'\bSort\b', plan), f'{name} ordena em memória:\n{plan}')
+
+
+class QueryLog:
+    """execute_wrapper que guarda cada SQL com os frames do projeto que o originaram."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        frames = [
+            f'{os.path.relpath(frame.filename, settings.BASE_DIR)}:{frame.lineno} em {frame.name}'
+            for frame in traceback.extract_stack()[:-1]
+            if frame.filename.startswith(os.path.dirname(__file__))
+            # Os wrappers de métricas aparecem em toda query e não dizem nada sobre a origem
+            and frame.filename not in (__file__, metrics.__file__)
+        ]
+        self.queries.append((sql, frames[-3:]))
+        return execute(sql, params, many, context)
+
+    def report(self):
+        return '\n'.join(
+            f'{index}. {sql}\n' + ''.join(f'     <- {frame}\n' for frame in reversed(frames))
+            for index, (sql, frames) in enumerate(self.queries, 1)
+        )
+
+
+class RouteBudget(NamedTuple):
+    name: str
+    method: str
+    path: str  # formatado com post, author e viewer da escala
+    queries: int
+    max_bytes: int
+    data: dict = None
+    format: str = 'json'
+
+
+# Orçamento de cada rota de social/urls.py (mais /metrics): o número exato de queries hoje,
+# para que qualquer query a mais falhe. Mutações vêm depois das leituras e logout por último,
+# já que invalida o token da escala. Login e registro abrem também a sessão do Django.
+ROUTE_BUDGETS = [
+    RouteBudget('post_list', 'get', '/api/posts/', 3, 10000),
+    RouteBudget('post_hot_list', 'get', '/api/posts/hot/', 3, 10000),
+    RouteBudget('feed_list', 'get', '/api/feed/', 6, 10000),
+    RouteBudget('post_comments_list', 'get', '/api/posts/{post}/comments/', 4, 2000),
+    RouteBudget('post_actions', 'get', '/api/posts/{post}/actions/', 3, 200),
+    RouteBudget('post_actions_bulk', 'post', '/api/posts/actions/', 2, 1000, {'post_ids': '{posts}'}),
+    RouteBudget('search', 'get', '/api/search/?q=praia', 4, 10000),
+    RouteBudget('user_suggestions', 'get', '/api/suggestions/', 3, 1000),
+    RouteBudget('profile', 'get', '/api/profile/', 2, 500),
+    RouteBudget('profile_posts', 'get', '/api/profile/posts/', 3, 4000),
+    RouteBudget('events', 'get', '/api/events/?posts={post}', 2, 100),
+    RouteBudget('events_token', 'post', '/api/events/token/', 1, 200),
+    RouteBudget('metrics', 'get', '/metrics', 0, 200000),
+    RouteBudget('post_create', 'post', '/api/posts/create/', 8, 500, {'text': 'praia nova'}, 'multipart'),
+    RouteBudget('post_like', 'post', '/api/posts/{post}/like/', 8, 200),
+    RouteBudget('post_repost', 'post', '/api/posts/{post}/repost/', 8, 200),
+    RouteBudget('post_share', 'post', '/api/posts/{post}/share/', 8, 200),
+    RouteBudget('post_comment', 'post', '/api/posts/{post}/comment/', 7, 500, {'text': 'comentário'}),
+    RouteBudget('batch_mutations', 'post', '/api/batch/', 7, 500, {'operations': [{'op': 'like', 'target_id': '{post}'}]}),
+    RouteBudget('follow_user', 'post', '/api/follow/{author}/', 8, 200),
+    RouteBudget('profile_update', 'patch', '/api/profile/update/', 3, 500, {'username': 'viewer{viewer}', 'bio': 'nova bio'}, 'multipart'),
+    RouteBudget('register', 'post', '/api/register/', 15, 500, {'username': 'novo{viewer}', 'password': 'senha123', 'email': 'n{viewer}@x.com'}),
+    RouteBudget('login', 'post', '/api/login/', 11, 500, {'username': 'viewer{viewer}', 'password': 'senha123'}),
+    RouteBudget('logout', 'post', '/api/logout/', 4, 200),
+]
+BUDGET_SCALES = (2, 8)
+
+
+@override_settings(METRICS_TOKEN='scrape', EVENTS_HEARTBEAT=0.05)
+class QueryBudgetTests(TestCase):
+    """Cada rota roda contra duas escalas de dados: o número de queries não pode crescer
+    com os dados nem passar do orçamento, e a resposta tem tamanho máximo."""
+
+    def seed(self, scale):
+        # scale autores seguidos pelo viewer, cada um com scale posts, e cada post com
+        # scale comentários e likes
+        viewer = CustomUser.objects.create_user(f'viewer{scale}', password='senha123')
+        authors = [
+            CustomUser.objects.create_user(f'autor{scale}_{i}', profile_picture=f'https://img/{i}.jpg')
+            for i in range(scale)
+        ]
+        for author in authors:
+            counters.toggle_follow(viewer, author.id)
+            counters.toggle_follow(author, viewer.id)
+        for author in authors + [viewer]:
+            for j in range(scale):
+                post = Post.objects.create(author=author, text=f'praia {author.username} {j}')
+                timeline.fan_out_post(post)
+                Comment.objects.bulk_create(Comment(post=post, author=other, text='c') for other in authors)
+                PostAction.objects.bulk_create(PostAction(post=post, user=other, action_type='like') for other in authors)
+        counters.reconcile()
+        counters.reconcile_users()
+        suggestions.compute_for_user(viewer)
+        posts = list(Post.objects.filter(author=authors[0]).values_list('id', flat=True))
+        return auth_client(viewer), {'post': posts[0], 'posts': posts, 'author': authors[-1].id, 'viewer': scale}
+
+    def fill(self, value, context):
+        if isinstance(value, str):
+            if value == '{posts}':
+                return context['posts']
+            value = value.format(**context)
+            return int(value) if value.isdigit() else value
+        if isinstance(value, dict):
+            return {key: self.fill(item, context) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.fill(item, context) for item in value]
+        return value
+
+    def measure(self, client, context):
+        results = {}
+        for budget in ROUTE_BUDGETS:
+            log = QueryLog()
+            kwargs = {}
+            if budget.data is not None:
+                kwargs = {'data': self.fill(budget.data, context), 'format': budget.format}
+            caller = client
+            if budget.name == 'metrics':
+                caller = APIClient()
+                kwargs['HTTP_AUTHORIZATION'] = 'Bearer scrape'
+            with connection.execute_wrapper(log):
+                response = getattr(caller, budget.method)(budget.path.format(**context), **kwargs)
+                body = read_streaming(response) if response.streaming else response.content
+            self.assertLess(response.status_code, 400, f'{budget.name}: {response.status_code} {body[:200]}')
+            results[budget.name] = (log, len(body))
+        return results
+
+    def test_every_route_has_a_budget(self):
+        from .urls import urlpatterns
+        self.assertEqual({pattern.name for pattern in urlpatterns} | {'metrics'}, {budget.name for budget in ROUTE_BUDGETS})
+
+    def test_query_and_size_budgets_hold_as_data_grows(self):
+        small, large = (self.measure(*self.seed(scale)) for scale in BUDGET_SCALES)
+        for budget in ROUTE_BUDGETS:
+            with self.subTest(budget.name):
+                (small_log, _), (large_log, size) = small[budget.name], large[budget.name]
+                self.assertLessEqual(
+                    len(large_log.queries), len(small_log.queries),
+                    f'{budget.name}: queries crescem com os dados '
+                    f'({len(small_log.queries)} -> {len(large_log.queries)})\n{large_log.report()}',
+                )
+                self.assertLessEqual(
+                    len(large_log.queries), budget.queries,
+                    f'{budget.name}: {len(large_log.queries)} queries, orçamento {budget.queries}\n{large_log.report()}',
+                )
+                self.assertLessEqual(size, budget.max_bytes, f'{budget.name}: resposta de {size} bytes')
+
+
+class FlakyBackend(media.LocalMediaBackend):
+    failures = 0
+
+    def upload(self, path, folder, public_id):
+        if FlakyBackend.failures:
+            FlakyBackend.failures -= 1
+            raise ConnectionError('timeout')
+        return super().upload(path, folder, public_id)
+
+
+# Muitos posts do mesmo IP de teste: sem o balde por IP de post_create, compartilhado pela suíte
+@override_settings(
+    MEDIA_UPLOAD_BACKEND='social.tests.FlakyBackend', MEDIA_UPLOAD_WORKERS=0, MEDIA_UPLOAD_BACKOFF=0, THROTTLE_ENABLED=False,
+)
+class MediaUploadTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('uploader')
+        FlakyBackend.failures = 0
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name, MEDIA_SPOOL_DIR=os.path.join(media_root.name, 'spool')))
+
+    def image_bytes(self, size=(300, 200)):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, 'teal').save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def create_post(self, size=(3000, 2000)):
+        buffer = io.BytesIO()
+        exif = Image.Exif()
+        exif[0x010F] = 'PhoneMaker'
+        Image.new('RGB', size, 'teal').save(buffer, 'JPEG', exif=exif)
+        image = SimpleUploadedFile('Foto Praia.JPG', buffer.getvalue(), content_type='image/jpeg')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = auth_client(self.user).post('/api/posts/create/', {'text': 'praia', 'image': image})
+        self.assertEqual(response.json()['image_status'], 'pending')
+        return Post.objects.get(id=response.json()['id'])
+
+    def test_upload_retries_then_marks_ready(self):
+        FlakyBackend.failures = 2
+        post = self.create_post()
+        self.assertEqual(post.image_status, 'ready')
+        self.assertRegex(post.image, r'^/media/post_pics/foto-praia_[0-9a-f]{16}_full\.webp$')
+        self.assertEqual(set(post.image_variants), {'thumb', 'feed', 'full'})
+
+    def test_variants_are_resized_and_stripped(self):
+        # Retrato: a variante tem a largura configurada e a altura proporcional
+        post = self.create_post(size=(3000, 4000))
+        for name, width in [('thumb', 150), ('feed', 640), ('full', 1600)]:
+            path = post.image_variants[name].replace(settings.MEDIA_URL, settings.MEDIA_ROOT + '/', 1)
+            with Image.open(path) as variant:
+                self.assertEqual(variant.format, 'WEBP')
+                self.assertEqual(variant.size[0], width)
+                self.assertAlmostEqual(variant.size[1], width * 4 / 3, delta=1)
+                self.assertNotIn('exif', variant.info)
+
+    def test_non_image_upload_fails(self):
+        image = SimpleUploadedFile('notes.jpg', b'not-an-image', content_type='image/jpeg')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = auth_client(self.user).post('/api/posts/create/', {'text': 'x', 'image': image})
+        self.assertEqual(Post.objects.get(id=response.json()['id']).image_status, 'failed')
+
+    @override_settings(IMAGE_MAX_FULL_DECODE_PIXELS=100_000)
+    def test_full_decode_formats_have_a_lower_pixel_cap(self):
+        self.assertEqual(self.create_post(size=(3000, 2000)).image_status, 'ready')
+        image = SimpleUploadedFile('grande.png', self.image_bytes(size=(400, 300)), content_type='image/png')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = auth_client(self.user).post('/api/posts/create/', {'text': 'x', 'image': image})
+        self.assertEqual(Post.objects.get(id=response.json()['id']).image_status, 'failed')
+
+    def test_sweep_resumes_interrupted_uploads(self):
+        # Worker caiu depois do spool: o post fica pending e o arquivo continua no spool
+        image = SimpleUploadedFile('foto.png', self.image_bytes(), content_type='image/png')
+        with self.captureOnCommitCallbacks(execute=False):
+            post_id = auth_client(self.user).post('/api/posts/create/', {'text': 'x', 'image': image}).json()['id']
+        lost = Post.objects.create(author=self.user, text='perdido', image_status='pending')
+        Post.objects.filter(id=lost.id).update(updated_at=timezone.now() - timezone.timedelta(hours=1))
+
+        self.assertEqual(media.sweep(timeout=60), (0, 1))
+        self.assertEqual(Post.objects.get(id=post_id).image_status, 'pending')
+        self.assertEqual(Post.objects.get(id=lost.id).image_status, 'failed')
+
+        self.assertEqual(media.sweep(timeout=0), (1, 0))
+        post = Post.objects.get(id=post_id)
+        self.assertEqual(post.image_status, 'ready')
+        self.assertEqual(set(post.image_variants), {'thumb', 'feed', 'full'})
+        self.assertEqual(os.listdir(settings.MEDIA_SPOOL_DIR), [])
+
+    def test_sweep_and_queued_job_upload_only_once(self):
+        # Job ainda na fila além do timeout: só um entre ele e o sweep reivindica o registro
+        image = SimpleUploadedFile('foto.png', self.image_bytes(), content_type='image/png')
+        with self.captureOnCommitCallbacks(execute=False):
+            post_id = auth_client(self.user).post('/api/posts/create/', {'text': 'x', 'image': image}).json()['id']
+        name, = os.listdir(settings.MEDIA_SPOOL_DIR)
+        folder, pk, public_id = media.parse_spool_name(name)
+        path = os.path.join(settings.MEDIA_SPOOL_DIR, name)
+        queued_at = timezone.now()
+        old = time.time() - 3600
+        os.utime(path, (old, old))
+
+        # Registro tocado há pouco (job em andamento): o sweep não mexe nele
+        self.assertEqual(media.sweep(timeout=60), (0, 0))
+        self.assertTrue(os.path.exists(path))
+
+        # Parado: um sweep reivindica; o job que sai da fila depois disso desiste, e outro sweep também
+        stale = timezone.now() - timezone.timedelta(seconds=60)
+        Post.objects.filter(id=post_id).update(updated_at=timezone.now() - timezone.timedelta(hours=1))
+        self.assertTrue(media.claim(folder, pk, stale))
+        self.assertFalse(media.claim(folder, pk, queued_at))
+        self.assertEqual(media.sweep(timeout=60), (0, 0))
+        self.assertEqual(Post.objects.get(id=post_id).image_status, 'pending')
+
+        Post.objects.filter(id=post_id).update(updated_at=timezone.now() - timezone.timedelta(hours=1))
+        self.assertEqual(media.sweep(timeout=60), (1, 0))
+        self.assertEqual(media.sweep(timeout=60), (0, 0))
+        self.assertEqual(Post.objects.get(id=post_id).image_status, 'ready')
+
+    @override_settings(MEDIA_UPLOAD_RETRIES=1)
+    def test_upload_marks_failed_after_retries(self):
+        FlakyBackend.failures = 5
+        post = self.create_post()
+        self.assertEqual(post.image_status, 'failed')
+        self.assertIsNone(post.image)
+
+
+@override_settings(CACHES=LOCMEM)
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('cached')
+        self.client = auth_client(self.user)
+
+    def profile_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get('/api/profile/').status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_cached_token_saves_a_query_per_request(self):
+        cold = self.profile_queries()
+        self.assertEqual(self.profile_queries(), cold - 1)
+
+    def test_logout_invalidates_cached_token(self):
+        self.profile_queries()
+        self.assertEqual(self.client.post('/api/logout/').status_code, 200)
+        self.assertEqual(self.client.get('/api/profile/').status_code, 401)
+        # Token inválido em cache negativo: recusado sem consultar o banco
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get('/api/profile/').status_code, 401)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_profile_update_invalidates_cached_user(self):
+        self.profile_queries()
+        self.client.patch('/api/profile/update/', {'username': 'renamed', 'bio': 'nova'}, format='multipart')
+        self.assertEqual(self.client.get('/api/profile/').json()['username'], 'renamed')
+
+    def test_profile_update_keeps_counters_changed_after_caching(self):
+        self.profile_queries()
+        # Usuário em cache com followers_count=0; o contador muda por UPDATE atômico
+        CustomUser.objects.filter(pk=self.user.pk).update(followers_count=7, profile_picture='https://img/new.jpg')
+        self.client.patch('/api/profile/update/', {'username': 'renamed', 'bio': 'nova'}, format='multipart')
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.username, self.user.followers_count), ('renamed', 7))
+        self.assertEqual(self.user.profile_picture, 'https://img/new.jpg')
+
+
+class ConcurrentCounterTests(TransactionTestCase):
+    workers = 8
+
+    def test_parallel_toggles_do_not_lose_updates(self):
+        author = CustomUser.objects.create_user('author')
+        post = Post.objects.create(author=author, text='viral')
+        users = [CustomUser.objects.create_user(f'fan{i}') for i in range(self.workers)]
+        barrier = threading.Barrier(self.workers)
+        errors = []
+
+        def like(user):
+            try:
+                barrier.wait()
+                toggle_action(user, post.id, 'like')
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=like, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        post.refresh_from_db()
+        self.assertEqual(post.likes_count, self.workers)
+        self.assertEqual(PostAction.objects.filter(post=post, action_type='like').count(), self.workers)
+
+
+@override_settings(COUNTER_WRITE_BEHIND=True, COUNTER_FLUSH_INTERVAL=0, CACHES=LOCMEM)
+class WriteBehindCounterTests(TestCase):
+    def setUp(self):
+        counters._buffer = counters.CacheCounterBuffer()
+        self.addCleanup(setattr, counters, '_buffer', None)
+        self.addCleanup(cache.clear)
+        self.author = CustomUser.objects.create_user('author')
+        self.post = Post.objects.create(author=self.author, text='viral')
+
+    def like(self, username):
+        with self.captureOnCommitCallbacks(execute=True):
+            return toggle_action(CustomUser.objects.create_user(username), self.post.id, 'like')
+
+    def test_reads_include_pending_deltas_until_flush(self):
+        self.assertEqual(self.like('a'), (True, 1))
+        self.assertEqual(self.like('b'), (True, 2))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+        response = APIClient().get('/api/posts/')
+        self.assertEqual(response.json()['posts'][0]['likes_count'], 2)
+
+        self.assertEqual(counters.flush(), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 2)
+        self.assertEqual(counters.pending_deltas([self.post.id]), {})
+
+    def test_crash_before_deltas_leave_the_buffer_is_recovered(self):
+        self.like('a')
+        self.like('b')
+        buffer = counters.get_buffer()
+
+        def crash(batch_id, deltas):
+            raise RuntimeError('worker caiu')
+        buffer.complete_drain = crash
+        with self.assertRaises(RuntimeError):
+            counters.flush()
+        del buffer.complete_drain
+        # Journal gravado antes dos decr: o lote é aplicado e retirado do buffer uma única vez
+        self.assertTrue(counters.recover())
+        self.assertEqual(counters.pending_deltas([self.post.id]), {})
+        self.assertEqual(counters.flush(), 0)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 2)
+
+    def test_journal_recovery_is_idempotent(self):
+        deltas = {(self.post.id, 'shares_count'): 3}
+        buffer = counters.get_buffer()
+        buffer.save_journal('batch1', deltas)
+        self.assertTrue(counters.recover())
+        # Crash depois do commit mas antes de limpar o journal: não reaplica
+        buffer.save_journal('batch1', deltas)
+        self.assertFalse(counters.recover())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.shares_count, 3)
+        self.assertTrue(CounterFlush.objects.filter(batch_id='batch1').exists())
+
+
+SHARED_CACHE = {**LOCMEM, 'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'caching-tests'}}
+
+
+@override_settings(CACHE_ENABLED=True, CACHES=SHARED_CACHE)
+class TwoTierCacheTests(TestCase):
+    def setUp(self):
+        caching._cache = None
+        self.addCleanup(setattr, caching, '_cache', None)
+        self.addCleanup(caching.get_cache().l2.clear)
+        self.author = CustomUser.objects.create_user('author')
+        self.viewer = CustomUser.objects.create_user('viewer')
+        with self.captureOnCommitCallbacks(execute=True):
+            counters.toggle_follow(self.viewer, self.author.id)
+            self.post = Post.objects.create(author=self.author, text='post')
+            timeline.fan_out_post(self.post)
+        self.client = auth_client(self.viewer)
+
+    def feed(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/feed/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['posts'], len(ctx.captured_queries)
+
+    def test_warm_reads_skip_the_database(self):
+        _, cold = self.feed()
+        before = metrics.CACHE_REQUESTS._values.get(('post', 'l1_hit'), 0)
+        posts, warm = self.feed()
+        self.assertLess(warm, cold)
+        self.assertEqual(posts[0]['author'], 'author')
+        self.assertEqual(metrics.CACHE_REQUESTS._values[('post', 'l1_hit')], before + 1)
+
+        # Outro worker: L1 vazio, mesmo L2
+        caching.get_cache().l1.clear()
+        before = metrics.CACHE_REQUESTS._values.get(('post', 'l2_hit'), 0)
+        self.assertEqual(self.feed()[1], warm)
+        self.assertEqual(metrics.CACHE_REQUESTS._values[('post', 'l2_hit')], before + 1)
+
+    def test_writes_invalidate_after_commit(self):
+        self.feed()
+        with self.captureOnCommitCallbacks(execute=True):
+            toggle_action(self.author, self.post.id, 'like')
+        self.assertEqual(self.feed()[0][0]['likes_count'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            other = Post.objects.create(author=self.author, text='novo')
+            timeline.fan_out_post(other)
+        self.assertEqual([post['id'] for post in self.feed()[0]], [other.id, self.post.id])
+
+    def test_fan_out_bumps_one_generation_per_author(self):
+        for i in range(3):
+            counters.toggle_follow(CustomUser.objects.create_user(f'fan{i}'), self.author.id)
+        self.feed()
+        cache, bumps = caching.get_cache(), []
+        bump = cache.bump
+
+        def record(namespace, ids):
+            bumps.append((namespace, ids))
+            bump(namespace, ids)
+
+        cache.bump = record
+        with self.captureOnCommitCallbacks(execute=True):
+            other = Post.objects.create(author=self.author, text='novo')
+            self.assertEqual(timeline.fan_out_post(other), 4)
+        self.assertEqual(bumps, [('timeline_author', [self.author.id])])
+        self.assertEqual(self.feed()[0][0]['id'], other.id)
+
+    def test_profile_changes_reach_cached_posts(self):
+        self.feed()
+        author_client = auth_client(self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            author_client.patch('/api/profile/update/', {'username': 'renamed'}, format='multipart')
+        self.assertEqual(author_client.get('/api/profile/').json()['username'], 'renamed')
+        self.assertEqual(self.feed()[0][0]['author'], 'renamed')
+
+    def test_l1_evicts_least_recently_used_by_size(self):
+        lru = caching.LRU(max_bytes=10)
+        lru.set('a', b'aaaa')
+        lru.set('b', b'bbbb')
+        lru.get('a')
+        lru.set('c', b'cccc')
+        self.assertIs(lru.get('b'), caching.MISSING)
+        self.assertEqual((lru.get('a'), lru.get('c'), lru.size), (b'aaaa', b'cccc', 8))
+        lru.set('big', b'x' * 11)
+        self.assertIs(lru.get('big'), caching.MISSING)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], DATABASE_STICKY_SECONDS=60)
+class ReadReplicaRoutingTests(TestCase):
+    # Dois SQLite sem replicação: o que só existe no primário prova de onde veio a leitura
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        routing._health = None
+        self.addCleanup(setattr, routing, '_health', None)
+        self.addCleanup(caches[settings.DATABASE_PIN_CACHE].clear)
+        self.author = CustomUser.objects.create_user('author')
+        self.viewer = CustomUser.objects.create_user('viewer')
+        counters.toggle_follow(self.viewer, self.author.id)
+        self.post = Post.objects.create(author=self.author, text='post')
+        timeline.fan_out_post(self.post)
+        self.client = auth_client(self.viewer)
+
+    def ids(self, client, url):
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [post['id'] for post in response.json()['posts']]
+
+    def test_reads_stick_to_primary_after_a_write(self):
+        self.assertEqual(self.ids(APIClient(), '/api/posts/'), [])
+        self.assertEqual(self.ids(self.client, '/api/feed/'), [])
+
+        self.assertEqual(self.client.post(f'/api/posts/{self.post.id}/like/').status_code, 200)
+        self.assertEqual(self.ids(self.client, '/api/feed/'), [self.post.id])
+        self.assertEqual(self.ids(self.client, '/api/posts/'), [self.post.id])
+        # Só quem escreveu fica fixado no primário
+        self.assertEqual(self.ids(auth_client(self.author), '/api/posts/'), [])
+
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(self.ids(APIClient(), '/api/posts/'), [self.post.id])
+
+    def test_unhealthy_replica_fails_over_to_primary(self):
+        before = metrics.DB_READ_ROUTES._values.get(('default', 'failover'), 0)
+        with override_settings(DATABASE_REPLICAS=['offline']):
+            self.assertEqual(self.ids(APIClient(), '/api/posts/'), [self.post.id])
+        self.assertEqual(metrics.DB_READ_ROUTES._values[('default', 'failover')], before + 1)
+
+        health = routing.get_health()
+        self.assertFalse(health.healthy('offline'))
+        self.assertTrue(health.healthy('replica'))
+        with override_settings(DATABASE_REPLICAS=['offline', 'replica']):
+            self.assertEqual(self.ids(APIClient(), '/api/posts/'), [])
+
+    def test_unmigrated_replica_is_unhealthy(self):
+        health = routing.ReplicaHealth()
+        self.assertEqual(health.check(connections['replica']), (True, None))
+        # Um SQLite vazio responde a SELECT 1, mas não tem o schema
+        with tempfile.TemporaryDirectory() as tmp:
+            replica = connections['replica']
+            empty = type(replica)({**replica.settings_dict, 'NAME': os.path.join(tmp, 'empty.sqlite3')}, 'empty')
+            try:
+                self.assertEqual(health.check(empty), (False, 'migrations do código não aplicadas'))
+            finally:
+                empty.close()
+
+    def test_stale_health_is_refreshed_outside_the_request(self):
+        health = routing.ReplicaHealth()
+        health._checked['replica'] = (False, 0)
+        # O estado vencido vale até a thread terminar a verificação
+        self.assertFalse(health.healthy('replica', now=settings.DATABASE_REPLICA_CHECK_INTERVAL + 1))
+        deadline = time.monotonic() + 5
+        while health._probing and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(health.healthy('replica'))
+
+    def test_writes_go_to_primary_and_end_replica_reads(self):
+        router = routing.ReplicaRouter()
+        state = routing.RoutingState()
+        state.read_alias = 'replica'
+        token = routing._state.set(state)
+        self.addCleanup(routing._state.reset, token)
+        self.assertEqual(router.db_for_read(Post), 'replica')
+        with routing.primary():
+            self.assertIsNone(router.db_for_read(Post))
+        self.assertEqual(router.db_for_write(Post, instance=Post.objects.using('replica').first()), 'default')
+        self.assertIsNone(router.db_for_read(Post))
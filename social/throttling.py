@@ -0,0 +1,152 @@
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+
+
+class LocalBuckets:
+    """Token buckets em memória do processo. Serve para desenvolvimento e testes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def consume(self, key, capacity, per_minute, now=None, cost=1):
+        """Retira cost tokens do balde; devolve 0 se havia tokens ou os segundos até haver."""
+        now = time.time() if now is None else now
+        rate = per_minute / 60
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                return 0
+            self._buckets[key] = (tokens, now)
+            return (cost - tokens) / rate
+
+
+class CacheBuckets:
+    """Token buckets compartilhados entre workers num cache com incr atômico (Redis, Memcached).
+
+    Cada chave guarda o instante teórico de chegada (GCRA, em ms): cada request soma um
+    intervalo com incr, e o balde está cheio enquanto esse instante não passa de
+    capacidade * intervalo à frente do relógio. Um request custa um incr (mais um touch
+    quando aceito); nenhum lock. Com cost > 1 o incr soma cost intervalos."""
+
+    def __init__(self, alias='default', prefix='throttle'):
+        self.alias = alias
+        self.prefix = prefix
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def consume(self, key, capacity, per_minute, now=None, cost=1):
+        now_ms = int((time.time() if now is None else now) * 1000)
+        interval = max(1, int(60000 / per_minute))
+        if cost > capacity:
+            # Nunca cabe no balde, nem cheio
+            return (cost - capacity) * interval / 1000
+        step = cost * interval
+        # Depois desse tempo sem requests o balde estaria cheio de novo: a chave pode expirar
+        ttl = math.ceil((capacity + 1) * interval / 1000) + 1
+        key = f'{self.prefix}:{key}'
+        if self.cache.add(key, now_ms + step, timeout=ttl):
+            return 0
+        try:
+            arrival = self.cache.incr(key, step)
+        except ValueError:
+            # Expirou entre o add e o incr
+            self.cache.set(key, now_ms + step, timeout=ttl)
+            return 0
+        if arrival <= now_ms + step - interval:
+            # Ociosa por mais de um intervalo: recomeça do relógio. Sem CAS, incrs concorrentes
+            # nesse instante podem se perder, o que só concede requests a mais, nunca a menos
+            self.cache.set(key, now_ms + step, timeout=ttl)
+            return 0
+        if arrival <= now_ms + capacity * interval:
+            self.cache.touch(key, ttl)
+            return 0
+        # Negado: devolve os intervalos, para que requests recusados não consumam o balde
+        self.cache.decr(key, step)
+        return (arrival - capacity * interval - now_ms) / 1000
+
+
+_buckets = None
+_buckets_lock = threading.Lock()
+
+
+def get_buckets():
+    global _buckets
+    if _buckets is None:
+        with _buckets_lock:
+            if _buckets is None:
+                if settings.THROTTLE_BUCKETS == 'cache':
+                    _buckets = CacheBuckets(alias=settings.THROTTLE_CACHE)
+                else:
+                    _buckets = LocalBuckets()
+    return _buckets
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Limite por rota: o escopo vem de throttle_scope da view e a taxa de
+    THROTTLE_RATES[escopo][kind], como (capacidade do balde, tokens repostos por minuto).
+    Rotas ou kinds sem taxa configurada não são limitados. Subclasses definem kind e
+    get_key(request), a identidade do balde (None: request não limitado)."""
+
+    kind = None
+
+    def allow_request(self, request, view):
+        return self.consume(request, getattr(view, 'throttle_scope', None))
+
+    def consume(self, request, scope, cost=1):
+        """Retira cost tokens do balde do escopo; False (e wait()) se não houver."""
+        if not settings.THROTTLE_ENABLED:
+            return True
+        rate = settings.THROTTLE_RATES.get(scope, {}).get(self.kind) if scope else None
+        if rate is None:
+            return True
+        key = self.get_key(request)
+        if key is None:
+            return True
+        self.wait_seconds = get_buckets().consume(f'{scope}:{self.kind}:{key}', *rate, cost=cost)
+        return not self.wait_seconds
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    kind = 'user'
+
+    def get_key(self, request):
+        return request.user.pk if request.user.is_authenticated else None
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    kind = 'ip'
+
+    def get_key(self, request):
+        # REMOTE_ADDR, ou o X-Forwarded-For visto pelo último de NUM_PROXIES proxies
+        # (REST_FRAMEWORK em settings); nunca o header inteiro como enviado pelo cliente
+        return self.get_ident(request)
+
+
+WRITE_THROTTLES = [UserTokenBucketThrottle, IPTokenBucketThrottle]
+
+
+def charge(request, costs, throttles=WRITE_THROTTLES):
+    """Cobra {escopo: tokens} nos baldes dos throttles, além do token do próprio request:
+    para rotas que agregam operações de outras rotas (ex.: /api/batch/). Levanta
+    Throttled (429 com Retry-After) no primeiro balde sem tokens suficientes."""
+    for scope, cost in costs.items():
+        if not cost:
+            continue
+        for throttle_class in throttles:
+            throttle = throttle_class()
+            if not throttle.consume(request, scope, cost):
+                raise Throttled(throttle.wait())
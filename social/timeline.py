@@ -0,0 +1,155 @@
+import heapq
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import F
+
+from . import caching, events
+from .models import Post, TimelineEntry
+from .pagination import CursorPaginator
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+Follow = User.following.through
+
+timeline_paginator = CursorPaginator(fields=('created_at', 'post_id'))
+
+FANOUT_BATCH_SIZE = 1000
+
+
+def follower_ids(author_id):
+    return Follow.objects.filter(to_customuser_id=author_id).values_list('from_customuser_id', flat=True)
+
+
+def is_high_fanout(author_id):
+    # Autores com muitos seguidores não recebem fan-out: seus posts são mesclados na leitura
+    return User.objects.filter(id=author_id, followers_count__gt=settings.TIMELINE_FANOUT_THRESHOLD).exists()
+
+
+def high_fanout_following(user):
+    return list(
+        user.following.filter(followers_count__gt=settings.TIMELINE_FANOUT_THRESHOLD)
+        .values_list('id', flat=True)
+    )
+
+
+def fan_out_post(post):
+    events.post_created(post)
+    if is_high_fanout(post.author_id):
+        logger.debug(f"Fan-out ignorado para autor {post.author_id}: mesclado na leitura")
+        return 0
+    entries = [
+        TimelineEntry(user_id=user_id, post_id=post.id, author_id=post.author_id, created_at=post.created_at)
+        for user_id in follower_ids(post.author_id).iterator(chunk_size=FANOUT_BATCH_SIZE)
+    ]
+    TimelineEntry.objects.bulk_create(entries, batch_size=FANOUT_BATCH_SIZE, ignore_conflicts=True)
+    # Uma geração por autor, não uma por seguidor: as janelas em cache dos seguidores
+    # dependem da geração de cada autor seguido (ver _cached_window)
+    caching.invalidate('timeline_author', [post.author_id])
+    logger.debug(f"Fan-out do post {post.id}: {len(entries)} timelines")
+    return len(entries)
+
+
+def backfill(user, author):
+    # Mesmo sem entradas novas: a lista de autores mesclados na leitura também muda
+    caching.invalidate('timeline', [user.id])
+    if is_high_fanout(author.id):
+        return 0
+    recent = (
+        Post.objects.filter(author=author)
+        .order_by('-created_at', '-id')
+        .values('id', 'created_at')[:settings.TIMELINE_BACKFILL_SIZE]
+    )
+    entries = [
+        TimelineEntry(user_id=user.id, post_id=row['id'], author_id=author.id, created_at=row['created_at'])
+        for row in recent
+    ]
+    TimelineEntry.objects.bulk_create(entries, ignore_conflicts=True)
+    return len(entries)
+
+
+def prune(user, author):
+    deleted, _ = TimelineEntry.objects.filter(user=user, author=author).delete()
+    caching.invalidate('timeline', [user.id])
+    return deleted
+
+
+def rebuild(user):
+    TimelineEntry.objects.filter(user=user).delete()
+    caching.invalidate('timeline', [user.id])
+    return sum(backfill(user, author) for author in user.following.all())
+
+
+def _merge_page(rows, merged, position, direction, limit):
+    if merged is not None:
+        seen = set()
+        combined = []
+        for row in heapq.merge(rows, merged, key=timeline_paginator.key, reverse=direction == 'next'):
+            if row['post_id'] not in seen:
+                seen.add(row['post_id'])
+                combined.append(row)
+        rows = combined
+    rows, next_cursor, prev_cursor = timeline_paginator.page(rows, position, direction, limit)
+    return [row['post_id'] for row in rows], next_cursor, prev_cursor
+
+
+def _timeline_window(user, position, direction, limit):
+    return timeline_paginator.window(
+        TimelineEntry.objects.filter(user=user).values('created_at', 'post_id'),
+        position, direction, limit,
+    )
+
+
+def _merged_window(authors, position, direction, limit):
+    return timeline_paginator.window(
+        Post.objects.filter(author__in=authors).annotate(post_id=F('id')).values('created_at', 'post_id'),
+        position, direction, limit,
+    )
+
+
+def _following(user):
+    return list(user.following.values_list('id', flat=True)), high_fanout_following(user)
+
+
+def _cached_window(user, position, direction, limit):
+    # Autores seguidos (e os de alto fan-out entre eles) pela geração da timeline do usuário,
+    # trocada em backfill, prune e rebuild. A janela da timeline materializada também depende
+    # da geração de cada autor seguido, trocada a cada fan-out: um post invalida uma chave,
+    # não uma por seguidor. Autor que cruza o limite de seguidores só aparece como mesclado
+    # após a próxima invalidação ou CACHE_TTL
+    following, merged_authors = caching.get('timeline', user.id, lambda: _following(user), ':following')
+    authors = caching.generations_key('timeline_author', following)
+    rows = caching.get(
+        'timeline', user.id,
+        lambda: list(_timeline_window(user, position, direction, limit)),
+        caching.variant_key(position, direction, limit, authors),
+    )
+    return rows, merged_authors
+
+
+def read_post_ids(user, request):
+    """Página da home timeline: uma varredura por intervalo em TimelineEntry,
+    mesclada com os posts recentes dos autores de alto fan-out seguidos."""
+    position, direction, limit = timeline_paginator.parse(request, TimelineEntry)
+    rows, merged_authors = _cached_window(user, position, direction, limit)
+    merged = list(_merged_window(merged_authors, position, direction, limit)) if merged_authors else None
+    return _merge_page(rows, merged, position, direction, limit)
+
+
+async def aread_post_ids(user, request):
+    position, direction, limit = timeline_paginator.parse(request, TimelineEntry)
+    if caching.enabled():
+        rows, merged_authors = await sync_to_async(_cached_window)(user, position, direction, limit)
+    else:
+        rows = [row async for row in _timeline_window(user, position, direction, limit)]
+        merged_authors = [
+            author_id async for author_id in
+            user.following.filter(followers_count__gt=settings.TIMELINE_FANOUT_THRESHOLD).values_list('id', flat=True)
+        ]
+    merged = None
+    if merged_authors:
+        merged = [row async for row in _merged_window(merged_authors, position, direction, limit)]
+    return _merge_page(rows, merged, position, direction, limit)
@@ -1,19 +1,29 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Leituras quentes: versões assíncronas quando servido por ASGI (ASYNC_READ_VIEWS)
+reads = async_views if settings.ASYNC_READ_VIEWS else views
 
 urlpatterns = [
-    path('posts/', views.PostList.as_view(), name='post_list'),
+    path('posts/', reads.PostList.as_view(), name='post_list'),
+    path('posts/hot/', views.HotPostList.as_view(), name='post_hot_list'),
     path('posts/create/', views.PostCreate.as_view(), name='post_create'),
     path('posts/<int:post_id>/like/', views.PostLike.as_view(), name='post_like'),
     path('posts/<int:post_id>/repost/', views.PostRepost.as_view(), name='post_repost'),
     path('posts/<int:post_id>/comment/', views.PostComment.as_view(), name='post_comment'),
-    path('posts/<int:post_id>/comments/', views.PostCommentsList.as_view(), name='post_comments_list'),
+    path('posts/<int:post_id>/comments/', reads.PostCommentsList.as_view(), name='post_comments_list'),
     path('posts/<int:post_id>/share/', views.PostShare.as_view(), name='post_share'),
     path('posts/<int:post_id>/actions/', views.PostActions.as_view(), name='post_actions'),
-    path('feed/', views.FeedList.as_view(), name='feed_list'),
+    path('posts/actions/', views.PostActionsBulk.as_view(), name='post_actions_bulk'),
+    path('feed/', reads.FeedList.as_view(), name='feed_list'),
+    path('batch/', views.BatchMutations.as_view(), name='batch_mutations'),
+    path('events/', async_views.EventStream.as_view(), name='events'),
+    path('events/token/', views.EventStreamToken.as_view(), name='events_token'),
     path('follow/<int:user_id>/', views.FollowUser.as_view(), name='follow_user'),
+    path('search/', views.Search.as_view(), name='search'),
     path('suggestions/', views.UserSuggestions.as_view(), name='user_suggestions'),
-    path('profile/', views.Profile.as_view(), name='profile'),
+    path('profile/', reads.Profile.as_view(), name='profile'),
     path('profile/posts/', views.ProfilePosts.as_view(), name='profile_posts'),
     path('profile/update/', views.ProfileUpdate.as_view(), name='profile_update'),
     path('login/', views.LoginView.as_view(), name='login'),
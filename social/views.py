@@ -1,53 +1,104 @@
 from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from django.http import Http404
 from django.contrib.auth import get_user_model, authenticate, login, logout
 from django.http import JsonResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.authtoken.models import Token
 from rest_framework.parsers import JSONParser
-from .models import Post, PostAction, Comment
+from .authentication import CachedTokenAuthentication, invalidate_token, invalidate_user_tokens, stream_token
+from .conditional import make_etag, not_modified, set_validators
+from .models import MEDIA_PENDING, MEDIA_READY, Post, PostAction, Comment
+from .pagination import CursorPaginator
+from .routing import ReplicaReadMixin
+from . import batch, caching, counters, media, search, suggestions, throttling, timeline
+from .serializers import (
+    comment_rows, modification_stamps, post_rows, post_rows_by_id, profile_rows, serialize_comments, serialize_posts,
+    serialize_profile, viewer_actions,
+)
+from .streaming import chunked, iter_chunks, streaming_response, wants_stream
+from .throttling import WRITE_THROTTLES
 import json
 import logging
 from rest_framework.parsers import MultiPartParser
 from rest_framework.exceptions import ParseError
-from django.utils.text import slugify
-import os
-import cloudinary.uploader
-import cloudinary
-import time
 
 logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
-class PostList(APIView):
-    authentication_classes = [TokenAuthentication]
+post_paginator = CursorPaginator(fields=('created_at', 'id'))
+hot_paginator = CursorPaginator(fields=('hot_score', 'id'))
+
+
+def paginated_posts(paginator, queryset, request):
+    """Página de posts como Response, ou em streaming com ?stream=1."""
+    if wants_stream(request):
+        chunks, cursors = paginator.stream(post_rows(queryset), request, settings.STREAMING_CHUNK_SIZE)
+        return streaming_response('posts', (serialize_posts(rows, viewer=request.user) for rows in chunks), cursors)
+    if caching.enabled():
+        # Só as colunas do cursor no banco (índice); as linhas vêm do cache por id
+        window, next_cursor, prev_cursor = paginator.paginate(queryset.values(*paginator.fields), request)
+        posts = post_rows_by_id([row['id'] for row in window])
+    else:
+        posts, next_cursor, prev_cursor = paginator.paginate(post_rows(queryset), request)
+    data = serialize_posts(posts, viewer=request.user)
+    return Response({'posts': data, 'next': next_cursor, 'prev': prev_cursor})
+
+
+class PostList(ReplicaReadMixin, APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        return paginated_posts(post_paginator, Post.objects.all(), request)
+
+class HotPostList(ReplicaReadMixin, APIView):
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [AllowAny]
 
     def get(self, request):
-        posts = Post.objects.all().order_by('-created_at')
-        data = [
-            {
-                'id': post.id,
-                'text': post.text,
-                'author': post.author.username,
-                'likes_count': post.likes_count,
-                'reposts_count': post.reposts_count,
-                'comments_count': post.comments_count,
-                'shares_count': post.shares_count,
-                'created_at': post.created_at.isoformat(),
-                'image': post.image if post.image else ''
-            }
-            for post in posts
-        ]
-        return Response({'posts': data})
+        # Intervalo no índice post_hot_idx: o score já está gravado, nada é recalculado na leitura
+        return paginated_posts(hot_paginator, Post.objects.all(), request)
+
+class Search(ReplicaReadMixin, APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        kind = request.query_params.get('type', 'posts')
+        if not query:
+            return Response({'detail': 'Parâmetro q é obrigatório'}, status=status.HTTP_400_BAD_REQUEST)
+        if kind not in ('posts', 'users'):
+            return Response({'detail': 'type deve ser posts ou users'}, status=status.HTTP_400_BAD_REQUEST)
+        ids, next_cursor = search.search(kind, query, request)
+        if kind == 'posts':
+            data = serialize_posts(post_rows_by_id(ids), viewer=request.user)
+        else:
+            rows = {row['id']: row for row in User.objects.filter(id__in=ids, is_active=True).values('id', 'username', 'bio', 'profile_picture')}
+            data = [
+                {
+                    'id': row['id'],
+                    'username': row['username'],
+                    'bio': row['bio'] or '',
+                    'profile_picture': row['profile_picture'] or '',
+                }
+                for row in (rows[pk] for pk in ids if pk in rows)
+            ]
+        logger.debug(f"Busca {kind} q={query!r}: {len(data)} resultados")
+        return Response({kind: data, 'next': next_cursor})
 
 class PostCreate(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_classes = WRITE_THROTTLES
+    throttle_scope = 'post_create'
 
     def post(self, request):
         try:
@@ -61,45 +112,38 @@ class PostCreate(APIView):
 
                 post = Post(author=request.user, text=text if text else '')
                 if image:
-                    name, ext = os.path.splitext(image.name)
-                    sanitized_name = f"{slugify(name)}_{os.urandom(8).hex()}{ext.lower()}"
-                    current_timestamp = int(time.time())
-                    logger.debug(f"Generated timestamp: {current_timestamp} for upload")
-                    if current_timestamp < 1700000000:
-                        return Response({'detail': 'Timestamp inválido'}, status=status.HTTP_400_BAD_REQUEST)
-                    cloudinary.config(
-                        cloud_name=os.getenv('CLOUDINARY_CLOUD_NAME'),
-                        api_key=os.getenv('CLOUDINARY_API_KEY'),
-                        api_secret=os.getenv('CLOUDINARY_API_SECRET')
-                    )
-                    upload_result = cloudinary.uploader.upload(
-                        image,
-                        folder="post_pics",
-                        public_id=sanitized_name,
-                        overwrite=True,
-                        timestamp=current_timestamp
-                    )
-                    post.image = upload_result['secure_url']
-                    logger.debug(f"Post created with image: id={post.id}, url={post.image}")
-                post.save()
+                    # A imagem sobe em segundo plano; o post fica visível já com image_status=pending
+                    post.image_status = MEDIA_PENDING
+                with transaction.atomic():
+                    post.save()
+                    counters.change_user_counter(request.user.id, 'posts_count', 1)
+                if image:
+                    media.upload_post_image(post, image)
+                    logger.debug(f"Post created with pending image: id={post.id}")
+                timeline.fan_out_post(post)
                 return Response({
                     'id': post.id,
                     'text': post.text,
                     'author': request.user.username,
                     'image': post.image if post.image else '',
+                    'image_status': post.image_status,
                     'created_at': post.created_at.isoformat()
                 })
             else:
                 data = json.loads(request.body)
                 text = data.get('text')
                 if text:
-                    post = Post.objects.create(author=request.user, text=text)
+                    with transaction.atomic():
+                        post = Post.objects.create(author=request.user, text=text)
+                        counters.change_user_counter(request.user.id, 'posts_count', 1)
+                    timeline.fan_out_post(post)
                     logger.debug(f"Post created: id={post.id}, author={request.user.username}")
                     return Response({
                         'id': post.id,
                         'text': post.text,
                         'author': request.user.username,
                         'image': '',
+                        'image_status': post.image_status,
                         'created_at': post.created_at.isoformat()
                     })
                 return Response({'detail': 'Texto ausente'}, status=status.HTTP_400_BAD_REQUEST)
@@ -112,8 +156,8 @@ class PostCreate(APIView):
             logger.error(f"Erro ao criar post: {e}")
             return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-class PostActions(APIView):
-    authentication_classes = [TokenAuthentication]
+class PostActions(ReplicaReadMixin, APIView):
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request, post_id):
@@ -123,55 +167,68 @@ class PostActions(APIView):
         logger.debug(f"Ações do post {post_id}: {action_list}")
         return Response({'actions': action_list})
 
+class PostActionsBulk(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    parser_classes = [JSONParser]
+
+    def post(self, request):
+        post_ids = request.data.get('post_ids')
+        if not isinstance(post_ids, list) or not all(isinstance(post_id, int) for post_id in post_ids):
+            return Response({'detail': 'post_ids deve ser uma lista de inteiros'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(post_ids) > settings.POSTS_MAX_PAGE_SIZE:
+            return Response({'detail': f'Máximo de {settings.POSTS_MAX_PAGE_SIZE} posts por requisição'}, status=status.HTTP_400_BAD_REQUEST)
+        actions = viewer_actions(request.user, post_ids)
+        return Response({'actions': {str(post_id): flags for post_id, flags in actions.items()}})
+
 class PostLike(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_classes = WRITE_THROTTLES
+    throttle_scope = 'post_toggle'
 
     def post(self, request, post_id):
-        post = get_object_or_404(Post, id=post_id)
-        action = PostAction.objects.filter(user=request.user, post=post, action_type='like').first()
-        if action:
-            action.delete()
-            post.likes_count = max(0, post.likes_count - 1)
-            logger.debug(f"Like removido do post {post_id}: likes_count={post.likes_count}")
+        try:
+            active, likes_count = counters.toggle_action(request.user, post_id, 'like')
+        except Post.DoesNotExist:
+            raise Http404
+        if active:
+            logger.debug(f"Like adicionado ao post {post_id}: likes_count={likes_count}")
         else:
-            PostAction.objects.create(user=request.user, post=post, action_type='like')
-            post.likes_count += 1
-            logger.debug(f"Like adicionado ao post {post_id}: likes_count={post.likes_count}")
-        post.save()
-        return Response({'likes_count': post.likes_count, 'id': post.id})
+            logger.debug(f"Like removido do post {post_id}: likes_count={likes_count}")
+        return Response({'likes_count': likes_count, 'id': post_id})
 
     def delete(self, request, post_id):
         return self.post(request, post_id)
 
 class PostRepost(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_classes = WRITE_THROTTLES
+    throttle_scope = 'post_toggle'
 
     def post(self, request, post_id):
-        post = get_object_or_404(Post, id=post_id)
-        action = PostAction.objects.filter(user=request.user, post=post, action_type='repost').first()
-        if action:
-            action.delete()
-            post.reposts_count = max(0, post.reposts_count - 1)
-            logger.debug(f"Repost removido do post {post_id}: reposts_count={post.reposts_count}")
+        try:
+            active, reposts_count = counters.toggle_action(request.user, post_id, 'repost')
+        except Post.DoesNotExist:
+            raise Http404
+        if active:
+            logger.debug(f"Repost adicionado ao post {post_id}: reposts_count={reposts_count}")
         else:
-            PostAction.objects.create(user=request.user, post=post, action_type='repost')
-            post.reposts_count += 1
-            logger.debug(f"Repost adicionado ao post {post_id}: reposts_count={post.reposts_count}")
-        post.save()
-        return Response({'reposts_count': post.reposts_count, 'id': post.id})
+            logger.debug(f"Repost removido do post {post_id}: reposts_count={reposts_count}")
+        return Response({'reposts_count': reposts_count, 'id': post_id})
 
     def delete(self, request, post_id):
         return self.post(request, post_id)
 
 class PostComment(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_classes = WRITE_THROTTLES
+    throttle_scope = 'post_comment'
     parser_classes = [JSONParser]  # Forçar parsing de JSON
 
     def post(self, request, post_id):
-        post = get_object_or_404(Post, id=post_id)
         try:
             data = request.data
             logger.debug(f"Received comment data for post {post_id}: {data}")
@@ -179,161 +236,186 @@ class PostComment(APIView):
             if not text:
                 logger.warning(f"Comentário vazio para post {post_id}")
                 return Response({'detail': 'O comentário não pode estar vazio'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            comment = Comment.objects.create(
-                post=post,
-                author=request.user,
-                text=text
-            )
-            post.comments_count += 1
-            post.save()
-            logger.debug(f"Comentário adicionado ao post {post_id}: comments_count={post.comments_count}")
+
+            with transaction.atomic():
+                comments_count = counters.adjust_counter(post_id, 'comments_count', 1)
+                if comments_count is None:
+                    raise Http404
+                comment = Comment.objects.create(
+                    post_id=post_id,
+                    author=request.user,
+                    text=text
+                )
+            logger.debug(f"Comentário adicionado ao post {post_id}: comments_count={comments_count}")
             return Response({
                 'id': comment.id,
                 'text': comment.text,
                 'author': comment.author.username,
                 'created_at': comment.created_at.isoformat(),
-                'comments_count': post.comments_count
+                'comments_count': comments_count
             })
+        except Http404:
+            raise
         except Exception as e:
             logger.error(f"Erro ao criar comentário: {e}")
             return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-class PostCommentsList(APIView):
-    authentication_classes = [TokenAuthentication]
+class PostCommentsList(ReplicaReadMixin, APIView):
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request, post_id):
-        post = get_object_or_404(Post, id=post_id)
-        comments = Comment.objects.filter(post=post).order_by('-created_at')
-        data = [
-            {
-                'id': comment.id,
-                'text': comment.text,
-                'author': comment.author.username,
-                'created_at': comment.created_at.isoformat(),
-                'profile_picture': comment.author.profile_picture if comment.author.profile_picture else ''
-            }
-            for comment in comments
-        ]
+        if not Post.objects.filter(id=post_id).exists():
+            raise Http404
+        # Validador pelo índice comment_post_recent_idx, sem ler os comentários; inclui a
+        # última mudança de perfil dos autores, embutidos em cada comentário
+        stamps = Comment.objects.filter(post_id=post_id).aggregate(
+            total=Count('id'), last_id=Max('id'), last=Max('created_at'), authors=Max('author__updated_at'),
+        )
+        etag = make_etag(post_id, stamps['total'], stamps['last_id'], stamps['last'], stamps['authors'])
+        modified = max(filter(None, (stamps['last'], stamps['authors'])), default=None)
+        cached = not_modified(request, etag, modified)
+        if cached is not None:
+            return cached
+        comments = comment_rows(Comment.objects.filter(post_id=post_id).order_by('-created_at'))
+        if wants_stream(request):
+            response = streaming_response('comments', (serialize_comments(rows) for rows in iter_chunks(comments)))
+            return set_validators(response, etag, modified)
+        data = serialize_comments(comments)
         logger.debug(f"Comentários do post {post_id}: {data}")
-        return Response({'comments': data})
+        return set_validators(Response({'comments': data}), etag, modified)
 
 class PostShare(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_classes = WRITE_THROTTLES
+    throttle_scope = 'post_toggle'
 
     def post(self, request, post_id):
-        post = get_object_or_404(Post, id=post_id)
-        action = PostAction.objects.filter(user=request.user, post=post, action_type='share').first()
-        if action:
-            action.delete()
-            post.shares_count = max(0, post.shares_count - 1)
-            logger.debug(f"Compartilhamento removido do post {post_id}: shares_count={post.shares_count}")
+        try:
+            active, shares_count = counters.toggle_action(request.user, post_id, 'share')
+        except Post.DoesNotExist:
+            raise Http404
+        if active:
+            logger.debug(f"Compartilhamento adicionado ao post {post_id}: shares_count={shares_count}")
         else:
-            PostAction.objects.create(user=request.user, post=post, action_type='share')
-            post.shares_count += 1
-            logger.debug(f"Compartilhamento adicionado ao post {post_id}: shares_count={post.shares_count}")
-        post.save()
-        return Response({'shares_count': post.shares_count, 'id': post.id})
+            logger.debug(f"Compartilhamento removido do post {post_id}: shares_count={shares_count}")
+        return Response({'shares_count': shares_count, 'id': post_id})
 
     def delete(self, request, post_id):
         return self.post(request, post_id)
 
-class FeedList(APIView):
-    authentication_classes = [TokenAuthentication]
+class FeedList(ReplicaReadMixin, APIView):
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        following_users = request.user.following.all()
-        posts = Post.objects.filter(author__in=following_users).order_by('-created_at')
-        data = [
-            {
-                'id': post.id,
-                'text': post.text,
-                'author': post.author.username,
-                'likes_count': post.likes_count,
-                'reposts_count': post.reposts_count,
-                'comments_count': post.comments_count,
-                'shares_count': post.shares_count,
-                'image': post.image if post.image else '',
-                'created_at': post.created_at.isoformat()
-            }
-            for post in posts
-        ]
+        post_ids, next_cursor, prev_cursor = timeline.read_post_ids(request.user, request)
+        # updated_at muda com os contadores (e com as ações do próprio usuário), e o do
+        # autor com username e avatar embutidos; no modo write-behind os deltas ainda no
+        # buffer também entram no validador. Com o cache ligado vem das linhas em cache;
+        # sem ele, o 304 sai do agregado, sem ler os posts
+        posts = post_rows_by_id(post_ids) if caching.enabled() else None
+        if posts is not None:
+            stamps = modification_stamps(posts)
+        else:
+            stamps = tuple(Post.objects.filter(id__in=post_ids).aggregate(
+                last=Max('updated_at'), authors=Max('author__updated_at'),
+            ).values())
+        modified = max(filter(None, stamps), default=None)
+        etag = make_etag(
+            request.user.id, post_ids, next_cursor, prev_cursor, stamps,
+            sorted(counters.pending_deltas(post_ids).items()),
+        )
+        cached = not_modified(request, etag, modified)
+        if cached is not None:
+            return cached
+        if posts is None:
+            posts = post_rows_by_id(post_ids)
+        if wants_stream(request):
+            chunks = (serialize_posts(rows, viewer=request.user) for rows in chunked(posts))
+            response = streaming_response('posts', chunks, lambda: {'next': next_cursor, 'prev': prev_cursor})
+            return set_validators(response, etag, modified)
+        data = serialize_posts(posts, viewer=request.user)
         logger.debug(f"Feed response: {{'posts': {data}}}")
-        return Response({'posts': data})
+        response = Response({'posts': data, 'next': next_cursor, 'prev': prev_cursor})
+        return set_validators(response, etag, modified)
+
+class BatchMutations(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    throttle_classes = WRITE_THROTTLES
+    throttle_scope = 'batch'
+    parser_classes = [JSONParser]
+
+    def post(self, request):
+        operations = batch.parse(request.data.get('operations') if isinstance(request.data, dict) else request.data)
+        # Cada operação conta nos limites da rota avulsa equivalente, antes de aplicar o lote
+        throttling.charge(request, batch.throttle_costs(operations))
+        results, following_count = batch.apply(request.user, operations)
+        logger.debug(f"Lote de {len(results)} operações aplicado para {request.user.id}")
+        return Response({'results': results, 'following_count': following_count})
 
 class FollowUser(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_classes = WRITE_THROTTLES
+    throttle_scope = 'follow'
 
     def post(self, request, user_id):
         user_to_follow = get_object_or_404(User, id=user_id)
         if user_to_follow != request.user:
-            if request.user.following.filter(id=user_id).exists():
-                request.user.following.remove(user_to_follow)
+            following, following_count = counters.toggle_follow(request.user, user_id)
+            if following:
+                timeline.backfill(request.user, user_to_follow)
             else:
-                request.user.following.add(user_to_follow)
+                timeline.prune(request.user, user_to_follow)
+        else:
+            following_count = User.objects.filter(id=request.user.id).values_list('following_count', flat=True).get()
         logger.debug(f"Follow atualizado: user={request.user.username}, target={user_to_follow.username}")
-        return Response({'status': 'updated', 'following_count': request.user.following.count()})
+        return Response({'status': 'updated', 'following_count': following_count})
 
     def delete(self, request, user_id):
         return self.post(request, user_id)
 
-class UserSuggestions(APIView):
-    authentication_classes = [TokenAuthentication]
+class UserSuggestions(ReplicaReadMixin, APIView):
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [AllowAny]
 
     def get(self, request):
-        users = User.objects.exclude(id=request.user.id).values('id', 'username') if request.user.is_authenticated else User.objects.all().values('id', 'username')[:5]
-        return Response({'suggestions': list(users)})
-
-class Profile(APIView):
-    authentication_classes = [TokenAuthentication]
+        if not request.user.is_authenticated:
+            users = User.objects.all().values('id', 'username')[:5]
+            return Response({'suggestions': list(users)})
+        data, next_cursor, prev_cursor = suggestions.suggestions_page(request.user, request)
+        return Response({'suggestions': data, 'next': next_cursor, 'prev': prev_cursor})
+
+class Profile(ReplicaReadMixin, APIView):
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        user = request.user
-        profile_data = {
-            'username': user.username,
-            'handle': user.username.lower(),
-            'bio': user.bio or '',
-            'location': user.location or '',
-            'profile_picture': user.profile_picture if user.profile_picture else '',
-            'cover_image': user.cover_image if user.cover_image else '',
-            'followers': user.followers_set.count(),
-            'following': user.following.count(),
-            'posts_count': user.posts.count(),
-        }
+        # Relido do banco numa única consulta: request.user pode vir do cache de autenticação.
+        # updated_at também muda com os contadores, então basta como validador.
+        user = profile_rows([request.user.id])[request.user.id]
+        etag = make_etag(request.user.id, user['updated_at'])
+        cached = not_modified(request, etag, user['updated_at'])
+        if cached is not None:
+            return cached
+        profile_data = serialize_profile(user)
         logger.debug(f"Profile response: {profile_data}")
-        return Response(profile_data)
+        return set_validators(Response(profile_data), etag, user['updated_at'])
 
-class ProfilePosts(APIView):
-    authentication_classes = [TokenAuthentication]
+class ProfilePosts(ReplicaReadMixin, APIView):
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        posts = Post.objects.filter(author=request.user).order_by('-created_at')
-        data = [
-            {
-                'id': post.id,
-                'text': post.text,
-                'author': post.author.username,
-                'likes_count': post.likes_count,
-                'reposts_count': post.reposts_count,
-                'comments_count': post.comments_count,
-                'shares_count': post.shares_count,
-                'image': post.image if post.image else '',
-                'created_at': post.created_at.isoformat()
-            }
-            for post in posts
-        ]
-        logger.debug(f"Profile posts response: {{'posts': {data}}}")
-        return Response({'posts': data})
+        return paginated_posts(post_paginator, Post.objects.filter(author=request.user), request)
 
 class LoginView(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = WRITE_THROTTLES
+    throttle_scope = 'login'
 
     def post(self, request):
         logger.debug("Login view acessada, CSRF desativado")
@@ -359,6 +441,8 @@ class LoginView(APIView):
 
 class RegisterView(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = WRITE_THROTTLES
+    throttle_scope = 'register'
 
     def post(self, request):
         logger.debug("Register view acessada, CSRF desativado")
@@ -390,22 +474,39 @@ class RegisterView(APIView):
             logger.error(f"Erro ao criar usuário: {e}")
             return Response({'detail': 'Falha ao criar usuário'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+class EventStreamToken(APIView):
+    """Token de curta duração para abrir /api/events/?token= num EventSource."""
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        return Response({'token': stream_token(request.user), 'expires_in': settings.EVENTS_TOKEN_MAX_AGE})
+
 class LogoutView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        request.user.auth_token.delete()
+        token = request.user.auth_token
+        invalidate_token(token.key)
+        token.delete()
         logout(request)
         logger.debug("Logout bem-sucedido")
         return Response({'status': 'success'})
 
 class ProfileUpdate(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_classes = WRITE_THROTTLES
+    throttle_scope = 'profile_update'
 
     def patch(self, request):
-        user = request.user
+        # request.user pode vir do cache de autenticação (até AUTH_TOKEN_CACHE_TTL): relido do
+        # banco para não devolver contadores e foto já alterados por outros caminhos
+        user = User.objects.get(pk=request.user.pk)
+        # Só os campos alterados aqui são gravados: contadores (UPDATEs atômicos) e a foto
+        # gravada pelo worker de upload não são sobrescritos
+        changed = {'username', 'bio', 'updated_at'}
         try:
             logger.debug(f"Request headers: {dict(request.headers)}")
             logger.debug(f"Content-Type: {request.content_type}")
@@ -437,36 +538,30 @@ class ProfileUpdate(APIView):
                     logger.warning("Senha antiga inválida")
                     return Response({'detail': 'Senha antiga inválida'}, status=status.HTTP_400_BAD_REQUEST)
                 user.set_password(new_password)
+                changed.add('password')
 
-            if profile_picture:
-                name, ext = os.path.splitext(profile_picture.name)
-                sanitized_name = f"{slugify(name)}_{os.urandom(8).hex()}{ext.lower()}"
-                current_timestamp = int(time.time())
-                logger.debug(f"Generated timestamp: {current_timestamp}")
-                if current_timestamp < 1700000000:
-                    return Response({'detail': 'Timestamp inválido'}, status=status.HTTP_400_BAD_REQUEST)
-                cloudinary.config(
-                    cloud_name=os.getenv('CLOUDINARY_CLOUD_NAME'),
-                    api_key=os.getenv('CLOUDINARY_API_KEY'),
-                    api_secret=os.getenv('CLOUDINARY_API_SECRET')
-                )
-                upload_result = cloudinary.uploader.upload(
-                    profile_picture,
-                    folder="profile_pics",
-                    public_id=sanitized_name,
-                    overwrite=True,
-                    timestamp=current_timestamp
-                )
-                user.profile_picture = upload_result['secure_url']
-                logger.debug(f"Profile picture uploaded: url={user.profile_picture}")
+            upload_picture = profile_picture and not remove_profile_picture
+            if upload_picture:
+                user.profile_picture_status = MEDIA_PENDING
+                changed.add('profile_picture_status')
 
             if remove_profile_picture and user.profile_picture:
                 user.profile_picture = None
+                user.profile_picture_variants = {}
+                user.profile_picture_status = MEDIA_READY
+                changed.update(['profile_picture', 'profile_picture_variants', 'profile_picture_status'])
                 logger.info("Profile picture removed")
 
             user.username = username
             user.bio = bio
-            user.save()
+            user.save(update_fields=changed)
+            # O usuário autenticado fica em cache junto do token: descarta a cópia antiga
+            invalidate_user_tokens(user)
+            caching.invalidate('customuser', [user.id])
+            if upload_picture:
+                # Só depois do save, para não sobrescrever a URL gravada pelo worker
+                media.upload_profile_picture(user, profile_picture)
+                logger.debug(f"Profile picture upload enfileirado: user={user.id}")
 
             logger.debug(f"Saved: username={user.username}, profile_picture={user.profile_picture if user.profile_picture else ''}")
 
@@ -476,6 +571,8 @@ class ProfileUpdate(APIView):
                 'bio': user.bio or '',
                 'location': user.location or '',
                 'profile_picture': user.profile_picture if user.profile_picture else '',
+                'profile_picture_status': user.profile_picture_status,
+                'profile_picture_variants': user.profile_picture_variants,
                 'cover_image': user.cover_image if user.cover_image else ''
             })
         except Exception as e:
@@ -0,0 +1,30 @@
+"""
+Configuração do gunicorn para servir zuppi.asgi com workers uvicorn.
+
+Uso: gunicorn zuppi.asgi:application -c zuppi/gunicorn_asgi.py
+
+Cada worker é um event loop: requisições lentas (clientes móveis, uploads, streaming)
+esperam sem ocupar um processo, ao contrário dos workers sync do zuppi.wsgi.
+
+Opcional: o procfile continua no zuppi.wsgi até existir um teste de carga sob ASGI
+(social/loadtest.py contra este servidor). Pendências conhecidas: o WhiteNoise é só
+síncrono, e as views síncronas com ?stream=1 (ProfilePosts, HotPostList) têm a resposta
+inteira em buffer sob ASGI, sem o streaming que têm sob WSGI.
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = 'uvicorn_worker.UvicornWorker'
+# Um event loop por CPU basta; a concorrência vem das conexões por worker
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+# Threads do sync_to_async (ORM, cache, views DRF síncronas) por worker
+os.environ.setdefault('ASGI_THREADS', '16')
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 20
+keepalive = 5
+# Recicla workers periodicamente para conter fragmentação de memória
+max_requests = 2000
+max_requests_jitter = 200
+accesslog = '-'
@@ -1,6 +1,7 @@
 from dotenv import load_dotenv
 load_dotenv()
 import os
+import tempfile
 from pathlib import Path
 try:
     import dj_database_url
@@ -30,6 +31,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'social.metrics.MetricsMiddleware',  # primeiro: mede o tempo de todos os demais
+    'social.routing.RoutingMiddleware',  # antes da sessão: gravá-la também conta como escrita
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -43,14 +46,91 @@ MIDDLEWARE = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'social.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',  # Opcional para admin
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # Proxies reversos à frente da aplicação. Com 0, o IP do throttling é o REMOTE_ADDR e um
+    # X-Forwarded-For enviado pelo cliente é ignorado; atrás do proxy da plataforma, use 1
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 0)),
 }
 
+# Cache token -> usuário da autenticação (social/authentication.py). No cache compartilhado:
+# logout e troca de senha invalidam o token em todos os workers, não só no que atendeu
+AUTH_TOKEN_CACHE = 'shared'
+AUTH_TOKEN_CACHE_TTL = int(os.getenv('AUTH_TOKEN_CACHE_TTL', 60))
+AUTH_TOKEN_NEGATIVE_TTL = int(os.getenv('AUTH_TOKEN_NEGATIVE_TTL', 10))
+
+# Paginação por cursor das listas de posts (limit=N na query string, até o teto)
+POSTS_PAGE_SIZE = int(os.getenv('POSTS_PAGE_SIZE', 20))
+POSTS_MAX_PAGE_SIZE = int(os.getenv('POSTS_MAX_PAGE_SIZE', 100))
+
+# Home timeline materializada: autores acima do limite são mesclados na leitura
+TIMELINE_FANOUT_THRESHOLD = int(os.getenv('TIMELINE_FANOUT_THRESHOLD', 5000))
+TIMELINE_BACKFILL_SIZE = int(os.getenv('TIMELINE_BACKFILL_SIZE', 200))
+
+# Métricas (/metrics, Server-Timing): fração das requisições com contagem de consultas
+METRICS_SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', 1.0 if DEBUG else 0.1))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')  # Bearer exigido no scrape; sem ele, /metrics só em DEBUG
+
+# Rate limiting das escritas (social/throttling.py): token bucket por usuário e por IP.
+# Escopo (throttle_scope da view) -> kind -> (capacidade do balde, tokens repostos por minuto).
+# 'cache' usa incr atômico no cache compartilhado (Redis), valendo para todos os workers.
+# Sem Redis os buckets são 'local': o limite vale por processo, ou seja, o efetivo é a taxa
+# vezes o número de workers. O FileBasedCache não serve: o incr dele não é atômico.
+THROTTLE_ENABLED = os.getenv('THROTTLE_ENABLED', 'true').lower() == 'true'
+THROTTLE_BUCKETS = os.getenv('THROTTLE_BUCKETS', 'cache' if os.getenv('REDIS_URL') else 'local')
+THROTTLE_CACHE = 'shared'
+THROTTLE_RATES = {
+    'post_create': {'user': (10, 20), 'ip': (30, 60)},
+    'post_comment': {'user': (20, 30), 'ip': (60, 120)},
+    'post_toggle': {'user': (60, 120), 'ip': (300, 600)},  # like, repost e share
+    'batch': {'user': (20, 60), 'ip': (100, 300)},
+    'follow': {'user': (30, 60), 'ip': (150, 300)},
+    'profile_update': {'user': (5, 10), 'ip': (20, 40)},
+    'login': {'ip': (10, 10)},
+    'register': {'ip': (5, 5)},
+}
+
+# Lote de mutações (/api/batch/)
+BATCH_MAX_OPERATIONS = 100
+
+# Eventos em tempo real (SSE em /api/events/); RedisBroker entrega entre processos
+EVENTS_BACKEND = os.getenv('EVENTS_BACKEND', 'social.events.LocalBroker')
+EVENTS_REDIS_URL = os.getenv('REDIS_URL')
+EVENTS_QUEUE_SIZE = 100
+EVENTS_HEARTBEAT = 15  # segundos entre comentários de keep-alive
+EVENTS_MAX_AGE = 300  # a conexão é encerrada e o EventSource reconecta (renova os follows)
+EVENTS_MAX_POSTS = 100
+EVENTS_TOKEN_MAX_AGE = 60  # segundos de validade do ?token= do EventSource (/api/events/token/)
+
+# Streaming (?stream=1): linhas lidas e serializadas por lote
+STREAMING_CHUNK_SIZE = 200
+STREAMING_MAX_PAGE_SIZE = 1000
+
+# Feed "hot": segundos de idade que valem 10x de engajamento (alterar exige rebuild_hot_scores)
+HOT_SCORE_DECAY = 45000
+
+# Busca: backend escolhido pelo banco (FTS5 no SQLite, tsvector/GIN no PostgreSQL)
+SEARCH_BACKEND = os.getenv('SEARCH_BACKEND')  # caminho de classe para forçar outro backend
+SEARCH_MAX_TERMS = 8
+
+# Sugestões de usuários pré-calculadas por compute_suggestions
+SUGGESTIONS_TOP_K = int(os.getenv('SUGGESTIONS_TOP_K', 50))
+SUGGESTIONS_ACTIVITY_DAYS = int(os.getenv('SUGGESTIONS_ACTIVITY_DAYS', 7))
+
+# Contadores write-behind: deltas de likes/reposts/shares/comentários acumulam num buffer
+# e são gravados em lote. 'cache' é compartilhado entre workers (leituras veem os deltas de
+# todos) e exige incr atômico: padrão com Redis. Sem Redis, 'local': cada worker guarda e
+# grava os próprios deltas, que se perdem se ele cair antes do flush
+COUNTER_WRITE_BEHIND = os.getenv('COUNTER_WRITE_BEHIND', 'false').lower() == 'true'
+COUNTER_BUFFER = os.getenv('COUNTER_BUFFER', 'cache' if os.getenv('REDIS_URL') else 'local')
+COUNTER_BUFFER_CACHE = 'shared'
+COUNTER_FLUSH_INTERVAL = float(os.getenv('COUNTER_FLUSH_INTERVAL', 2.0))
+COUNTER_FLUSH_THRESHOLD = int(os.getenv('COUNTER_FLUSH_THRESHOLD', 500))
+
 CORS_ALLOW_CREDENTIALS = False  # Desativado, pois usamos TokenAuthentication
 CORS_ALLOWED_ORIGINS = [
     'https://zuppi.vercel.app' if ENVIRONMENT == 'production' else 'http://localhost:5173',
@@ -94,36 +174,103 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'zuppi.wsgi.application'
+ASGI_APPLICATION = 'zuppi.asgi.application'
+# Views de leitura assíncronas (social/async_views.py); zuppi/asgi.py liga por padrão
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'false').lower() == 'true'
 
 if ENVIRONMENT == 'production' and os.getenv('DATABASE_URL'):
     DATABASES = {
         'default': dj_database_url.parse(
             os.getenv('DATABASE_URL'),
-            conn_max_age=600,
+            # Sob ASGI cada requisição usa uma thread do sync_to_async: conexões persistentes não se reaproveitam
+            conn_max_age=0 if ASYNC_READ_VIEWS else 600,
             conn_health_checks=True,
         )
     }
+    # Réplicas de leitura, separadas por vírgula: replica1, replica2...
+    for index, url in enumerate(filter(None, os.getenv('DATABASE_REPLICA_URLS', '').split(',')), start=1):
+        DATABASES[f'replica{index}'] = dj_database_url.parse(
+            url.strip(), conn_max_age=0 if ASYNC_READ_VIEWS else 600, conn_health_checks=True,
+        )
+        # Réplica fora do ar falha rápido: a primeira verificação de saúde roda na requisição
+        DATABASES[f'replica{index}'].setdefault('OPTIONS', {}).setdefault(
+            'connect_timeout', int(os.getenv('DATABASE_REPLICA_CONNECT_TIMEOUT', 2)),
+        )
 else:
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
-        }
+            # BEGIN IMMEDIATE + timeout: escritas concorrentes esperam o lock em vez de falhar
+            'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20},
+            # Banco de teste em arquivo para que os testes com threads compartilhem o mesmo banco
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        },
+        # Segundo SQLite para exercitar o roteamento (sem replicação: copie db.sqlite3 ou rode
+        # migrate --database replica). Só recebe leituras se listado em DATABASE_REPLICAS
+        'replica': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db_replica.sqlite3',
+            'OPTIONS': {'timeout': 20},
+            'TEST': {'NAME': BASE_DIR / 'test_db_replica.sqlite3'},
+        },
     }
 
 if ENVIRONMENT == 'development':
     CACHES = {
         'default': {
             'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
-        }
+        },
+        'shared': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'shared',
+        },
     }
 else:
     CACHES = {
         'default': {
             'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        }
+        },
+        # L2 do cache em dois níveis: Redis quando configurado; senão arquivos locais,
+        # compartilhados entre os workers do mesmo host
+        'shared': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        } if os.getenv('REDIS_URL') else {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR', '/tmp/zuppi-cache'),
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        },
     }
 
+# Cache em dois níveis (social/caching.py) de linhas de post, perfis e páginas do feed:
+# LRU no processo (L1) sobre o cache 'shared' (L2), invalidado por geração após as escritas.
+# Desligado em desenvolvimento, como o cache 'default'.
+CACHE_ENABLED = os.getenv('CACHE_ENABLED', str(ENVIRONMENT != 'development')).lower() == 'true'
+CACHE_L2 = 'shared'
+CACHE_L1_MAX_BYTES = int(os.getenv('CACHE_L1_MAX_BYTES', 32 * 1024 * 1024))
+CACHE_TTL = int(os.getenv('CACHE_TTL', 3600))
+# Segundos em que o L1 memoriza gerações sem consultar o L2. 0: toda leitura confere a
+# geração no L2 (coerência imediata entre workers); >0 troca um round trip por atraso
+CACHE_GENERATION_TTL = float(os.getenv('CACHE_GENERATION_TTL', 0))
+
+# Réplicas de leitura (social/routing.py): GETs das views de leitura vão a uma réplica
+# saudável; quem escreveu lê do primário por DATABASE_STICKY_SECONDS (marca no cache
+# compartilhado). Réplica inacessível, sem as migrations do código ou atrasada além de
+# DATABASE_REPLICA_MAX_LAG sai da rotação até a próxima verificação, a cada
+# DATABASE_REPLICA_CHECK_INTERVAL segundos (em segundo plano, depois da primeira).
+DATABASE_ROUTERS = ['social.routing.ReplicaRouter']
+# Em produção, todas as réplicas de DATABASE_REPLICA_URLS; em desenvolvimento, por exemplo
+# DATABASE_REPLICAS=replica
+DATABASE_REPLICAS = os.getenv('DATABASE_REPLICAS', ','.join(
+    alias for alias in DATABASES if alias != 'default' and ENVIRONMENT == 'production'
+))
+DATABASE_REPLICAS = [alias for alias in DATABASE_REPLICAS.split(',') if alias]
+DATABASE_STICKY_SECONDS = int(os.getenv('DATABASE_STICKY_SECONDS', 10))
+DATABASE_PIN_CACHE = 'shared'
+DATABASE_REPLICA_CHECK_INTERVAL = float(os.getenv('DATABASE_REPLICA_CHECK_INTERVAL', 10))
+DATABASE_REPLICA_MAX_LAG = float(os.getenv('DATABASE_REPLICA_MAX_LAG', 5))
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -146,6 +293,23 @@ CLOUDINARY_STORAGE = {
     'API_SECRET': os.getenv('CLOUDINARY_API_SECRET'),
 }
 DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
+
+# Uploads de imagem fora do request: pool de threads com retry e backoff exponencial.
+# MEDIA_UPLOAD_WORKERS=0 faz o upload no próprio request (testes).
+MEDIA_UPLOAD_BACKEND = os.getenv('MEDIA_UPLOAD_BACKEND', 'social.media.CloudinaryBackend')
+MEDIA_UPLOAD_WORKERS = int(os.getenv('MEDIA_UPLOAD_WORKERS', 4))
+MEDIA_UPLOAD_RETRIES = int(os.getenv('MEDIA_UPLOAD_RETRIES', 3))
+MEDIA_UPLOAD_BACKOFF = float(os.getenv('MEDIA_UPLOAD_BACKOFF', 1.0))
+# Cópias dos envios até o fim do upload; sweep_media retoma as que ficaram para trás
+MEDIA_SPOOL_DIR = os.getenv('MEDIA_SPOOL_DIR', os.path.join(tempfile.gettempdir(), 'zuppi-media-spool'))
+MEDIA_PENDING_TIMEOUT = int(os.getenv('MEDIA_PENDING_TIMEOUT', 900))  # segundos até um pending ser considerado parado
+
+# Variantes geradas para cada imagem enviada (nome -> largura máxima em px)
+IMAGE_VARIANTS = {'thumb': 150, 'feed': 640, 'full': 1600}
+IMAGE_FORMAT = os.getenv('IMAGE_FORMAT', 'WEBP')  # WEBP ou JPEG
+IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', 80))
+IMAGE_MAX_PIXELS = 40_000_000  # recusa entradas maiores (decompression bomb)
+IMAGE_MAX_FULL_DECODE_PIXELS = 12_000_000  # formatos sem decodificação reduzida (~48 MB em RGBA)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 